@@ -0,0 +1,41 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "10_rate_limit_tables"
+down_revision = "9_worker_metrics_table"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "rate_limit_buckets",
+      sa.Column("model", sa.String(128), primary_key=True),
+      sa.Column("tokens", sa.Float, nullable=False),
+      sa.Column("refilled_at", sa.DateTime(timezone=True), nullable=False),
+  )
+
+  op.create_table(
+      "rate_limit_leases",
+      sa.Column("id", sa.Integer, primary_key=True),
+      sa.Column("model", sa.String(128), nullable=False),
+      sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+  )
+
+  op.create_index(
+      "ix_rate_limit_leases_model",
+      "rate_limit_leases",
+      ["model"],
+  )
+  op.create_index(
+      "ix_rate_limit_leases_expires_at",
+      "rate_limit_leases",
+      ["expires_at"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_rate_limit_leases_expires_at", table_name="rate_limit_leases")
+  op.drop_index("ix_rate_limit_leases_model", table_name="rate_limit_leases")
+  op.drop_table("rate_limit_leases")
+  op.drop_table("rate_limit_buckets")
@@ -0,0 +1,24 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "11_campaigns_render_mode"
+down_revision = "10_rate_limit_tables"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # 1 = per ratio, 2 = master + derive (app.models.campaign.RenderMode)
+  op.add_column(
+      "campaigns",
+      sa.Column(
+          "render_mode",
+          sa.Integer,
+          server_default="1",
+          nullable=False,
+      ),
+  )
+
+
+def downgrade():
+  op.drop_column("campaigns", "render_mode")
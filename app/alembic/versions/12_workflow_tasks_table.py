@@ -0,0 +1,63 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "12_workflow_tasks_table"
+down_revision = "11_campaigns_render_mode"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "workflow_tasks",
+      sa.Column("id", sa.Integer, primary_key=True),
+      sa.Column(
+          "workflow_id",
+          sa.Integer,
+          sa.ForeignKey("workflows.id", ondelete="CASCADE"),
+          nullable=False,
+      ),
+      sa.Column(
+          "product_id",
+          sa.Integer,
+          sa.ForeignKey("products.id", ondelete="CASCADE"),
+          nullable=False,
+      ),
+      sa.Column("aspect_ratio", sa.String(16), nullable=False),
+      sa.Column("reason", sa.String(32), nullable=True),
+      sa.Column("status", sa.Integer, nullable=False),
+      sa.Column("attempts", sa.Integer, server_default="0", nullable=False),
+      sa.Column(
+          "asset_id",
+          sa.Integer,
+          sa.ForeignKey("assets.id", ondelete="SET NULL"),
+          nullable=True,
+      ),
+      sa.Column("error_message", sa.String, nullable=True),
+      sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+      sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+      sa.Column(
+          "created_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+      sa.UniqueConstraint("workflow_id", "product_id", "aspect_ratio"),
+  )
+
+  op.create_index(
+      "ix_workflow_tasks_id",
+      "workflow_tasks",
+      ["id"],
+  )
+  op.create_index(
+      "ix_workflow_tasks_workflow_id",
+      "workflow_tasks",
+      ["workflow_id"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_workflow_tasks_workflow_id", table_name="workflow_tasks")
+  op.drop_index("ix_workflow_tasks_id", table_name="workflow_tasks")
+  op.drop_table("workflow_tasks")
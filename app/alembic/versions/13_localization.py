@@ -0,0 +1,40 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "13_localization"
+down_revision = "12_workflow_tasks_table"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "campaigns",
+      sa.Column("target_locales", postgresql.JSONB, nullable=True),
+  )
+  op.add_column(
+      "campaigns",
+      sa.Column("localized_messages_json", postgresql.JSONB, nullable=True),
+  )
+
+  op.create_table(
+      "translation_cache",
+      sa.Column("cache_key", sa.String(64), primary_key=True),
+      sa.Column("message_hash", sa.String(64), nullable=False),
+      sa.Column("language", sa.String(64), nullable=False),
+      sa.Column("translation", sa.Text, nullable=False),
+      sa.Column("model_name", sa.String(255), nullable=True),
+      sa.Column(
+          "created_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+  )
+
+
+def downgrade():
+  op.drop_table("translation_cache")
+  op.drop_column("campaigns", "localized_messages_json")
+  op.drop_column("campaigns", "target_locales")
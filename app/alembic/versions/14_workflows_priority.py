@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "14_workflows_priority"
+down_revision = "13_localization"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # 1 = interactive, 2 = bulk (app.models.workflow.WorkflowPriority)
+  op.add_column(
+      "workflows",
+      sa.Column(
+          "priority",
+          sa.Integer,
+          server_default="2",
+          nullable=False,
+      ),
+  )
+
+  # queued work is claimed by priority, then age
+  op.create_index(
+      "ix_workflows_status_priority_id",
+      "workflows",
+      ["status", "priority", "id"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_workflows_status_priority_id", table_name="workflows")
+  op.drop_column("workflows", "priority")
@@ -0,0 +1,54 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "15_workflows_single_flight"
+down_revision = "14_workflows_priority"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "workflows",
+      sa.Column(
+          "force",
+          sa.Boolean,
+          server_default=sa.false(),
+          nullable=False,
+      ),
+  )
+
+  # duplicate in-flight workflows of a campaign (double POSTs, runs left
+  # RUNNING by a crashed process) would fail the index below: all but the
+  # newest are marked FAILED (4)
+  op.execute(
+      """
+      UPDATE workflows
+      SET status = 4,
+          finished_at = now(),
+          error_message = 'Superseded by a newer workflow of the campaign',
+          lease_owner = NULL,
+          lease_expires_at = NULL
+      WHERE status IN (1, 2)
+        AND NOT force
+        AND id NOT IN (
+          SELECT max(id) FROM workflows
+          WHERE status IN (1, 2) AND NOT force
+          GROUP BY campaign_id
+        )
+      """
+  )
+
+  # at most one queued (1) or running (2) non-forced workflow per campaign
+  op.create_index(
+      "uq_workflows_campaign_in_flight",
+      "workflows",
+      ["campaign_id"],
+      unique=True,
+      postgresql_where=sa.text("status IN (1, 2) AND NOT force"),
+  )
+
+
+def downgrade():
+  op.drop_index("uq_workflows_campaign_in_flight", table_name="workflows")
+  op.drop_column("workflows", "force")
@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "16_workflows_stage_timings"
+down_revision = "15_workflows_single_flight"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "workflows",
+      sa.Column("stage_timings_json", postgresql.JSONB, nullable=True),
+  )
+
+
+def downgrade():
+  op.drop_column("workflows", "stage_timings_json")
@@ -0,0 +1,53 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "17_workflow_batches"
+down_revision = "16_workflows_stage_timings"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "workflow_batches",
+      sa.Column("id", sa.Integer, primary_key=True),
+      sa.Column(
+          "brand_id",
+          sa.Integer,
+          sa.ForeignKey("brands.id", ondelete="SET NULL"),
+          nullable=True,
+      ),
+      sa.Column("priority", sa.Integer, nullable=False),
+      sa.Column(
+          "created_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+  )
+  op.create_index(
+      "ix_workflow_batches_id",
+      "workflow_batches",
+      ["id"],
+  )
+
+  op.add_column(
+      "workflows",
+      sa.Column(
+          "batch_id",
+          sa.Integer,
+          sa.ForeignKey("workflow_batches.id", ondelete="SET NULL"),
+          nullable=True,
+      ),
+  )
+  op.create_index(
+      "ix_workflows_batch_id",
+      "workflows",
+      ["batch_id"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_workflows_batch_id", table_name="workflows")
+  op.drop_column("workflows", "batch_id")
+  op.drop_table("workflow_batches")
@@ -0,0 +1,60 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "18_render_profiles"
+down_revision = "17_workflow_batches"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "render_profiles",
+      sa.Column("id", sa.Integer, primary_key=True),
+      sa.Column("name", sa.String(255), nullable=False),
+      sa.Column("outputs_json", postgresql.JSONB, nullable=False),
+      # 1 = png, 2 = jpeg, 3 = webp (app.models.render_profile.OutputFormat)
+      sa.Column("output_format", sa.Integer, server_default="1", nullable=False),
+      sa.Column(
+          "created_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+      sa.Column(
+          "updated_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+  )
+  op.create_index(
+      "ix_render_profiles_id",
+      "render_profiles",
+      ["id"],
+  )
+
+  for table in ("brands", "campaigns"):
+    op.add_column(
+        table,
+        sa.Column(
+            "render_profile_id",
+            sa.Integer,
+            sa.ForeignKey("render_profiles.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        f"ix_{table}_render_profile_id",
+        table,
+        ["render_profile_id"],
+    )
+
+
+def downgrade():
+  for table in ("campaigns", "brands"):
+    op.drop_index(f"ix_{table}_render_profile_id", table_name=table)
+    op.drop_column(table, "render_profile_id")
+  op.drop_index("ix_render_profiles_id", table_name="render_profiles")
+  op.drop_table("render_profiles")
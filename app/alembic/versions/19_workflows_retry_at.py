@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "19_workflows_retry_at"
+down_revision = "18_render_profiles"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  # workflow_tasks.status gains 5 = deferred (open circuit breaker); the
+  # workflow is queued again with retry_at set
+  op.add_column(
+      "workflows",
+      sa.Column("retry_at", sa.DateTime(timezone=True), nullable=True),
+  )
+
+
+def downgrade():
+  op.drop_column("workflows", "retry_at")
@@ -0,0 +1,28 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20_render_profile_encoding"
+down_revision = "19_workflows_retry_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "render_profiles",
+      sa.Column("quality", sa.Integer, nullable=True),
+  )
+  op.add_column(
+      "render_profiles",
+      sa.Column("compression_level", sa.Integer, nullable=True),
+  )
+  op.add_column(
+      "render_profiles",
+      sa.Column("strip_metadata", sa.Boolean, server_default="true", nullable=False),
+  )
+
+
+def downgrade():
+  op.drop_column("render_profiles", "strip_metadata")
+  op.drop_column("render_profiles", "compression_level")
+  op.drop_column("render_profiles", "quality")
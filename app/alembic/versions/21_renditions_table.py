@@ -0,0 +1,42 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "21_renditions_table"
+down_revision = "20_render_profile_encoding"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "renditions",
+      sa.Column("id", sa.Integer, primary_key=True),
+      sa.Column(
+          "asset_id",
+          sa.Integer,
+          sa.ForeignKey("assets.id", ondelete="CASCADE"),
+          nullable=False,
+      ),
+      sa.Column("name", sa.String(32), nullable=False),
+      # app.models.render_profile.OutputFormat
+      sa.Column("output_format", sa.Integer, nullable=False),
+      sa.Column("width", sa.Integer, nullable=False),
+      sa.Column("height", sa.Integer, nullable=False),
+      sa.Column("size_bytes", sa.Integer, nullable=False),
+      sa.Column("s3_key", sa.String(255), nullable=False),
+      sa.Column(
+          "created_at",
+          sa.DateTime(timezone=True),
+          server_default=sa.func.now(),
+          nullable=False,
+      ),
+      sa.UniqueConstraint("asset_id", "name", "output_format", name="uq_renditions_asset_name_format"),
+  )
+  op.create_index("ix_renditions_id", "renditions", ["id"])
+  op.create_index("ix_renditions_asset_id", "renditions", ["asset_id"])
+
+
+def downgrade():
+  op.drop_index("ix_renditions_asset_id", table_name="renditions")
+  op.drop_index("ix_renditions_id", table_name="renditions")
+  op.drop_table("renditions")
@@ -0,0 +1,33 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "22_asset_image_hash"
+down_revision = "21_renditions_table"
+branch_labels = None
+depends_on = None
+
+BANDS = 4
+
+
+def upgrade():
+  op.add_column(
+      "assets",
+      sa.Column("image_hash", sa.BigInteger, nullable=True),
+  )
+  for band in range(BANDS):
+    op.add_column(
+        "assets",
+        sa.Column(f"image_hash_band_{band}", sa.Integer, nullable=True),
+    )
+    op.create_index(
+        f"ix_assets_image_hash_band_{band}",
+        "assets",
+        [f"image_hash_band_{band}"],
+    )
+
+
+def downgrade():
+  for band in reversed(range(BANDS)):
+    op.drop_index(f"ix_assets_image_hash_band_{band}", table_name="assets")
+    op.drop_column("assets", f"image_hash_band_{band}")
+  op.drop_column("assets", "image_hash")
@@ -0,0 +1,46 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "23_workflow_batch_members"
+down_revision = "22_asset_image_hash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "workflow_batch_members",
+      sa.Column(
+          "batch_id",
+          sa.Integer,
+          sa.ForeignKey("workflow_batches.id", ondelete="CASCADE"),
+          nullable=False,
+      ),
+      sa.Column(
+          "workflow_id",
+          sa.Integer,
+          sa.ForeignKey("workflows.id", ondelete="CASCADE"),
+          nullable=False,
+      ),
+      sa.PrimaryKeyConstraint("batch_id", "workflow_id",
+                              name="pk_workflow_batch_members"),
+  )
+  op.create_index(
+      "ix_workflow_batch_members_workflow_id",
+      "workflow_batch_members",
+      ["workflow_id"],
+  )
+
+  # members so far: the workflows each batch runs
+  op.execute(
+      """
+      INSERT INTO workflow_batch_members (batch_id, workflow_id)
+      SELECT batch_id, id FROM workflows WHERE batch_id IS NOT NULL
+      """
+  )
+
+
+def downgrade():
+  op.drop_index("ix_workflow_batch_members_workflow_id",
+                table_name="workflow_batch_members")
+  op.drop_table("workflow_batch_members")
@@ -0,0 +1,40 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "7_workflows_lease_columns"
+down_revision = "6_workflows_table"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "workflows",
+      sa.Column("attempts", sa.Integer, server_default="0", nullable=False),
+  )
+  op.add_column(
+      "workflows",
+      sa.Column("lease_owner", sa.String(255), nullable=True),
+  )
+  op.add_column(
+      "workflows",
+      sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True),
+  )
+  op.add_column(
+      "workflows",
+      sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+  )
+
+  op.create_index(
+      "ix_workflows_lease_expires_at",
+      "workflows",
+      ["lease_expires_at"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_workflows_lease_expires_at", table_name="workflows")
+  op.drop_column("workflows", "heartbeat_at")
+  op.drop_column("workflows", "lease_expires_at")
+  op.drop_column("workflows", "lease_owner")
+  op.drop_column("workflows", "attempts")
@@ -0,0 +1,35 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "8_generation_cache"
+down_revision = "7_workflows_lease_columns"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.add_column(
+      "assets",
+      sa.Column("cache_key", sa.String(64), nullable=True),
+  )
+  op.create_index(
+      "ix_assets_cache_key",
+      "assets",
+      ["cache_key"],
+  )
+
+  op.add_column(
+      "workflows",
+      sa.Column(
+          "bypass_cache",
+          sa.Boolean,
+          server_default=sa.false(),
+          nullable=False,
+      ),
+  )
+
+
+def downgrade():
+  op.drop_column("workflows", "bypass_cache")
+  op.drop_index("ix_assets_cache_key", table_name="assets")
+  op.drop_column("assets", "cache_key")
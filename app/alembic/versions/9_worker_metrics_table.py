@@ -0,0 +1,28 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "9_worker_metrics_table"
+down_revision = "8_generation_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+  op.create_table(
+      "worker_metrics",
+      sa.Column("worker_id", sa.String(255), primary_key=True),
+      sa.Column("metrics_json", postgresql.JSONB, nullable=False),
+      sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+  )
+
+  op.create_index(
+      "ix_worker_metrics_updated_at",
+      "worker_metrics",
+      ["updated_at"],
+  )
+
+
+def downgrade():
+  op.drop_index("ix_worker_metrics_updated_at", table_name="worker_metrics")
+  op.drop_table("worker_metrics")
@@ -1,21 +1,90 @@
 import base64
 import binascii
-from fastapi import APIRouter, HTTPException, status
+from typing import List, Literal, Optional, Sequence, Tuple
+from fastapi import APIRouter, HTTPException, Query, status
+from app.core.config import settings
 from app.models.asset import Asset, AssetSource, AssetType
-from app.schemas.asset import AssetMetadata, AssetUploadRequest
-from app.services.storage import generate_presigned_url, upload_bytes, get_object_key
+from app.models.campaign import Campaign
+from app.models.product import Product
+from app.models.render_profile import OutputFormat
+from app.models.rendition import Rendition
+from app.schemas.asset import (
+    AssetMetadata,
+    AssetUploadRequest,
+    RenditionMetadata,
+    SimilarAsset,
+    SimilarAssetsResponse,
+    SimilarityCheckRequest,
+)
+from app.services.encoding import EXTENSIONS, encode, hash_image
+from app.services.image_hash import hash_columns, to_unsigned
+from app.services.image_probe import ImageInfo, normalize_content_type, probe_image
+from app.services.render_profiles import resolve_render_profile
+from app.services.renditions import make_renditions, rendition_rows, renditions_by_asset, select_rendition
+from app.services.similarity import SimilarMatch, find_similar
+from app.services.storage import download_fileobj, generate_presigned_url, upload_bytes, get_object_key, get_reference_key
 from app.core.db import DbSession
 
 router = APIRouter()
 
+RENDITION_QUERY = Query(None, description='Rendition to serve: "thumbnail", "preview" or "full".')
+FORMAT_QUERY = Query(
+    None,
+    alias="format",
+    description="Format of the rendition to serve (PNG, JPEG, WEBP, AVIF); defaults to the original's.",
+)
 
-@router.post("", response_model=AssetMetadata, status_code=status.HTTP_201_CREATED)
-def upload_asset(
-    payload: AssetUploadRequest,
-    db: DbSession,
+
+def check_rendition_request(rendition: Optional[str], output_format: Optional[str]) -> Optional[str]:
+  # the requested format, upper-cased
+  if rendition is not None and rendition not in settings.RENDITION_SIZES:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Unknown rendition {rendition}; one of {', '.join(settings.RENDITION_SIZES)}",
+    )
+  if output_format is None:
+    return None
+  if output_format.upper() not in OutputFormat.__members__:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Unknown format {output_format}; one of {', '.join(OutputFormat.__members__)}",
+    )
+  return output_format.upper()
+
+
+def asset_metadata(
+    asset: Asset,
+    renditions: Sequence[Rendition],
+    rendition: Optional[str] = None,
+    output_format: Optional[str] = None,
 ) -> AssetMetadata:
-  base64_str = payload.image_base64
+  '''
+  The asset with s3_url pointing at the requested rendition, or at the
+  original when none was requested or the asset has no such rendition.
+  '''
+  selected = None
+  if rendition is not None or output_format is not None:
+    selected = select_rendition(renditions, str(asset.s3_key), rendition, output_format)
+  return AssetMetadata(
+      id=asset.id,
+      aspect_ratio=asset.aspect_ratio,
+      s3_url=generate_presigned_url(selected.s3_key if selected is not None else str(asset.s3_key)),
+      rendition=selected.name if selected is not None else None,
+      renditions=[
+          RenditionMetadata(
+              name=row.name,
+              format=OutputFormat(row.output_format).name,
+              width=row.width,
+              height=row.height,
+              size_bytes=row.size_bytes,
+              s3_url=generate_presigned_url(row.s3_key),
+          )
+          for row in renditions
+      ],
+  )
+
 
+def _decode_image(base64_str: str) -> Tuple[bytes, ImageInfo]:
   # Support optional data URL prefix ("data:image/png;base64,...")
   if "," in base64_str:
     base64_str = base64_str.split(",", 1)[1]
@@ -35,52 +104,157 @@ def upload_asset(
         detail="Image data is empty (0 bytes after base64 decode)",
     )
 
-  # s3 object key
-  # note, this method assumes .png
-  key = get_object_key(payload.campaign_id, payload.product_id, payload.aspect_ratio)
+  # header checks only, before any pixel is decoded
+  info = probe_image(image_bytes)
+  if info is None:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Image data is not a PNG, JPEG or WebP image",
+    )
+  return image_bytes, info
+
+
+def _hash_image(content: bytes) -> int:
+  try:
+    return hash_image(content)
+  except (OSError, ValueError):
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Image data is not a readable image",
+    )
+
+
+def _similar_response(image_hash: int, max_distance: int, matches: Sequence[SimilarMatch]) -> SimilarAssetsResponse:
+  return SimilarAssetsResponse(
+      image_hash=f"{image_hash:016x}",
+      max_distance=max_distance,
+      items=[
+          SimilarAsset(
+              id=match.asset.id,
+              campaign_id=match.asset.campaign_id,
+              product_id=match.asset.product_id,
+              type=AssetType(match.asset.type).name,
+              aspect_ratio=match.asset.aspect_ratio,
+              distance=match.distance,
+              s3_url=generate_presigned_url(match.asset.s3_key),
+          )
+          for match in matches
+      ],
+  )
+
+
+@router.post("", response_model=AssetMetadata, status_code=status.HTTP_201_CREATED)
+def upload_asset(
+    payload: AssetUploadRequest,
+    db: DbSession,
+) -> AssetMetadata:
+  image_bytes, info = _decode_image(payload.image_base64)
+  if payload.content_type and normalize_content_type(payload.content_type) != info.content_type:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Image data is {info.content_type}, not {payload.content_type}",
+    )
+
+  campaign = db.get(Campaign, payload.campaign_id)
+  if campaign is None:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Campaign {payload.campaign_id} not found",
+    )
+
+  asset_type = AssetType[payload.type]
+  if asset_type == AssetType.PRODUCT:
+    if db.get(Product, payload.product_id) is None:
+      raise HTTPException(
+          status_code=status.HTTP_404_NOT_FOUND,
+          detail=f"Product {payload.product_id} not found",
+      )
+    # product photos are kept as uploaded, renders get a prepared copy
+    # (app/services/references.py)
+    content, content_type, width, height = image_bytes, info.content_type, info.width, info.height
+    image_hash = _hash_image(image_bytes)
+    key = get_reference_key(payload.product_id, EXTENSIONS[info.format])
+  else:
+    # stored like the campaign's generated creatives: re-encoded with its
+    # render profile's format and encoder settings, at the uploaded size
+    profile = resolve_render_profile(campaign)
+    try:
+      encoded = encode(image_bytes, None, profile.encoding)
+    except (OSError, ValueError):
+      raise HTTPException(
+          status_code=status.HTTP_400_BAD_REQUEST,
+          detail="Image data is not a readable image",
+      )
+    content, content_type, width, height = encoded.content, encoded.content_type, encoded.width, encoded.height
+    image_hash = encoded.image_hash
+    key = get_object_key(payload.campaign_id, payload.product_id, payload.aspect_ratio, profile.extension)
+
+  if settings.UPLOAD_DEDUPE_MAX_DISTANCE >= 0 and not payload.allow_duplicate:
+    # before the upload, a duplicate costs neither storage nor review time;
+    # product photos are per product, creatives per campaign and product
+    duplicates = find_similar(
+        db,
+        image_hash,
+        settings.UPLOAD_DEDUPE_MAX_DISTANCE,
+        settings.SIMILAR_MAX_RESULTS,
+        campaign_id=payload.campaign_id if asset_type == AssetType.CREATIVE else None,
+        product_id=payload.product_id,
+        asset_type=int(asset_type),
+    )
+    if duplicates:
+      raise HTTPException(
+          status_code=status.HTTP_409_CONFLICT,
+          detail={
+              "message": "Image is a near duplicate of existing assets; set allow_duplicate to store it anyway",
+              "duplicates": [{"id": match.asset.id, "distance": match.distance} for match in duplicates],
+          },
+      )
 
   try:
     uploaded_key = upload_bytes(
-        data=image_bytes,
+        data=content,
         key=key,
-        content_type=payload.content_type or "application/octet-stream",
+        content_type=content_type,
     )
   except Exception as exc:
     raise HTTPException(
         status_code=status.HTTP_502_BAD_GATEWAY,
         detail=f"Failed to upload asset to storage: {exc}",
     )
+  # product photos are only ever sent to the image model
+  renditions = make_renditions(content, uploaded_key, content_type) if asset_type == AssetType.CREATIVE else []
 
   asset = Asset(
       campaign_id=payload.campaign_id,
       product_id=payload.product_id,
-      type=int(AssetType.CREATIVE),
+      type=int(asset_type),
       aspect_ratio=payload.aspect_ratio,
-      width=None,
-      height=None,
+      width=width,
+      height=height,
       s3_key=uploaded_key,
       source=int(AssetSource.UPLOADED),
       gen_metadata_json=None,
+      **hash_columns(image_hash),
   )
 
   db.add(asset)
+  db.flush()
+  rows: List[Rendition] = rendition_rows(asset.id, renditions)
+  db.add_all(rows)
   db.commit()
   db.refresh(asset)
 
-  s3_url = generate_presigned_url(str(asset.s3_key))
-
-  return AssetMetadata(
-      id=asset.id,
-      aspect_ratio=asset.aspect_ratio,
-      s3_url=s3_url,
-  )
+  return asset_metadata(asset, rows)
 
 
 @router.get("/{asset_id}", response_model=AssetMetadata)
 def get_asset(
     asset_id: int,
     db: DbSession,
+    rendition: Optional[str] = RENDITION_QUERY,
+    output_format: Optional[str] = FORMAT_QUERY,
 ) -> AssetMetadata:
+  output_format = check_rendition_request(rendition, output_format)
   asset: Asset | None = db.query(Asset).filter(Asset.id == asset_id).first()
   if not asset:
     raise HTTPException(
@@ -88,10 +262,70 @@ def get_asset(
         detail=f"Asset {asset_id} not found",
     )
 
-  s3_url = generate_presigned_url(str(asset.s3_key))
+  return asset_metadata(asset, renditions_by_asset(db, [asset.id])[asset.id], rendition, output_format)
 
-  return AssetMetadata(
-      id=asset.id,
-      aspect_ratio=asset.aspect_ratio,
-      s3_url=s3_url,
+
+@router.post("/similar", response_model=SimilarAssetsResponse)
+def check_similar(
+    payload: SimilarityCheckRequest,
+    db: DbSession,
+) -> SimilarAssetsResponse:
+  '''
+  Pre-upload check: assets near the given image, nothing is stored.
+  '''
+  image_bytes, _ = _decode_image(payload.image_base64)
+  image_hash = _hash_image(image_bytes)
+  max_distance = settings.SIMILAR_MAX_DISTANCE if payload.max_distance is None else payload.max_distance
+  matches = find_similar(
+      db,
+      image_hash,
+      max_distance,
+      settings.SIMILAR_MAX_RESULTS,
+      campaign_id=payload.campaign_id,
+      product_id=payload.product_id,
+      asset_type=int(AssetType[payload.type]) if payload.type else None,
+  )
+  return _similar_response(image_hash, max_distance, matches)
+
+
+@router.get("/{asset_id}/similar", response_model=SimilarAssetsResponse)
+def get_similar_assets(
+    asset_id: int,
+    db: DbSession,
+    max_distance: Optional[int] = Query(None, ge=0, le=32, description="Most bits the hashes may differ in."),
+    scope: Literal["campaign", "product", "all"] = Query(
+        "campaign", description="Compare with the asset's campaign, its product (any campaign) or every asset."
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+) -> SimilarAssetsResponse:
+  asset: Asset | None = db.get(Asset, asset_id)
+  if not asset:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Asset {asset_id} not found",
+    )
+
+  if asset.image_hash is None:
+    # created before assets were hashed: hash it now, once
+    original = download_fileobj(str(asset.s3_key))
+    if original is None:
+      raise HTTPException(
+          status_code=status.HTTP_404_NOT_FOUND,
+          detail=f"Image of asset {asset_id} not found in storage",
+      )
+    for column, value in hash_columns(_hash_image(original.getvalue())).items():
+      setattr(asset, column, value)
+    db.commit()
+
+  image_hash = to_unsigned(asset.image_hash)
+  max_distance = settings.SIMILAR_MAX_DISTANCE if max_distance is None else max_distance
+  matches = find_similar(
+      db,
+      image_hash,
+      max_distance,
+      limit or settings.SIMILAR_MAX_RESULTS,
+      campaign_id=asset.campaign_id if scope == "campaign" else None,
+      product_id=asset.product_id if scope == "product" else None,
+      exclude_id=asset.id,
   )
+  return _similar_response(image_hash, max_distance, matches)
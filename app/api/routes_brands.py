@@ -1,7 +1,9 @@
 from typing import List
 from fastapi import APIRouter, HTTPException, status
 from app.models.brand import Brand
+from app.models.render_profile import RenderProfile
 from app.schemas.brand import BrandCreate, BrandResponse
+from app.schemas.render_profile import RenderProfileAssignment
 from app.core.db import DbSession
 
 router = APIRouter()
@@ -11,11 +13,18 @@ def create_brand(
     payload: BrandCreate,
     db: DbSession,
 ) -> BrandResponse:
+  if payload.render_profile_id is not None and db.get(RenderProfile, payload.render_profile_id) is None:
+      raise HTTPException(
+          status_code=status.HTTP_404_NOT_FOUND,
+          detail=f"Render profile {payload.render_profile_id} not found",
+      )
+
   brand = Brand(name=payload.name,
                 primary_color_hex=payload.primary_color_hex,
                 secondary_color_hex=payload.secondary_color_hex,
                 tone_of_voice=payload.tone_of_voice,
-                font_family=payload.font_family)
+                font_family=payload.font_family,
+                render_profile_id=payload.render_profile_id)
 
   try:
       db.add(brand)
@@ -48,3 +57,40 @@ def get_brand(
           detail=f"Brand with id {brand_id} not found",
       )
   return brand
+
+
+@router.put("/{brand_id}/render-profile", response_model=BrandResponse)
+def set_brand_render_profile(
+    brand_id: int,
+    payload: RenderProfileAssignment,
+    db: DbSession,
+) -> BrandResponse:
+  brand = db.query(Brand).filter(Brand.id == brand_id).first()
+  if brand is None:
+      raise HTTPException(
+          status_code=status.HTTP_404_NOT_FOUND,
+          detail=f"Brand with id {brand_id} not found",
+      )
+  if payload.render_profile_id is not None and db.get(RenderProfile, payload.render_profile_id) is None:
+      raise HTTPException(
+          status_code=status.HTTP_404_NOT_FOUND,
+          detail=f"Render profile {payload.render_profile_id} not found",
+      )
+
+  try:
+      # keeps updated_at: a newer brand marks all of its creatives stale,
+      # only those at sizes the new profile doesn't list need regenerating
+      db.query(Brand).filter(Brand.id == brand_id).update(
+          {
+              Brand.render_profile_id: payload.render_profile_id,
+              Brand.updated_at: Brand.updated_at,
+          },
+          synchronize_session=False,
+      )
+      db.commit()
+      db.refresh(brand)
+  except Exception:
+      db.rollback()
+      raise
+
+  return brand
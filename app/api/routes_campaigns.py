@@ -1,29 +1,66 @@
-from typing import List
+from typing import Iterable, List, Optional
 from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 from app.models.brand import Brand
-from app.models.campaign import Campaign
+from app.models.campaign import Campaign, RenderMode
 from app.models.campaign_product import CampaignProduct
 from app.models.asset import Asset
 from app.models.product import Product
-from app.models.workflow import Workflow, WorkflowStatus
+from app.models.render_profile import RenderProfile
+from app.models.workflow import WorkflowPriority
 from app.schemas.campaign import (
+    BatchGenerateRequest,
+    BatchGenerateResponse,
+    BatchWorkflow,
     CampaignBrief,
     CampaignResponse,
+    GenerateRequest,
     GenerateResponse,
     AssetMetadata,
     CampaignDetail,
-    CampaignProductResponse
+    CampaignProductResponse,
+    GenerationPlanResponse,
+    PlannedTaskResponse,
 )
-from app.services.storage import generate_presigned_url
-from app.services.workflows import run_campaign_generation
+from app.schemas.render_profile import RenderProfileAssignment
+from app.api.routes_assets import FORMAT_QUERY, RENDITION_QUERY, asset_metadata, check_rendition_request
 from app.services.download import create_zip
+from app.services.job_queue import enqueue_batch, enqueue_generation
+from app.services.planning import plan_campaign_generation
+from app.services.renditions import renditions_by_asset
+from app.services.render_profiles import resolve_render_profile
+from app.services.scheduling import default_priority
+from app.core.config import settings
 from app.core.db import DbSession
 
 router = APIRouter()
 
 
+def _estimated_tasks(db: DbSession, campaigns: Iterable[Campaign]) -> int:
+  # products x render profile ratios, for the default priority
+  campaigns = list(campaigns)
+  product_counts = dict(
+      db.query(CampaignProduct.campaign_id, func.count())
+      .filter(CampaignProduct.campaign_id.in_([campaign.id for campaign in campaigns]))
+      .group_by(CampaignProduct.campaign_id)
+      .all()
+  )
+  return sum(
+      product_counts.get(campaign.id, 0) * len(resolve_render_profile(campaign).outputs)
+      for campaign in campaigns
+  )
+
+
+def _check_render_profile(db: DbSession, render_profile_id: int | None) -> None:
+  if render_profile_id is not None and db.get(RenderProfile, render_profile_id) is None:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Render profile {render_profile_id} not found",
+    )
+
+
 @router.post("", response_model=CampaignResponse, status_code=status.HTTP_201_CREATED)
 def create_campaign(
     payload: CampaignBrief,
@@ -35,6 +72,7 @@ def create_campaign(
         status_code=status.HTTP_404_BAD_REQUEST,
         detail=f"Brand {payload.brand_id} does not exist",
     )
+  _check_render_profile(db, payload.render_profile_id)
   
   # make this a transaction
   try:
@@ -43,8 +81,11 @@ def create_campaign(
         brand_id=payload.brand_id,
         name=payload.name,
         target_region=payload.target_region,
+        target_locales=payload.target_locales,
         target_audience=payload.target_audience,
         campaign_message=payload.campaign_message,
+        render_mode=RenderMode[payload.render_mode],
+        render_profile_id=payload.render_profile_id,
     )
     db.add(campaign)
     db.flush()
@@ -79,9 +120,11 @@ def create_campaign(
 @router.post("/{campaign_id}/generate", response_model=GenerateResponse)
 def generate_campaign_assets(
     campaign_id: int,
-    background_tasks: BackgroundTasks,
     db: DbSession,
+    payload: GenerateRequest | None = None,
 ) -> GenerateResponse:
+    payload = payload or GenerateRequest()
+
     campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
     if not campaign:
         raise HTTPException(
@@ -89,29 +132,183 @@ def generate_campaign_assets(
             detail=f"Campaign {campaign_id} not found",
         )
 
-    workflow_run = Workflow(
-        campaign_id=campaign.id,
-        status=WorkflowStatus.STARTED,
-    )
+    if payload.priority is not None:
+      priority = WorkflowPriority[payload.priority]
+    else:
+      priority = default_priority(_estimated_tasks(db, [campaign]))
+
+    # enqueue only, a worker process (python -m app.worker) claims
+    # STARTED workflows and runs the generation
+    try:
+        workflow_run, attached = enqueue_generation(
+            db,
+            campaign_id=campaign.id,
+            # a forced regeneration wants new images, not cache hits
+            bypass_cache=payload.bypass_cache or payload.force,
+            priority=priority,
+            force=payload.force,
+        )
+    except Exception:
+        db.rollback()
+        raise
+
+    return GenerateResponse(workflow_run_id=workflow_run.id, attached=attached)
+
+
+@router.post("/generate", response_model=BatchGenerateResponse)
+def generate_campaigns(
+    payload: BatchGenerateRequest,
+    db: DbSession,
+) -> BatchGenerateResponse:
+    '''
+    Enqueue generation of many campaigns as one batch. Each campaign gets
+    its own workflow (single-flight as for one campaign); workers claim the
+    batch's workflows together and run them through one pipeline.
+    Progress: GET /workflows/batches/{batch_id}.
+    '''
+    if (payload.campaign_ids is None) == (payload.brand_id is None):
+      raise HTTPException(
+          status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+          detail="Give either campaign_ids or brand_id",
+      )
+
+    if payload.brand_id is not None:
+      if db.get(Brand, payload.brand_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Brand {payload.brand_id} not found",
+        )
+      campaign_ids = [
+          campaign_id
+          for (campaign_id,) in db.query(Campaign.id).filter(Campaign.brand_id == payload.brand_id)
+      ]
+    else:
+      campaign_ids = sorted(set(payload.campaign_ids))
+      found = {
+          campaign_id
+          for (campaign_id,) in db.query(Campaign.id).filter(Campaign.id.in_(campaign_ids))
+      }
+      missing = [campaign_id for campaign_id in campaign_ids if campaign_id not in found]
+      if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Campaigns {missing} not found",
+        )
+
+    if not campaign_ids:
+      raise HTTPException(
+          status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+          detail="No campaigns to generate",
+      )
+    if len(campaign_ids) > settings.BATCH_MAX_CAMPAIGNS:
+      raise HTTPException(
+          status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+          detail=f"At most {settings.BATCH_MAX_CAMPAIGNS} campaigns per batch",
+      )
+
+    if payload.priority is not None:
+      priority = WorkflowPriority[payload.priority]
+    else:
+      priority = default_priority(
+          _estimated_tasks(db, db.query(Campaign).filter(Campaign.id.in_(campaign_ids)))
+      )
 
     try:
-        db.add(workflow_run)
-        db.commit()
-        db.refresh(workflow_run)
+        batch, enqueued = enqueue_batch(
+            db,
+            campaign_ids=campaign_ids,
+            # a forced regeneration wants new images, not cache hits
+            bypass_cache=payload.bypass_cache or payload.force,
+            priority=priority,
+            force=payload.force,
+            brand_id=payload.brand_id,
+        )
     except Exception:
         db.rollback()
         raise
 
-    background_tasks.add_task(run_campaign_generation, workflow_run.id, campaign_id)
+    return BatchGenerateResponse(
+        batch_id=batch.id,
+        workflows=[
+            BatchWorkflow(
+                campaign_id=workflow.campaign_id,
+                workflow_run_id=workflow.id,
+                attached=attached,
+            )
+            for workflow, attached in enqueued
+        ],
+    )
 
-    return GenerateResponse(workflow_run_id=workflow_run.id)
+
+@router.get("/{campaign_id}/plan", response_model=GenerationPlanResponse)
+def get_generation_plan(
+    campaign_id: int,
+    db: DbSession,
+    force: bool = False,
+) -> GenerationPlanResponse:
+  campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+  if not campaign:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Campaign {campaign_id} not found",
+    )
+
+  plan = plan_campaign_generation(db, campaign, force=force)
+
+  return GenerationPlanResponse(
+      campaign_id=plan.campaign_id,
+      render_profile_id=plan.profile.profile_id,
+      aspect_ratios=plan.aspect_ratios,
+      up_to_date=plan.up_to_date,
+      tasks=[
+          PlannedTaskResponse(
+              product_id=task.product.id,
+              product_name=task.product.name,
+              aspect_ratio=task.aspect_ratio,
+              reason=task.reason.value,
+          )
+          for task in plan.tasks
+      ],
+  )
+
+
+@router.put("/{campaign_id}/render-profile", response_model=GenerationPlanResponse)
+def set_campaign_render_profile(
+    campaign_id: int,
+    payload: RenderProfileAssignment,
+    db: DbSession,
+) -> GenerationPlanResponse:
+  '''
+  Attach a render profile to the campaign (null: use the brand's). Returns
+  the generation plan under the new profile.
+  '''
+  campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+  if not campaign:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Campaign {campaign_id} not found",
+    )
+  _check_render_profile(db, payload.render_profile_id)
+
+  try:
+    campaign.render_profile_id = payload.render_profile_id
+    db.commit()
+    db.refresh(campaign)
+  except SQLAlchemyError:
+    db.rollback()
+    raise
+
+  return get_generation_plan(campaign_id, db)
 
 
 @router.get("/details/{campaign_id}", response_model=CampaignDetail)
 def get_campaign_details(
     campaign_id: int,
     db: DbSession,
+    rendition: Optional[str] = RENDITION_QUERY,
+    output_format: Optional[str] = FORMAT_QUERY,
 ) -> CampaignDetail:
+  output_format = check_rendition_request(rendition, output_format)
   campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
   if not campaign:
     raise HTTPException(
@@ -126,15 +323,11 @@ def get_campaign_details(
       .all()
   )
 
-  asset_items: List[AssetMetadata] = []
-  for asset in assets:
-    asset_items.append(
-        AssetMetadata(
-            id=asset.id,
-            aspect_ratio=asset.aspect_ratio,
-            s3_url=generate_presigned_url(asset.s3_key),
-        )
-    )
+  renditions = renditions_by_asset(db, [asset.id for asset in assets])
+  asset_items: List[AssetMetadata] = [
+      asset_metadata(asset, renditions[asset.id], rendition, output_format)
+      for asset in assets
+  ]
 
   # Fetch products linked to this campaign
   products: List[Product] = (
@@ -162,6 +355,10 @@ def get_campaign_details(
       target_audience=campaign.target_audience,
       campaign_message=campaign.campaign_message,
       localized_campaign_message=campaign.localized_campaign_message,
+      target_locales=campaign.target_locales,
+      localized_messages=campaign.localized_messages_json or {},
+      render_mode=RenderMode(campaign.render_mode).name,
+      render_profile_id=campaign.render_profile_id,
       assets=asset_items,
       products=product_items,
   )
@@ -192,6 +389,8 @@ def download_campaign(campaign_id: int, db: DbSession,) -> StreamingResponse:
 
   # Create in-memory ZIP
   zip_buffer = create_zip(campaign, assets)
+  # dimensions it backfilled from the image headers
+  db.commit()
 
   # Stream the ZIP file back
   filename = f"campaign_{campaign.id}.zip"
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from app.core.config import settings
+from app.core.db import DbSession
+from app.schemas.metrics import GenerationMetricsResponse, WorkerMetricsResponse
+from app.services.metrics import collect_metrics, load_worker_metrics
+
+router = APIRouter()
+
+
+@router.get("/generation", response_model=GenerationMetricsResponse)
+def get_generation_metrics(
+    db: DbSession,
+) -> GenerationMetricsResponse:
+  # a worker that has not reported for a few intervals is presumed gone
+  max_age = settings.WORKER_METRICS_INTERVAL_SECONDS * 3
+  workers = load_worker_metrics(db, max_age_seconds=max_age)
+
+  return GenerationMetricsResponse(
+      workers=[WorkerMetricsResponse.model_validate(w) for w in workers],
+      api=collect_metrics(),
+  )
@@ -0,0 +1,114 @@
+from typing import List
+from fastapi import APIRouter, HTTPException, Response, status
+from sqlalchemy.exc import SQLAlchemyError
+from app.models.brand import Brand
+from app.models.campaign import Campaign
+from app.models.render_profile import OutputFormat, RenderProfile
+from app.schemas.render_profile import RenderProfileCreate, RenderProfileResponse
+from app.core.db import DbSession
+
+router = APIRouter()
+
+
+def _get_profile(db: DbSession, render_profile_id: int) -> RenderProfile:
+  profile = db.get(RenderProfile, render_profile_id)
+  if profile is None:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Render profile {render_profile_id} not found",
+    )
+  return profile
+
+
+def _apply(profile: RenderProfile, payload: RenderProfileCreate) -> None:
+  profile.name = payload.name
+  profile.outputs_json = [output.model_dump() for output in payload.outputs_json]
+  profile.output_format = OutputFormat[payload.output_format]
+  profile.quality = payload.quality
+  profile.compression_level = payload.compression_level
+  profile.strip_metadata = payload.strip_metadata
+
+
+@router.post("", response_model=RenderProfileResponse, status_code=status.HTTP_201_CREATED)
+def create_render_profile(
+    payload: RenderProfileCreate,
+    db: DbSession,
+) -> RenderProfile:
+  profile = RenderProfile()
+  _apply(profile, payload)
+
+  try:
+    db.add(profile)
+    db.commit()
+    db.refresh(profile)
+  except SQLAlchemyError:
+    db.rollback()
+    raise
+
+  return profile
+
+
+@router.get("", response_model=List[RenderProfileResponse])
+def list_render_profiles(
+    db: DbSession,
+) -> List[RenderProfile]:
+  return db.query(RenderProfile).order_by(RenderProfile.id).all()
+
+
+@router.get("/{render_profile_id}", response_model=RenderProfileResponse)
+def get_render_profile(
+    render_profile_id: int,
+    db: DbSession,
+) -> RenderProfile:
+  return _get_profile(db, render_profile_id)
+
+
+@router.put("/{render_profile_id}", response_model=RenderProfileResponse)
+def update_render_profile(
+    render_profile_id: int,
+    payload: RenderProfileCreate,
+    db: DbSession,
+) -> RenderProfile:
+  '''
+  Replace a profile. Creatives already generated at sizes it no longer
+  lists are planned again (as stale) on the next generation.
+  '''
+  profile = _get_profile(db, render_profile_id)
+  _apply(profile, payload)
+
+  try:
+    db.commit()
+    db.refresh(profile)
+  except SQLAlchemyError:
+    db.rollback()
+    raise
+
+  return profile
+
+
+@router.delete("/{render_profile_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_render_profile(
+    render_profile_id: int,
+    db: DbSession,
+) -> Response:
+  profile = _get_profile(db, render_profile_id)
+
+  brands = db.query(Brand).filter(Brand.render_profile_id == profile.id).count()
+  campaigns = db.query(Campaign).filter(Campaign.render_profile_id == profile.id).count()
+  if brands or campaigns:
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=(
+            f"Render profile {render_profile_id} is used by {brands} brands "
+            f"and {campaigns} campaigns"
+        ),
+    )
+
+  try:
+    db.delete(profile)
+    db.commit()
+  except SQLAlchemyError:
+    db.rollback()
+    raise
+
+  return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,12 +1,37 @@
-from typing import List
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
 from fastapi import APIRouter, HTTPException, status
-from app.models.workflow import Workflow
-from app.schemas.workflow import WorkflowResponse
-from app.core.db import DbSession
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.models.workflow import Workflow, WorkflowStatus
+from app.models.workflow_batch import WorkflowBatch, WorkflowBatchMember
+from app.models.workflow_task import WorkflowTask
+from app.schemas.workflow import (
+    WorkflowBatchResponse,
+    WorkflowResponse,
+    WorkflowResumeResponse,
+    WorkflowTaskResponse,
+)
+from app.services.job_queue import in_flight_workflow, lock_campaign_generation, requeue_workflow
+from app.services.workflow_events import subscribe_workflow_events
+from app.services.workflow_ledger import batch_task_counts, task_counts
+from app.core.config import settings
+from app.core.db import DbSession, SessionLocal
 
 router = APIRouter()
 
 
+def _get_workflow_or_404(db: DbSession, workflow_id: int) -> Workflow:
+  workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+  if not workflow:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Workflow {workflow_id} not found",
+    )
+  return workflow
+
+
 @router.get("", response_model=List[WorkflowResponse])
 def list_workflows(
     db: DbSession,
@@ -15,15 +40,181 @@ def list_workflows(
   return workflows
 
 
+@router.get("/batches/{batch_id}", response_model=WorkflowBatchResponse)
+def get_workflow_batch(
+    batch_id: int,
+    db: DbSession,
+) -> WorkflowBatchResponse:
+  '''
+  Aggregate progress of a POST /campaigns/generate batch.
+  '''
+  batch = db.get(WorkflowBatch, batch_id)
+  if not batch:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Workflow batch {batch_id} not found",
+    )
+  workflows = (
+      db.query(Workflow)
+      .join(WorkflowBatchMember, WorkflowBatchMember.workflow_id == Workflow.id)
+      .filter(WorkflowBatchMember.batch_id == batch_id)
+      .order_by(Workflow.id)
+      .all()
+  )
+  workflow_counts = {s.name: 0 for s in WorkflowStatus}
+  for workflow in workflows:
+    workflow_counts[WorkflowStatus(workflow.status).name] += 1
+
+  if workflow_counts["STARTED"] or workflow_counts["RUNNING"]:
+    batch_status = WorkflowStatus.RUNNING.name
+  elif workflow_counts["FAILED"] or not workflows:
+    # no workflows left, e.g. their campaigns were deleted: nothing was made
+    batch_status = WorkflowStatus.FAILED.name
+  else:
+    batch_status = WorkflowStatus.COMPLETE.name
+
+  return WorkflowBatchResponse(
+      id=batch.id,
+      brand_id=batch.brand_id,
+      priority=batch.priority,
+      created_at=batch.created_at,
+      status=batch_status,
+      workflow_counts=workflow_counts,
+      task_counts=batch_task_counts(db, batch_id),
+      workflows=[WorkflowResponse.model_validate(workflow) for workflow in workflows],
+  )
+
+
 @router.get("/{workflow_id}", response_model=WorkflowResponse)
 def get_workflow(
     workflow_id: int,
     db: DbSession,
 ) -> WorkflowResponse:
-  workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
-  if not workflow:
+  return _get_workflow_or_404(db, workflow_id)
+
+
+@router.get("/{workflow_id}/tasks", response_model=List[WorkflowTaskResponse])
+def list_workflow_tasks(
+    workflow_id: int,
+    db: DbSession,
+) -> List[WorkflowTask]:
+  _get_workflow_or_404(db, workflow_id)
+  return (
+      db.query(WorkflowTask)
+      .filter(WorkflowTask.workflow_id == workflow_id)
+      .order_by(WorkflowTask.id)
+      .all()
+  )
+
+
+@router.post("/{workflow_id}/resume", response_model=WorkflowResumeResponse)
+def resume_workflow(
+    workflow_id: int,
+    db: DbSession,
+) -> WorkflowResumeResponse:
+  '''
+  Re-enqueue a FAILED workflow. Only its failed or unstarted tasks run
+  again; completed tasks keep their assets.
+  '''
+  workflow = _get_workflow_or_404(db, workflow_id)
+  if workflow.status != WorkflowStatus.FAILED:
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=(
+            f"Workflow {workflow_id} is {WorkflowStatus(workflow.status).name}; "
+            "only FAILED workflows can be resumed"
+        ),
+    )
+
+  # a resumed workflow is in flight again; keep generation single-flight
+  lock_campaign_generation(db, workflow.campaign_id)
+  if not workflow.force:
+    other = in_flight_workflow(db, workflow.campaign_id, exclude_id=workflow.id)
+    if other is not None:
+      db.rollback()
+      raise HTTPException(
+          status_code=status.HTTP_409_CONFLICT,
+          detail=(
+              f"Campaign {workflow.campaign_id} already has workflow {other.id} "
+              f"{WorkflowStatus(other.status).name}; resume once it has finished"
+          ),
+      )
+
+  requeue_workflow(db, workflow)
+  db.refresh(workflow)
+  return WorkflowResumeResponse(
+      workflow=WorkflowResponse.model_validate(workflow),
+      task_counts=task_counts(db, workflow_id),
+  )
+
+
+_TERMINAL_STATUSES = (WorkflowStatus.COMPLETE, WorkflowStatus.FAILED)
+
+
+def _workflow_snapshot(workflow_id: int) -> Optional[Dict[str, Any]]:
+  with SessionLocal() as db:
+    workflow = db.get(Workflow, workflow_id)
+    if workflow is None:
+      return None
+    return {
+        "workflow_id": workflow_id,
+        "event": "snapshot",
+        "status": WorkflowStatus(workflow.status).name,
+        "error": workflow.error_message,
+        "task_counts": task_counts(db, workflow_id),
+    }
+
+
+def _sse(event: Dict[str, Any]) -> str:
+  return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@router.get("/{workflow_id}/events")
+async def stream_workflow_events(workflow_id: int) -> StreamingResponse:
+  '''
+  Server-sent events with the live progress of a workflow: a snapshot of
+  the stored state first, then planned / task / finished events as the
+  worker running it publishes them (and a deferred event when a run is
+  retried later on an open circuit breaker). The stream ends once the
+  workflow is COMPLETE or FAILED.
+  '''
+  # subscribe before reading the snapshot so no event falls in between
+  subscription = subscribe_workflow_events(workflow_id)
+  snapshot = await run_in_threadpool(_workflow_snapshot, workflow_id)
+  if snapshot is None:
+    subscription.close()
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail=f"Workflow {workflow_id} not found",
     )
-  return workflow
+
+  async def stream() -> AsyncIterator[str]:
+    try:
+      yield _sse(snapshot)
+      if WorkflowStatus[snapshot["status"]] in _TERMINAL_STATUSES:
+        return
+
+      while True:
+        try:
+          event = await subscription.get(timeout=settings.WORKFLOW_EVENTS_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+          yield ": keep-alive\n\n"
+          # covers a finished event this process never received
+          current = await run_in_threadpool(_workflow_snapshot, workflow_id)
+          if current is None or WorkflowStatus[current["status"]] in _TERMINAL_STATUSES:
+            if current is not None:
+              yield _sse(current)
+            return
+          continue
+
+        yield _sse(event)
+        if event["event"] == "finished":
+          return
+    finally:
+      subscription.close()
+
+  return StreamingResponse(
+      stream(),
+      media_type="text/event-stream",
+      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
@@ -1,7 +1,7 @@
 from functools import lru_cache
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import AnyHttpUrl
 
 
@@ -24,6 +24,172 @@ class Settings(BaseSettings):
 
   # GEMINI_API_KEY: str = ""
 
+  # --- Worker / Job Queue Configuration ------------------------------------
+  # number of workflows a single worker process runs at the same time
+  WORKER_CONCURRENCY: int = 2
+  # how long an idle worker sleeps before polling the queue again
+  WORKER_POLL_INTERVAL_SECONDS: float = 2.0
+  # a claimed workflow is re-claimable once its lease expires without a heartbeat
+  WORKFLOW_LEASE_SECONDS: int = 120
+  WORKFLOW_HEARTBEAT_SECONDS: int = 30
+  # give up on a workflow after this many claims (e.g. it keeps crashing workers)
+  WORKFLOW_MAX_ATTEMPTS: int = 3
+  # how often a worker publishes its metrics snapshot (GET /metrics/generation)
+  WORKER_METRICS_INTERVAL_SECONDS: int = 10
+  # POST /campaigns/generate: most campaigns per request, and most queued
+  # workflows of a batch one worker claims together into one pipeline
+  BATCH_MAX_CAMPAIGNS: int = 500
+  WORKFLOW_BATCH_CLAIM_SIZE: int = 50
+
+  # --- Scheduling ----------------------------------------------------------
+  # extra workflow slots per worker only INTERACTIVE workflows may use
+  WORKER_INTERACTIVE_SLOTS: int = 1
+  # share of model call slots per priority class; slots are handed out by
+  # weighted fair queuing across (brand, priority class)
+  PRIORITY_WEIGHTS: Dict[str, float] = {"INTERACTIVE": 10.0, "BULK": 1.0}
+  # workflows that don't ask for a priority are INTERACTIVE up to this many
+  # asset tasks (products x aspect ratios), BULK above
+  INTERACTIVE_MAX_TASKS: int = 30
+
+  # --- Model Call Concurrency ----------------------------------------------
+  # upper bound on image renders a workflow runs at once; actual model call
+  # concurrency is governed by the adaptive (AIMD) limiter per model
+  GENERATION_MAX_WORKERS: int = 32
+  ADAPTIVE_CONCURRENCY_INITIAL: int = 4
+  ADAPTIVE_CONCURRENCY_MIN: int = 1
+  ADAPTIVE_CONCURRENCY_MAX: int = 32
+
+  # --- Workflow Engine -----------------------------------------------------
+  # "threads" runs asset tasks through a pipeline of thread pool stages,
+  # "asyncio" runs all of a workflow's tasks on one event loop with the
+  # async model/S3/DB clients
+  WORKFLOW_ENGINE: str = "threads"
+  # threads engine: workers of the prompt and upload stages (the render
+  # stage has GENERATION_MAX_WORKERS), items queued between two stages, and
+  # finished assets written per DB transaction
+  PIPELINE_PROMPT_WORKERS: int = 8
+  PIPELINE_UPLOAD_WORKERS: int = 16
+  PIPELINE_QUEUE_SIZE: int = 64
+  PIPELINE_PERSIST_BATCH_SIZE: int = 50
+  # asyncio engine: tasks in flight per workflow, concurrent S3 uploads and
+  # size of the per-run asyncpg pool
+  ASYNC_MAX_IN_FLIGHT_TASKS: int = 256
+  ASYNC_MAX_UPLOADS: int = 32
+  ASYNC_DB_POOL_SIZE: int = 10
+
+  # --- Generator Backend ---------------------------------------------------
+  # "live" calls gemini when GEMINI_API_KEY is set, else uses the dummy
+  # generators; "simulated" replays the latencies, error codes and payload
+  # sizes of SIMULATED_GENERATOR_PROFILE without calling the provider, for
+  # load tests (see app/services/generator_profiles.py)
+  GENERATOR_BACKEND: str = "live"  # live | simulated
+  SIMULATED_GENERATOR_PROFILE: Optional[str] = None
+  # replayed latencies are multiplied by this
+  SIMULATED_LATENCY_SCALE: float = 1.0
+  SIMULATED_GENERATOR_SEED: Optional[int] = None
+  # workers write a profile of their real model calls to this path on
+  # every metrics publish and at shutdown; samples kept per model
+  GENERATOR_RECORD_PATH: Optional[str] = None
+  GENERATOR_RECORD_MAX_SAMPLES: int = 2000
+
+  # --- Output Encoding -----------------------------------------------------
+  # creatives are fitted and encoded (render profile format and encoder
+  # settings) in a pool of this many processes per worker, off the GIL;
+  # 0 encodes in the calling thread
+  ENCODING_PROCESSES: int = 2
+
+  # --- Renditions ----------------------------------------------------------
+  # every creative is also stored at these long sides (0: its own size) in
+  # its own format and in these formats (AVIF only where Pillow writes it);
+  # GET /assets/{id}?rendition=&format= serves one
+  RENDITIONS_ENABLED: bool = True
+  RENDITION_SIZES: Dict[str, int] = {"thumbnail": 256, "preview": 1024, "full": 0}
+  RENDITION_FORMATS: List[str] = ["WEBP", "AVIF"]
+
+  # --- Hedged Image Requests ----------------------------------------------
+  # an image call still running past this percentile of the model's recent
+  # latencies gets a duplicate request; first to finish wins
+  HEDGING_ENABLED: bool = False
+  HEDGE_LATENCY_PERCENTILE: float = 0.9
+  HEDGE_LATENCY_WINDOW: int = 200
+  # no hedging until this many calls have been timed
+  HEDGE_MIN_SAMPLES: int = 20
+  # hedges a workflow may fire, as a fraction of its asset tasks (at least 1)
+  HEDGE_BUDGET_FRACTION: float = 0.1
+
+  # --- Circuit Breakers ----------------------------------------------------
+  # a model whose recent calls fail at this rate (provider errors: 429, 5xx,
+  # timeouts) is not called for OPEN_SECONDS, then probed again
+  CIRCUIT_BREAKER_ENABLED: bool = True
+  CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5
+  CIRCUIT_BREAKER_WINDOW: int = 20
+  # no tripping until this many calls are in the window
+  CIRCUIT_BREAKER_MIN_CALLS: int = 5
+  CIRCUIT_BREAKER_OPEN_SECONDS: float = 30.0
+  # trial calls let through (one at a time) to close the circuit again
+  CIRCUIT_BREAKER_HALF_OPEN_PROBES: int = 1
+  # fallback tiers while a model's circuit is open: these models in order,
+  # then (images) a cached creative of the same brief from another model,
+  # then the task is deferred and its workflow retried when the circuit
+  # is due to half-open
+  IMAGE_FALLBACK_MODELS: List[str] = []
+  TEXT_FALLBACK_MODELS: List[str] = []
+  FALLBACK_CACHED_VARIANTS: bool = True
+
+  # --- Provider Rate Limits ------------------------------------------------
+  # hard ceilings per model shared by all workflows: "memory" enforces them
+  # per process, "postgres" across every worker sharing the database
+  RATE_LIMIT_BACKEND: str = "memory"  # memory | postgres
+  MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+      "gemini-2.5-flash": {"requests_per_minute": 1000, "max_concurrent": 50},
+      "gemini-2.5-flash-image": {"requests_per_minute": 500, "max_concurrent": 20},
+  }
+  # burst allowance of the token bucket, in seconds worth of quota
+  RATE_LIMIT_BURST_SECONDS: float = 10.0
+  # a permit held longer than this (e.g. by a crashed worker) is reclaimed
+  RATE_LIMIT_LEASE_SECONDS: int = 300
+
+  # --- Generation Cache ----------------------------------------------------
+  # reuse an existing creative generated from identical inputs
+  # (prompt, model, aspect ratio, reference images) instead of calling the model
+  GENERATION_CACHE_ENABLED: bool = True
+  GENERATION_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+  # bound on the in-process lookup cache in front of the database
+  GENERATION_CACHE_MAX_ENTRIES: int = 10000
+
+  # --- Reference Images ----------------------------------------------------
+  # newest product photos (AssetType.PRODUCT) sent with each render of the
+  # product, downscaled to this long side (the model's preferred input)
+  REFERENCE_IMAGES_MAX: int = 3
+  REFERENCE_IMAGE_MAX_SIDE: int = 1024
+  # bound on the in-process cache of prepared reference bytes
+  REFERENCE_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+
+  # --- Near-Duplicate Detection --------------------------------------------
+  # every asset gets a 64 bit perceptual hash; GET /assets/{id}/similar
+  # lists assets at most this many bits apart by default, up to this many
+  SIMILAR_MAX_DISTANCE: int = 8
+  SIMILAR_MAX_RESULTS: int = 50
+  # POST /assets rejects (409) an image this close to an asset of the same
+  # campaign and product unless allow_duplicate is set; -1 disables it
+  UPLOAD_DEDUPE_MAX_DISTANCE: int = 3
+
+  # --- Localization --------------------------------------------------------
+  # campaign messages are localized with one batched call per this many
+  # languages; languages a batch misses are requested one by one, this many
+  # at a time
+  LOCALIZATION_BATCH_MAX_LANGUAGES: int = 20
+  LOCALIZATION_MAX_CONCURRENCY: int = 8
+
+  # --- Workflow Progress Events --------------------------------------------
+  # GET /workflows/{id}/events; "memory" only reaches subscribers in the
+  # process running the workflow, "postgres" fans out with LISTEN/NOTIFY
+  # from the workers to every API process
+  WORKFLOW_EVENTS_BACKEND: str = "memory"  # memory | postgres
+  WORKFLOW_EVENTS_CHANNEL: str = "workflow_events"
+  # idle SSE streams get a keep-alive comment (and a status re-check) this often
+  WORKFLOW_EVENTS_KEEPALIVE_SECONDS: int = 15
+
   # --- CORS Configuration --------------------------------------------------
   BACKEND_CORS_ORIGINS: List[AnyHttpUrl] | List[str] = ["*"]
 
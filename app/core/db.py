@@ -1,11 +1,15 @@
-from collections.abc import Generator
-from typing import Annotated
+from collections.abc import AsyncIterator, Generator
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Annotated
 
 from fastapi import Depends
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://admin:admin@db:5432/db",
@@ -35,3 +39,37 @@ def get_db() -> Generator[Session, None, None]:
 
 
 DbSession = Annotated[Session, Depends(get_db)]
+
+
+def _async_database_url(url: str) -> str:
+    # postgresql://... and postgresql+psycopg2://... -> postgresql+asyncpg://...
+    _, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}"
+
+
+@asynccontextmanager
+async def async_session_scope(
+    pool_size: int = 10,
+) -> AsyncIterator["async_sessionmaker[AsyncSession]"]:
+    """
+    Async sessionmaker for the asyncio workflow engine.
+
+    asyncpg connections belong to the event loop that opened them, so every
+    run gets its own engine/pool, disposed when the run's loop is done.
+    """
+    # imported here so the API process does not need greenlet/asyncpg
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        _async_database_url(DATABASE_URL),
+        pool_size=pool_size,
+        pool_pre_ping=True,
+    )
+    try:
+        yield async_sessionmaker(
+            bind=async_engine,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    finally:
+        await async_engine.dispose()
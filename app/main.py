@@ -8,6 +8,8 @@ from .api.routes_campaigns import router as campaigns_router
 from .api.routes_assets import router as assets_router
 from .api.routes_brands import router as brands_router
 from .api.routes_workflows import router as workflows_router
+from .api.routes_metrics import router as metrics_router
+from .api.routes_render_profiles import router as render_profiles_router
 
 
 @asynccontextmanager
@@ -69,6 +71,19 @@ app.include_router(
     tags=["workflows"],
 )
 
+app.include_router(
+    render_profiles_router,
+    prefix="/render-profiles",
+    tags=["render-profiles"],
+)
+
+
+app.include_router(
+    metrics_router,
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
 
 @app.get("/healthz", tags=["system"])
 async def healthcheck() -> dict:
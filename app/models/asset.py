@@ -5,6 +5,7 @@ from enum import IntEnum
 from typing import Optional, TYPE_CHECKING
 
 from sqlalchemy import (
+    BigInteger,
     DateTime,
     ForeignKey,
     Integer,
@@ -93,6 +94,21 @@ class Asset(Base):
       nullable=True,
   )
 
+  # content address of the generation inputs, see app/services/generation_cache.py
+  cache_key: Mapped[Optional[str]] = mapped_column(
+      String(64),
+      nullable=True,
+      index=True,
+  )
+
+  # perceptual hash of the image (signed 64 bit) and its four 16 bit bands,
+  # for near-duplicate lookups, see app/services/image_hash.py
+  image_hash: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+  image_hash_band_0: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+  image_hash_band_1: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+  image_hash_band_2: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+  image_hash_band_3: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+
   created_at: Mapped[datetime] = mapped_column(
       DateTime(timezone=True),
       server_default=func.now(),
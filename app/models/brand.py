@@ -1,13 +1,14 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import List, TYPE_CHECKING
-from sqlalchemy import DateTime, Integer, String, Text, func
+from typing import List, Optional, TYPE_CHECKING
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.core.db import Base
 
 if TYPE_CHECKING:
   from app.models.campaign import Campaign
   from app.models.asset import Asset
+  from app.models.render_profile import RenderProfile
 
 
 class Brand(Base):
@@ -44,6 +45,13 @@ class Brand(Base):
       nullable=True,
   )
 
+  render_profile_id: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      ForeignKey("render_profiles.id", ondelete="SET NULL"),
+      index=True,
+      nullable=True,
+  )
+
   created_at: Mapped[datetime] = mapped_column(
       DateTime(timezone=True),
       server_default=func.now(),
@@ -69,3 +77,8 @@ class Brand(Base):
       back_populates="brand",
       cascade="all, delete-orphan",
   )
+
+  render_profile: Mapped[Optional["RenderProfile"]] = relationship(
+      "RenderProfile",
+      back_populates="brands",
+  )
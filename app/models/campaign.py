@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, TYPE_CHECKING, Optional
+from enum import IntEnum
+from typing import Dict, List, TYPE_CHECKING, Optional
 
 from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.db import Base
@@ -12,9 +14,17 @@ if TYPE_CHECKING:
   from app.models.brand import Brand
   from app.models.asset import Asset
   from app.models.campaign_product import CampaignProduct
+  from app.models.render_profile import RenderProfile
   from app.models.workflow import Workflow
 
 
+class RenderMode(IntEnum):
+  # one image generation call per aspect ratio
+  PER_RATIO = 1
+  # one master render per product, other ratios derived locally
+  MASTER_DERIVE = 2
+
+
 class Campaign(Base):
   __tablename__ = "campaigns"
 
@@ -56,6 +66,33 @@ class Campaign(Base):
       nullable=True,
   )
 
+  # additional locales to localize the campaign message into, e.g. ["de-DE", "JP"]
+  target_locales: Mapped[Optional[List[str]]] = mapped_column(
+      JSONB,
+      nullable=True,
+  )
+
+  # locale -> localized campaign message
+  localized_messages_json: Mapped[Optional[Dict[str, str]]] = mapped_column(
+      JSONB,
+      nullable=True,
+  )
+
+  render_mode: Mapped[RenderMode] = mapped_column(
+      Integer,
+      default=RenderMode.PER_RATIO,
+      server_default=str(int(RenderMode.PER_RATIO)),
+      nullable=False,
+  )
+
+  # ratios, sizes and format of the creatives; falls back to the brand's
+  render_profile_id: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      ForeignKey("render_profiles.id", ondelete="SET NULL"),
+      index=True,
+      nullable=True,
+  )
+
   created_at: Mapped[datetime] = mapped_column(
       DateTime(timezone=True),
       server_default=func.now(),
@@ -91,3 +128,8 @@ class Campaign(Base):
       back_populates="campaign",
       cascade="all, delete-orphan",
   )
+
+  render_profile: Mapped[Optional["RenderProfile"]] = relationship(
+      "RenderProfile",
+      back_populates="campaigns",
+  )
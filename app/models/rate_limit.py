@@ -0,0 +1,53 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import DateTime, Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+
+class RateLimitBucket(Base):
+  '''
+  Token bucket per model, shared by every worker when
+  RATE_LIMIT_BACKEND=postgres.
+  '''
+  __tablename__ = "rate_limit_buckets"
+
+  model: Mapped[str] = mapped_column(
+      String(128),
+      primary_key=True,
+  )
+
+  tokens: Mapped[float] = mapped_column(
+      Float,
+      nullable=False,
+  )
+
+  refilled_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      nullable=False,
+  )
+
+
+class RateLimitLease(Base):
+  '''
+  One row per in-flight model call; counts against the model's concurrency
+  ceiling until released or expired (e.g. the worker crashed mid-call).
+  '''
+  __tablename__ = "rate_limit_leases"
+
+  id: Mapped[int] = mapped_column(
+      Integer,
+      primary_key=True,
+  )
+
+  model: Mapped[str] = mapped_column(
+      String(128),
+      nullable=False,
+      index=True,
+  )
+
+  expires_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      nullable=False,
+      index=True,
+  )
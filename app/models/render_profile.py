@@ -0,0 +1,95 @@
+from __future__ import annotations
+from datetime import datetime
+from enum import IntEnum
+from typing import Dict, List, Optional, TYPE_CHECKING, Union
+from sqlalchemy import Boolean, DateTime, Integer, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.core.db import Base
+
+if TYPE_CHECKING:
+  from app.models.brand import Brand
+  from app.models.campaign import Campaign
+
+
+class OutputFormat(IntEnum):
+  PNG = 1
+  JPEG = 2
+  WEBP = 3
+  # renditions only, not offered for render profiles
+  AVIF = 4
+
+
+class RenderProfile(Base):
+  '''
+  What a campaign's creatives are rendered as: the aspect ratios, the pixel
+  size of each and the image format. Attached to brands and campaigns; a
+  campaign without one uses its brand's.
+  '''
+  __tablename__ = "render_profiles"
+
+  id: Mapped[int] = mapped_column(
+      Integer,
+      primary_key=True,
+      index=True,
+  )
+
+  name: Mapped[str] = mapped_column(
+      String(255),
+      nullable=False,
+  )
+
+  # [{"aspect_ratio": "9:16", "width": 1080, "height": 1920}, ...]
+  outputs_json: Mapped[List[Dict[str, Union[str, int]]]] = mapped_column(
+      JSONB,
+      nullable=False,
+  )
+
+  output_format: Mapped[OutputFormat] = mapped_column(
+      Integer,
+      default=OutputFormat.PNG,
+      server_default=str(int(OutputFormat.PNG)),
+      nullable=False,
+  )
+
+  # encoder settings, see app/services/encoding.py; null for the format's
+  # default
+  quality: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      nullable=True,
+  )
+
+  compression_level: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      nullable=True,
+  )
+
+  strip_metadata: Mapped[bool] = mapped_column(
+      Boolean,
+      default=True,
+      server_default="true",
+      nullable=False,
+  )
+
+  created_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      nullable=False,
+  )
+
+  updated_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      onupdate=func.now(),
+      nullable=False,
+  )
+
+  brands: Mapped[List["Brand"]] = relationship(
+      "Brand",
+      back_populates="render_profile",
+  )
+
+  campaigns: Mapped[List["Campaign"]] = relationship(
+      "Campaign",
+      back_populates="render_profile",
+  )
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.core.db import Base
+from app.models.render_profile import OutputFormat
+
+if TYPE_CHECKING:
+  from app.models.asset import Asset
+
+
+class Rendition(Base):
+  '''
+  A smaller size or another format of an asset's image (thumbnail, preview,
+  full size as WebP/AVIF), stored next to it in S3 under a derived key.
+  Assets served from the generation cache share the renditions' objects of
+  the asset they were cached from.
+  '''
+  __tablename__ = "renditions"
+  __table_args__ = (
+      UniqueConstraint("asset_id", "name", "output_format", name="uq_renditions_asset_name_format"),
+  )
+
+  id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+  asset_id: Mapped[int] = mapped_column(
+      Integer,
+      ForeignKey("assets.id", ondelete="CASCADE"),
+      nullable=False,
+      index=True,
+  )
+  # key of RENDITION_SIZES, e.g. "thumbnail"
+  name: Mapped[str] = mapped_column(String(32), nullable=False)
+  output_format: Mapped[OutputFormat] = mapped_column(Integer, nullable=False)
+  width: Mapped[int] = mapped_column(Integer, nullable=False)
+  height: Mapped[int] = mapped_column(Integer, nullable=False)
+  size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+  s3_key: Mapped[str] = mapped_column(String(255), nullable=False)
+  created_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      nullable=False,
+  )
+
+  asset: Mapped["Asset"] = relationship("Asset")
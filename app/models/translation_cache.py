@@ -0,0 +1,44 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import DateTime, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+
+class TranslationCache(Base):
+  '''
+  Localized campaign messages, keyed by a hash of
+  (message hash, brand tone, target audience, language).
+  '''
+  __tablename__ = "translation_cache"
+
+  cache_key: Mapped[str] = mapped_column(
+      String(64),
+      primary_key=True,
+  )
+
+  message_hash: Mapped[str] = mapped_column(
+      String(64),
+      nullable=False,
+  )
+
+  language: Mapped[str] = mapped_column(
+      String(64),
+      nullable=False,
+  )
+
+  translation: Mapped[str] = mapped_column(
+      Text,
+      nullable=False,
+  )
+
+  model_name: Mapped[str | None] = mapped_column(
+      String(255),
+      nullable=True,
+  )
+
+  created_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      nullable=False,
+  )
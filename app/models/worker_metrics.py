@@ -0,0 +1,29 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import DateTime, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.db import Base
+
+
+class WorkerMetrics(Base):
+  '''
+  Latest metrics snapshot published by each worker process.
+  '''
+  __tablename__ = "worker_metrics"
+
+  worker_id: Mapped[str] = mapped_column(
+      String(255),
+      primary_key=True,
+  )
+
+  metrics_json: Mapped[dict] = mapped_column(
+      JSONB,
+      nullable=False,
+  )
+
+  updated_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      nullable=False,
+      index=True,
+  )
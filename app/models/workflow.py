@@ -2,7 +2,8 @@ from __future__ import annotations
 from datetime import datetime
 from enum import IntEnum
 from typing import Optional
-from sqlalchemy import Integer, String, DateTime, ForeignKey
+from sqlalchemy import Boolean, Integer, String, DateTime, ForeignKey, false
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from app.core.db import Base
 
@@ -14,6 +15,12 @@ class WorkflowStatus(IntEnum):
   FAILED = 4
 
 
+class WorkflowPriority(IntEnum):
+  # lower runs first: claimed first and favoured for model call slots
+  INTERACTIVE = 1
+  BULK = 2
+
+
 class Workflow(Base):
   __tablename__ = "workflows"
 
@@ -27,14 +34,74 @@ class Workflow(Base):
   finished_at: Mapped[Optional[datetime]] = mapped_column(
       DateTime(timezone=True), nullable=True)
   error_message: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+  # skip the generation cache and always call the model
+  bypass_cache: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+  # regenerate every creative, even up-to-date ones; not coalesced with
+  # other generate requests of the campaign (app/services/job_queue.py)
+  force: Mapped[bool] = mapped_column(
+      Boolean,
+      default=False,
+      server_default=false(),
+      nullable=False,
+  )
+  # scheduling class, see app/services/scheduling.py
+  priority: Mapped[WorkflowPriority] = mapped_column(
+      Integer,
+      default=WorkflowPriority.BULK,
+      server_default=str(int(WorkflowPriority.BULK)),
+      nullable=False,
+  )
+  # set for workflows requested through POST /campaigns/generate
+  batch_id: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      ForeignKey("workflow_batches.id", ondelete="SET NULL"),
+      index=True,
+      nullable=True,
+  )
+  # per stage p50/p95/max of the last attempt's asset tasks, see
+  # app/services/stage_timings.py
+  stage_timings_json: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
+
+  # Job queue columns, see app/services/job_queue.py
+  # a workflow in STARTED status is queued; a worker claims it by setting
+  # lease_owner/lease_expires_at and keeps the lease alive via heartbeats
+  attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+  lease_owner: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+  lease_expires_at: Mapped[Optional[datetime]] = mapped_column(
+      DateTime(timezone=True), nullable=True)
+  heartbeat_at: Mapped[Optional[datetime]] = mapped_column(
+      DateTime(timezone=True), nullable=True)
+  # a queued workflow is not claimed before this, set when its tasks were
+  # deferred on an open circuit breaker
+  retry_at: Mapped[Optional[datetime]] = mapped_column(
+      DateTime(timezone=True), nullable=True)
 
   # Relationships
   campaign = relationship("Campaign", back_populates="workflows")
+  batch = relationship("WorkflowBatch", back_populates="workflows")
+  tasks = relationship(
+      "WorkflowTask",
+      back_populates="workflow",
+      cascade="all, delete-orphan",
+  )
 
   # Remove started_at and finished_at from __init__ because they are managed by SQLAlchemy
-  def __init__(self, campaign_id: int, status: WorkflowStatus = WorkflowStatus.RUNNING):
+  def __init__(
+      self,
+      campaign_id: int,
+      status: WorkflowStatus = WorkflowStatus.RUNNING,
+      bypass_cache: bool = False,
+      priority: WorkflowPriority = WorkflowPriority.BULK,
+      force: bool = False,
+      batch_id: Optional[int] = None,
+  ):
     self.campaign_id = campaign_id
     self.status = status
+    self.attempts = 0
+    self.bypass_cache = bypass_cache
+    self.priority = priority
+    self.force = force
+    self.batch_id = batch_id
 
   def __repr__(self) -> str:
     return f"<Workflow(id={self.id}, status={self.status}, started_at={self.started_at})>"
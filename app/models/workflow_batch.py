@@ -0,0 +1,62 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+from sqlalchemy import DateTime, ForeignKey, Integer, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.core.db import Base
+from app.models.workflow import WorkflowPriority
+
+if TYPE_CHECKING:
+  from app.models.workflow import Workflow
+
+
+class WorkflowBatch(Base):
+  '''
+  Generation of many campaigns requested at once (POST /campaigns/generate).
+  Each campaign still gets its own workflow; workers claim the queued
+  workflows of a batch together and run them through one pipeline.
+  '''
+  __tablename__ = "workflow_batches"
+
+  id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+  # set when the batch was requested for all campaigns of a brand
+  brand_id: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      ForeignKey("brands.id", ondelete="SET NULL"),
+      nullable=True,
+  )
+  priority: Mapped[WorkflowPriority] = mapped_column(Integer, nullable=False)
+  created_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      nullable=False,
+  )
+
+  # the workflows claimed and run as this batch (Workflow.batch_id); the
+  # batch's progress covers all its members
+  workflows: Mapped[List["Workflow"]] = relationship(
+      "Workflow",
+      back_populates="batch",
+  )
+
+
+class WorkflowBatchMember(Base):
+  '''
+  A workflow a batch requested. A campaign whose workflow was already in
+  flight attaches to it, so one workflow can be a member of several
+  batches, though it is claimed and run with one of them only
+  (Workflow.batch_id).
+  '''
+  __tablename__ = "workflow_batch_members"
+
+  batch_id: Mapped[int] = mapped_column(
+      Integer,
+      ForeignKey("workflow_batches.id", ondelete="CASCADE"),
+      primary_key=True,
+  )
+  workflow_id: Mapped[int] = mapped_column(
+      Integer,
+      ForeignKey("workflows.id", ondelete="CASCADE"),
+      primary_key=True,
+      index=True,
+  )
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from datetime import datetime
+from enum import IntEnum
+from typing import Optional
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from app.core.db import Base
+
+
+class WorkflowTaskStatus(IntEnum):
+  PENDING = 1
+  RUNNING = 2
+  COMPLETE = 3
+  FAILED = 4
+  # the model was unavailable (open circuit); run again on the retry
+  DEFERRED = 5
+
+
+class WorkflowTask(Base):
+  '''
+  Ledger row for one (product, aspect ratio) creative of a workflow run.
+  Resuming a workflow only runs the tasks that are not COMPLETE.
+  '''
+  __tablename__ = "workflow_tasks"
+  __table_args__ = (
+      UniqueConstraint("workflow_id", "product_id", "aspect_ratio"),
+  )
+
+  id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+  workflow_id: Mapped[int] = mapped_column(
+      Integer,
+      ForeignKey("workflows.id", ondelete="CASCADE"),
+      index=True,
+      nullable=False,
+  )
+  product_id: Mapped[int] = mapped_column(
+      Integer,
+      ForeignKey("products.id", ondelete="CASCADE"),
+      nullable=False,
+  )
+  aspect_ratio: Mapped[str] = mapped_column(String(16), nullable=False)
+  # planner reason: missing, stale or forced
+  reason: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+  status: Mapped[WorkflowTaskStatus] = mapped_column(Integer, nullable=False)
+  attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+  asset_id: Mapped[Optional[int]] = mapped_column(
+      Integer,
+      ForeignKey("assets.id", ondelete="SET NULL"),
+      nullable=True,
+  )
+  error_message: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+  started_at: Mapped[Optional[datetime]] = mapped_column(
+      DateTime(timezone=True), nullable=True)
+  finished_at: Mapped[Optional[datetime]] = mapped_column(
+      DateTime(timezone=True), nullable=True)
+  created_at: Mapped[datetime] = mapped_column(
+      DateTime(timezone=True),
+      server_default=func.now(),
+      nullable=False,
+  )
+
+  workflow = relationship("Workflow", back_populates="tasks")
+  product = relationship("Product")
+
+  def __repr__(self) -> str:
+    return (
+        f"<WorkflowTask(id={self.id}, workflow_id={self.workflow_id}, "
+        f"product_id={self.product_id}, aspect_ratio={self.aspect_ratio}, status={self.status})>"
+    )
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -26,11 +26,41 @@ class AssetUploadRequest(BaseModel):
       ),
   )
 
+  type: Literal["CREATIVE", "PRODUCT"] = Field(
+      "CREATIVE",
+      description=(
+          "CREATIVE for a finished creative of the campaign, PRODUCT for a product "
+          "photo used as a reference image when rendering the product."
+      ),
+  )
+
   content_type: Optional[str] = Field(
-      "image/png",
-      description="MIME type of the uploaded image (e.g. 'image/png', 'image/jpeg').",
+      None,
+      description=(
+          "MIME type of the uploaded image (e.g. 'image/png', 'image/jpeg'); the upload "
+          "is rejected when the image data is of another type. The image is stored in "
+          "the campaign's render profile format."
+      ),
   )
 
+  allow_duplicate: bool = Field(
+      False,
+      description=(
+          "Store the image even when it is a near duplicate of an asset of the same "
+          "campaign (or product, for PRODUCT photos); otherwise such uploads are rejected "
+          "with 409 listing the duplicates."
+      ),
+  )
+
+
+class RenditionMetadata(BaseModel):
+  name: str = Field(..., description='Rendition size, e.g. "thumbnail", "preview", "full".')
+  format: str = Field(..., description="PNG, JPEG, WEBP or AVIF.")
+  width: int
+  height: int
+  size_bytes: int
+  s3_url: str
+
 
 class AssetMetadata(BaseModel):
   id: int
@@ -45,7 +75,55 @@ class AssetMetadata(BaseModel):
 
   s3_url: str
 
+  rendition: Optional[str] = Field(
+      None,
+      description=(
+          "Rendition s3_url points at, as requested with ?rendition= and ?format=; "
+          "null when it is the original (also when the asset has no such rendition)."
+      ),
+  )
+
+  renditions: List[RenditionMetadata] = Field(
+      default_factory=list,
+      description="Every stored rendition of the asset, smallest first.",
+  )
+
   checks: List[Dict[str, Any]] = Field(
       default_factory=list,
       description="List of check results (brand, legal, etc.) for this asset.",
   )
+
+
+class SimilarityCheckRequest(BaseModel):
+  image_base64: str = Field(
+      ...,
+      description="Base64-encoded image data, optionally with a data URL prefix.",
+  )
+  campaign_id: Optional[int] = Field(None, description="Only compare with this campaign's assets.")
+  product_id: Optional[int] = Field(None, description="Only compare with this product's assets.")
+  type: Optional[Literal["CREATIVE", "PRODUCT"]] = Field(None, description="Only compare with assets of this type.")
+  max_distance: Optional[int] = Field(
+      None,
+      ge=0,
+      le=32,
+      description="Most bits the perceptual hashes may differ in; null for the server default.",
+  )
+
+
+class SimilarAsset(BaseModel):
+  id: int
+  campaign_id: Optional[int] = None
+  product_id: Optional[int] = None
+  type: str
+  aspect_ratio: Optional[str] = None
+  distance: int = Field(
+      ...,
+      description="Bits (of 64) the perceptual hashes differ in; 0-3 is a near duplicate.",
+  )
+  s3_url: str
+
+
+class SimilarAssetsResponse(BaseModel):
+  image_hash: str = Field(..., description="Perceptual hash compared against, as 16 hex digits.")
+  max_distance: int
+  items: List[SimilarAsset]
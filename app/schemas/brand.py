@@ -13,7 +13,8 @@ class BrandCreate(BaseModel):
       "primary_color_hex": "#0033cc",
       "secondary_color_hex": "#ffffff",
       "tone_of_voice": "Bold, competitive, team-driven",
-      "font_family": "Roboto Slab"
+      "font_family": "Roboto Slab",
+      "render_profile_id": 1
   }
   """
 
@@ -37,6 +38,14 @@ class BrandCreate(BaseModel):
       None,
       description="Preferred brand font family name (e.g. 'Inter', 'Helvetica Neue')",
   )
+  render_profile_id: Optional[int] = Field(
+      None,
+      description=(
+          "Render profile (aspect ratios, sizes, format) of the brand's "
+          "campaigns; campaigns can override it. Defaults to 1:1, 9:16 "
+          "and 16:9 PNGs."
+      ),
+  )
 
 
 class BrandResponse(BaseModel):
@@ -46,6 +55,7 @@ class BrandResponse(BaseModel):
   secondary_color_hex: Optional[str] = None
   tone_of_voice: Optional[str] = None
   font_family: Optional[str] = None
+  render_profile_id: Optional[int] = None
   assets: List[AssetMetadata]
 
   model_config = ConfigDict(from_attributes=True)
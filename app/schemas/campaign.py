@@ -1,5 +1,5 @@
-from typing import Dict, List, Optional, Any
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional, Any
+from pydantic import BaseModel, Field
 from .asset import AssetMetadata
 from .product import ProductCreate
 
@@ -25,8 +25,11 @@ class CampaignBrief(BaseModel):
       }
     ],
     "target_region": "US",
+    "target_locales": ["fr-CA", "de-DE", "JP"],
     "target_audience": "Hockey players and fans ages 16-30",
-    "campaign_message": "Gear up for the ice — dominate every shift!"
+    "campaign_message": "Gear up for the ice — dominate every shift!",
+    "render_mode": "MASTER_DERIVE",
+    "render_profile_id": 2
   }
   """
 
@@ -34,8 +37,30 @@ class CampaignBrief(BaseModel):
   name: str
   products: List[ProductCreate]
   target_region: str
+  target_locales: Optional[List[str]] = Field(
+      None,
+      description=(
+          "Additional locales (region codes such as \"JP\" or locale tags "
+          "such as \"fr-CA\") to localize the campaign message into."
+      ),
+  )
   target_audience: str
   campaign_message: str
+  render_mode: Literal["PER_RATIO", "MASTER_DERIVE"] = Field(
+      "PER_RATIO",
+      description=(
+          "PER_RATIO generates every aspect ratio with the image model; "
+          "MASTER_DERIVE generates one master per product and derives the "
+          "other ratios locally (smart crop + brand color padding)."
+      ),
+  )
+  render_profile_id: Optional[int] = Field(
+      None,
+      description=(
+          "Render profile (aspect ratios, sizes, format) of the campaign's "
+          "creatives; defaults to the brand's."
+      ),
+  )
 
 
 class CampaignResponse(BaseModel):
@@ -43,11 +68,59 @@ class CampaignResponse(BaseModel):
 
 
 class GenerateRequest(BaseModel):
-  pass
+  bypass_cache: bool = Field(
+      False,
+      description=(
+          "Always call the generation models, even when a creative was "
+          "already generated from identical inputs."
+      ),
+  )
+  force: bool = Field(
+      False,
+      description=(
+          "Regenerate every creative, including up-to-date ones, without "
+          "the cache. By default a request for a campaign that already has "
+          "a queued or running workflow attaches to that workflow."
+      ),
+  )
+  priority: Optional[Literal["INTERACTIVE", "BULK"]] = Field(
+      None,
+      description=(
+          "Scheduling class of the workflow. INTERACTIVE work is claimed "
+          "first and gets the larger share of model calls; defaults to "
+          "INTERACTIVE for small campaigns and BULK for large ones."
+      ),
+  )
 
 
 class GenerateResponse(BaseModel):
   workflow_run_id: int
+  attached: bool = Field(
+      False,
+      description="True when the request joined an already queued or running workflow.",
+  )
+
+
+class BatchGenerateRequest(GenerateRequest):
+  campaign_ids: Optional[List[int]] = Field(
+      None,
+      description="Campaigns to generate; give either campaign_ids or brand_id.",
+  )
+  brand_id: Optional[int] = Field(
+      None,
+      description="Generate every campaign of this brand.",
+  )
+
+
+class BatchWorkflow(BaseModel):
+  campaign_id: int
+  workflow_run_id: int
+  attached: bool = False
+
+
+class BatchGenerateResponse(BaseModel):
+  batch_id: int
+  workflows: List[BatchWorkflow]
 
 
 class CampaignProductResponse(BaseModel):
@@ -65,5 +138,36 @@ class CampaignDetail(BaseModel):
   target_audience: str
   campaign_message: str
   localized_campaign_message: Optional[str]
+  target_locales: Optional[List[str]] = None
+  localized_messages: Dict[str, str] = Field(
+      default_factory=dict,
+      description="Localized campaign message per locale.",
+  )
+  render_mode: str
+  render_profile_id: Optional[int] = None
   assets: List[AssetMetadata]
   products: List[CampaignProductResponse]
+
+
+class PlannedTaskResponse(BaseModel):
+  product_id: int
+  product_name: str
+  aspect_ratio: str
+  reason: str = Field(
+      ...,
+      description="Why the creative is planned: missing, stale or forced.",
+  )
+
+
+class GenerationPlanResponse(BaseModel):
+  campaign_id: int
+  render_profile_id: Optional[int] = Field(
+      None,
+      description="Render profile the plan is for; null for the default profile.",
+  )
+  aspect_ratios: List[str]
+  up_to_date: int = Field(
+      ...,
+      description="Number of (product, aspect ratio) creatives that need no work.",
+  )
+  tasks: List[PlannedTaskResponse]
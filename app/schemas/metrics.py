@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Any, Dict, List
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class WorkerMetricsResponse(BaseModel):
+  worker_id: str
+  updated_at: datetime
+  metrics: Dict[str, Any] = Field(
+      ...,
+      validation_alias="metrics_json",
+  )
+
+  model_config = ConfigDict(from_attributes=True)
+
+
+class GenerationMetricsResponse(BaseModel):
+  workers: List[WorkerMetricsResponse] = Field(
+      default_factory=list,
+      description="Latest snapshot from every worker that reported recently.",
+  )
+  api: Dict[str, Any] = Field(
+      default_factory=dict,
+      description="Snapshot of the API process itself.",
+  )
@@ -0,0 +1,112 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, model_validator
+from app.models.render_profile import OutputFormat
+from app.services.encoding import MAX_WEBP_METHOD
+from app.services.render_profiles import size_matches_ratio
+
+
+class RenderOutputSpec(BaseModel):
+  aspect_ratio: str = Field(
+      ...,
+      description="Aspect ratio of the creative, e.g. 1:1, 4:5, 9:16",
+      pattern=r"^[1-9][0-9]*:[1-9][0-9]*$",
+  )
+  width: int = Field(..., gt=0, le=8192, description="Width in pixels")
+  height: int = Field(..., gt=0, le=8192, description="Height in pixels")
+
+  @model_validator(mode="after")
+  def check_size(self):
+    if not size_matches_ratio(self.width, self.height, self.aspect_ratio):
+      raise ValueError(
+          f"{self.width}x{self.height} is not a {self.aspect_ratio} size"
+      )
+    return self
+
+
+class RenderProfileCreate(BaseModel):
+  """
+  Incoming payload for creating (or replacing) a render profile.
+
+  Example:
+  {
+      "name": "Stories only",
+      "outputs_json": [
+          { "aspect_ratio": "9:16", "width": 1080, "height": 1920 }
+      ],
+      "output_format": "JPEG",
+      "quality": 88
+  }
+  """
+
+  name: str = Field(..., description="Human-readable profile name")
+  outputs_json: List[RenderOutputSpec] = Field(
+      ...,
+      min_length=1,
+      description="One creative per product is rendered for each output.",
+  )
+  output_format: Literal["PNG", "JPEG", "WEBP"] = Field(
+      "PNG",
+      description="Image format the creatives are stored in.",
+  )
+  quality: Optional[int] = Field(
+      None,
+      ge=1,
+      le=100,
+      description="JPEG/WebP quality (100 is lossless WebP); null for the format's default.",
+  )
+  compression_level: Optional[int] = Field(
+      None,
+      ge=0,
+      le=9,
+      description=(
+          f"PNG zlib level (0-9) or WebP method (0-{MAX_WEBP_METHOD}, slower is "
+          "smaller); null for the format's default."
+      ),
+  )
+  strip_metadata: bool = Field(
+      True,
+      description="Drop EXIF and ICC metadata from the stored creatives.",
+  )
+
+  @model_validator(mode="after")
+  def check_unique_ratios(self):
+    ratios = [output.aspect_ratio for output in self.outputs_json]
+    if len(set(ratios)) != len(ratios):
+      raise ValueError("Each aspect ratio can only be listed once")
+    return self
+
+  @model_validator(mode="after")
+  def check_encoder_settings(self):
+    if self.output_format == "WEBP" and (self.compression_level or 0) > MAX_WEBP_METHOD:
+      raise ValueError(f"WebP compression_level (method) is 0-{MAX_WEBP_METHOD}")
+    if self.output_format == "PNG" and self.quality is not None:
+      raise ValueError("quality does not apply to PNG, use compression_level")
+    if self.output_format == "JPEG" and self.compression_level is not None:
+      raise ValueError("compression_level does not apply to JPEG, use quality")
+    return self
+
+
+class RenderProfileResponse(BaseModel):
+  id: int
+  name: str
+  outputs_json: List[RenderOutputSpec]
+  output_format: OutputFormat
+  quality: Optional[int] = None
+  compression_level: Optional[int] = None
+  strip_metadata: bool = True
+  created_at: datetime
+  updated_at: datetime
+
+  model_config = ConfigDict(from_attributes=True)
+
+  @field_serializer("output_format")
+  def serialize_output_format(self, value: OutputFormat, _info):
+    return value.name
+
+
+class RenderProfileAssignment(BaseModel):
+  render_profile_id: Optional[int] = Field(
+      None,
+      description="Render profile to use; null falls back to the default.",
+  )
@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, ConfigDict, field_serializer
-from app.models.workflow import WorkflowStatus
+from app.models.workflow import WorkflowPriority, WorkflowStatus
+from app.models.workflow_task import WorkflowTaskStatus
 
 
 class WorkflowResponse(BaseModel):
@@ -11,10 +12,64 @@ class WorkflowResponse(BaseModel):
   started_at: datetime
   finished_at: Optional[datetime] = None
   error_message: Optional[str] = None
-
+  bypass_cache: bool = False
+  force: bool = False
+  priority: WorkflowPriority = WorkflowPriority.BULK
+  batch_id: Optional[int] = None
+  attempts: int = 0
+  lease_owner: Optional[str] = None
+  heartbeat_at: Optional[datetime] = None
+  retry_at: Optional[datetime] = None
+  stage_timings_json: Optional[Dict[str, Dict[str, Any]]] = None
 
   model_config = ConfigDict(from_attributes=True)
 
   @field_serializer("status")
   def serialize_status(self, value: WorkflowStatus, _info):
     return value.name
+
+  @field_serializer("priority")
+  def serialize_priority(self, value: WorkflowPriority, _info):
+    return value.name
+
+
+class WorkflowTaskResponse(BaseModel):
+  id: int
+  workflow_id: int
+  product_id: int
+  aspect_ratio: str
+  reason: Optional[str] = None
+  status: WorkflowTaskStatus
+  attempts: int
+  asset_id: Optional[int] = None
+  error_message: Optional[str] = None
+  started_at: Optional[datetime] = None
+  finished_at: Optional[datetime] = None
+
+  model_config = ConfigDict(from_attributes=True)
+
+  @field_serializer("status")
+  def serialize_status(self, value: WorkflowTaskStatus, _info):
+    return value.name
+
+
+class WorkflowResumeResponse(BaseModel):
+  workflow: WorkflowResponse
+  task_counts: Dict[str, int]
+
+
+class WorkflowBatchResponse(BaseModel):
+  id: int
+  brand_id: Optional[int] = None
+  priority: WorkflowPriority
+  created_at: datetime
+  # RUNNING while any workflow is queued or running, then FAILED if any
+  # workflow failed (or none is left), else COMPLETE
+  status: str
+  workflow_counts: Dict[str, int]
+  task_counts: Dict[str, int]
+  workflows: List[WorkflowResponse]
+
+  @field_serializer("priority")
+  def serialize_priority(self, value: WorkflowPriority, _info):
+    return value.name
@@ -0,0 +1,744 @@
+'''
+asyncio implementation of the campaign generation workflow.
+
+Same plan, cache and asset rows as app.services.workflows, but every asset
+task is a coroutine on one event loop using the async genai client, an
+aioboto3 S3 client and an asyncpg session. Selected with
+WORKFLOW_ENGINE=asyncio.
+'''
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Sequence
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.core.config import settings
+from app.core.db import async_session_scope
+from app.models.brand import Brand
+from app.models.campaign import Campaign, RenderMode
+from app.models.product import Product
+from app.models.workflow import Workflow, WorkflowPriority, WorkflowStatus
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.derive import MASTER_ASPECT_RATIO
+from app.services.generation_cache import get_generation_cache
+from app.services.job_queue import defer_workflow
+from app.services.hedging import HedgeBudget
+from app.services.image_generator import ImageGenerator, ImageResult, get_image_generator
+from app.services.localization import alocalize_campaign
+from app.services.render_profiles import RenderSpec, afit_to_output, resolve_render_profile
+from app.services.scheduling import Flow
+from app.services.references import areference_images, reference_keys
+from app.services.renditions import RenditionImage, amake_renditions, copy_renditions, rendition_rows
+from app.services.singleflight import AsyncSingleFlight
+from app.services.stage_timings import StageTimer, summarize
+from app.services.storage import async_s3_client, get_object_key, upload_bytes_async
+from app.services.text_generator import TextGenerator, get_text_generator
+from app.services.workflow_events import TaskStage, WorkflowProgress
+from app.services.workflow_ledger import complete_task, failure_summary, group_by_product, start_task
+from app.services.workflows import (
+    _asset_cache_key,
+    _build_image_prompt,
+    _cache_entry,
+    _cached_asset,
+    _cached_variant,
+    _creative_cache_key,
+    _deferral,
+    _derived_cache_model,
+    _derived_image,
+    _generated_asset,
+    _prepare_workflow_tasks,
+    _record_task_failures,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _AsyncRun:
+  workflow_run_id: int
+  brand: Brand
+  campaign: Campaign
+  profile: RenderSpec
+  use_cache: bool
+  sessions: async_sessionmaker[AsyncSession]
+  s3: object
+  text_generator: TextGenerator
+  image_generator: ImageGenerator
+  progress: WorkflowProgress
+  # bounds tasks past the planning stage, not just model calls
+  in_flight: asyncio.Semaphore
+  uploads: asyncio.Semaphore
+  # reference image keys per product id
+  references: dict[int, tuple[str, ...]] = field(default_factory=dict)
+  # one creative prompt per product, shared by all of its ratio tasks
+  creative_prompts: AsyncSingleFlight[int, str] = field(default_factory=AsyncSingleFlight)
+  # prepared reference images per product, fetched once for all of its tasks
+  reference_images: AsyncSingleFlight[int, list[bytes]] = field(default_factory=AsyncSingleFlight)
+  # of the assets written, for the workflow's stage_timings_json
+  timers: list[StageTimer] = field(default_factory=list)
+
+
+async def _localize_campaign_async(run: _AsyncRun) -> None:
+  async with run.sessions() as db:
+    try:
+      await alocalize_campaign(db, run.text_generator, run.brand, run.campaign)
+    except CircuitOpenError as e:
+      logger.warning("Deferring localization of campaign_id=%s: %s", run.campaign.id, e)
+      raise
+    except Exception:
+      logger.exception("Error localizing campaign message for campaign_id=%s", run.campaign.id)
+      raise
+
+
+async def _start_tasks(run: _AsyncRun, task_ids: list[int]) -> None:
+  async with run.sessions() as db:
+    for task_id in task_ids:
+      await db.run_sync(lambda session, task_id=task_id: start_task(session, task_id))
+    await db.commit()
+
+
+async def _fail_tasks(run: _AsyncRun, task_ids: list[int], error: BaseException) -> None:
+  async with run.sessions() as db:
+    await db.run_sync(lambda session: _record_task_failures(session, task_ids, error))
+
+
+async def _add_completed(
+    db: AsyncSession,
+    asset,
+    task_id: int,
+    renditions: Sequence[RenditionImage] = (),
+    source_asset_id: int | None = None,
+) -> None:
+  # asset row, its renditions (a cache hit's are those of its source asset)
+  # and ledger update commit together
+  db.add(asset)
+  await db.flush()
+  db.add_all(rendition_rows(asset.id, renditions))
+  if source_asset_id is not None:
+    await db.run_sync(lambda session: copy_renditions(session, {source_asset_id: [asset.id]}))
+  await db.run_sync(lambda session: complete_task(session, task_id, asset.id))
+
+
+async def _upload(run: _AsyncRun, timer: StageTimer, image: ImageResult, key: str) -> None:
+  timer.queued()
+  async with run.uploads:
+    timer.dequeued()
+    with timer.time("upload"):
+      await upload_bytes_async(
+        run.s3,
+        data=image.content,
+        key=key,
+        content_type=image.content_type,
+      )
+
+
+async def _renditions(run: _AsyncRun, timer: StageTimer, image: ImageResult, key: str) -> list[RenditionImage]:
+  timer.queued()
+  async with run.uploads:
+    timer.dequeued()
+    with timer.time("renditions"):
+      return await amake_renditions(run.s3, image.content, key, image.content_type)
+
+
+async def _reference_images(run: _AsyncRun, product: Product, timer: StageTimer) -> list[bytes] | None:
+  keys = run.references.get(product.id, ())
+  if not keys:
+    return None
+  with timer.time("references"):
+    return await run.reference_images.do(product.id, lambda: areference_images(run.s3, keys))
+
+
+async def _serve_variant(
+    run: _AsyncRun,
+    task_id: int,
+    product: Product,
+    aspect_ratio: str,
+    cache_key: str,
+    timer: StageTimer,
+    render_mode: RenderMode = RenderMode.PER_RATIO,
+) -> bool:
+  '''
+  Every image model tier is unavailable: writes a creative of the same
+  brief another model rendered as a cache hit. False if there is none.
+  '''
+  if not (run.use_cache and settings.FALLBACK_CACHED_VARIANTS):
+    return False
+  cache = get_generation_cache()
+  async with run.sessions() as db:
+    with timer.time("db_commit"):
+      cached = await db.run_sync(
+        lambda session: _cached_variant(
+          session,
+          cache,
+          run.brand,
+          run.campaign,
+          product,
+          aspect_ratio,
+          run.profile,
+          cache_key,
+          run.references.get(product.id, ()),
+        )
+      )
+      if cached is None:
+        return False
+      await _add_completed(
+        db,
+        _cached_asset(
+          run.campaign, product, aspect_ratio, cached, cache_key, render_mode, timer, "cached_variant"
+        ),
+        task_id,
+        source_asset_id=cached.asset_id,
+      )
+      await db.commit()
+  run.timers.append(timer)
+  run.progress.stage(TaskStage.DONE, product.id, aspect_ratio, cache_hit=True)
+  return True
+
+
+def _task_failed(
+    run: _AsyncRun,
+    product: Product,
+    aspect_ratios: list[str],
+    error: BaseException,
+) -> TaskStage:
+  # logs the failure; tasks refused by an open circuit are deferred
+  if isinstance(error, CircuitOpenError):
+    logger.warning(
+      "Deferring assets of workflow_id=%s campaign_id=%s product_id=%s ratios=%s: %s",
+      run.workflow_run_id,
+      run.campaign.id,
+      product.id,
+      aspect_ratios,
+      error,
+    )
+    return TaskStage.DEFERRED
+  logger.error(
+    "Error generating assets for workflow_id=%s campaign_id=%s product_id=%s ratios=%s",
+    run.workflow_run_id,
+    run.campaign.id,
+    product.id,
+    aspect_ratios,
+    exc_info=error,
+  )
+  return TaskStage.FAILED
+
+
+async def _generate_creative_prompt_async(run: _AsyncRun, product: Product) -> str:
+  text_prompt = _build_image_prompt(run.brand, run.campaign, product)
+
+  logger.info(
+    "Generating text prompt: workflow_id=%s campaign_id=%s product_id=%s prompt=%s",
+    run.workflow_run_id,
+    run.campaign.id,
+    product.id,
+    text_prompt,
+  )
+
+  text_result = await run.text_generator.agenerate(prompt=text_prompt)
+  if not text_result or not getattr(text_result, "content", None):
+    raise RuntimeError("Text generator failed to return content.")
+
+  return text_result.content
+
+
+async def _generate_single_asset_async(
+    run: _AsyncRun,
+    task_id: int,
+    product: Product,
+    aspect_ratio: str,
+) -> None:
+  '''
+  Async counterpart of the threads engine's pipeline stages for one task:
+  cache lookup, creative prompt (single-flight per product), image, upload,
+  Asset row.
+  '''
+  campaign = run.campaign
+  cache = get_generation_cache()
+  output = run.profile.output(aspect_ratio)
+  references = run.references.get(product.id, ())
+  cache_key = _asset_cache_key(
+    run.brand, campaign, product, run.image_generator.model, aspect_ratio, run.profile, references
+  )
+  timer = StageTimer()
+
+  timer.queued()
+  async with run.in_flight:
+    timer.dequeued()
+    with timer.time("db_commit"):
+      await _start_tasks(run, [task_id])
+    try:
+      if run.use_cache:
+        async with run.sessions() as db:
+          with timer.time("db_commit"):
+            cached = await db.run_sync(lambda session: cache.lookup(session, cache_key))
+          if cached is not None:
+            logger.info(
+              "Generation cache hit: workflow_id=%s campaign_id=%s product_id=%s ratio=%s source_asset_id=%s",
+              run.workflow_run_id,
+              campaign.id,
+              product.id,
+              aspect_ratio,
+              cached.asset_id,
+            )
+            with timer.time("db_commit"):
+              await _add_completed(
+                db,
+                _cached_asset(
+                  campaign, product, aspect_ratio, cached, cache_key, timings=timer
+                ),
+                task_id,
+                source_asset_id=cached.asset_id,
+              )
+              await db.commit()
+            run.timers.append(timer)
+            run.progress.stage(TaskStage.DONE, product.id, aspect_ratio, cache_hit=True)
+            return
+
+      run.progress.stage(TaskStage.PROMPTING, product.id, aspect_ratio)
+      with timer.time("prompt"):
+        creative_prompt = await run.creative_prompts.do(
+          product.id,
+          lambda: _generate_creative_prompt_async(run, product),
+        )
+
+      images = await _reference_images(run, product, timer)
+      run.progress.stage(TaskStage.RENDERING, product.id, aspect_ratio)
+      try:
+        with timer.time("render"):
+          image_result = await run.image_generator.agenerate(
+            prompt=creative_prompt,
+            aspect_ratio=aspect_ratio,
+            images=images,
+            size=output.size,
+          )
+          if not image_result or image_result.content is None:
+            raise RuntimeError("Image generator returned no content.")
+      except CircuitOpenError:
+        if await _serve_variant(run, task_id, product, aspect_ratio, cache_key, timer):
+          return
+        raise
+      with timer.time("encode"):
+        image_result = await afit_to_output(image_result, output, run.profile)
+
+      if image_result.fallback_model:
+        # cached as the fallback model's creative, not the primary's
+        cache_key = _creative_cache_key(
+          run.brand,
+          campaign,
+          product,
+          image_result.fallback_model,
+          aspect_ratio,
+          run.profile,
+          RenderMode.PER_RATIO,
+          references,
+        )
+      key = get_object_key(campaign.id, product.id, aspect_ratio, run.profile.extension)
+      run.progress.stage(TaskStage.UPLOADING, product.id, aspect_ratio)
+      await _upload(run, timer, image_result, key)
+      renditions = await _renditions(run, timer, image_result, key)
+
+      with timer.time("db_commit"):
+        async with run.sessions() as db:
+          asset = _generated_asset(
+            campaign,
+            product,
+            aspect_ratio,
+            key,
+            creative_prompt,
+            image_result,
+            cache_key,
+            timings=timer,
+          )
+          await _add_completed(db, asset, task_id, renditions)
+          await db.commit()
+      run.timers.append(timer)
+      run.progress.stage(TaskStage.DONE, product.id, aspect_ratio)
+
+      cache.store(cache_key, _cache_entry(asset, creative_prompt, image_result))
+
+    except Exception as e:
+      stage = _task_failed(run, product, [aspect_ratio], e)
+      await _fail_tasks(run, [task_id], e)
+      run.progress.stage(stage, product.id, aspect_ratio, error=e)
+      raise
+
+
+async def _derived_output(
+    run: _AsyncRun,
+    master: ImageResult,
+    aspect_ratio: str,
+    timer: StageTimer,
+) -> ImageResult:
+  with timer.time("render"):
+    image = await asyncio.to_thread(_derived_image, master, aspect_ratio, run.brand)
+  with timer.time("encode"):
+    return await afit_to_output(image, run.profile.output(aspect_ratio), run.profile)
+
+
+async def _generate_derived_assets_async(
+    run: _AsyncRun,
+    product: Product,
+    task_ids: dict[str, int],
+) -> None:
+  '''
+  Master + derive counterpart: one master render per product, the other
+  ratios derived from it off the event loop.
+  '''
+  aspect_ratios = list(task_ids)
+  completed: set[str] = set()
+  campaign = run.campaign
+  cache = get_generation_cache()
+  derived_model = _derived_cache_model(run.image_generator.model)
+  references = run.references.get(product.id, ())
+  cache_keys = {
+    ratio: _asset_cache_key(
+      run.brand,
+      campaign,
+      product,
+      run.image_generator.model if ratio == MASTER_ASPECT_RATIO else derived_model,
+      ratio,
+      run.profile,
+      references,
+    )
+    for ratio in aspect_ratios
+  }
+  # shared until the master is rendered, then one copy per ratio
+  timer = StageTimer()
+
+  timer.queued()
+  async with run.in_flight:
+    timer.dequeued()
+    with timer.time("db_commit"):
+      await _start_tasks(run, list(task_ids.values()))
+    try:
+      pending: list[str] = []
+      with timer.time("db_commit"):
+        async with run.sessions() as db:
+          for ratio in aspect_ratios:
+            cached = None
+            if run.use_cache:
+              cached = await db.run_sync(
+                lambda session, key=cache_keys[ratio]: cache.lookup(session, key)
+              )
+            if cached is None:
+              pending.append(ratio)
+              continue
+            await _add_completed(
+              db,
+              _cached_asset(
+                campaign,
+                product,
+                ratio,
+                cached,
+                cache_keys[ratio],
+                RenderMode.MASTER_DERIVE,
+                timer,
+              ),
+              task_ids[ratio],
+              source_asset_id=cached.asset_id,
+            )
+          await db.commit()
+      completed.update(ratio for ratio in aspect_ratios if ratio not in pending)
+      for ratio in completed:
+        run.timers.append(timer.copy())
+        run.progress.stage(TaskStage.DONE, product.id, ratio, cache_hit=True)
+
+      if not pending:
+        return
+
+      for ratio in pending:
+        run.progress.stage(TaskStage.PROMPTING, product.id, ratio)
+      with timer.time("prompt"):
+        creative_prompt = await run.creative_prompts.do(
+          product.id,
+          lambda: _generate_creative_prompt_async(run, product),
+        )
+
+      images = await _reference_images(run, product, timer)
+      for ratio in pending:
+        run.progress.stage(TaskStage.RENDERING, product.id, ratio)
+      try:
+        with timer.time("render"):
+          master = await run.image_generator.agenerate(
+            prompt=creative_prompt,
+            aspect_ratio=MASTER_ASPECT_RATIO,
+            images=images,
+            size=run.profile.master_size(),
+          )
+      except CircuitOpenError:
+        for ratio in pending:
+          if await _serve_variant(
+            run, task_ids[ratio], product, ratio, cache_keys[ratio], timer.copy(), RenderMode.MASTER_DERIVE
+          ):
+            completed.add(ratio)
+        if completed.issuperset(pending):
+          return
+        raise
+      if not master or master.content is None:
+        raise RuntimeError("Image generator returned no content.")
+      if master.fallback_model:
+        # cached as the fallback model's creatives, not the primary's
+        for ratio in pending:
+          cache_keys[ratio] = _creative_cache_key(
+            run.brand,
+            campaign,
+            product,
+            master.fallback_model,
+            ratio,
+            run.profile,
+            RenderMode.MASTER_DERIVE,
+            references,
+          )
+
+      generated = []
+      timers: dict[str, StageTimer] = {}
+      for ratio in pending:
+        timers[ratio] = ratio_timer = timer.copy()
+        image_result = await _derived_output(run, master, ratio, ratio_timer)
+        key = get_object_key(campaign.id, product.id, ratio, run.profile.extension)
+        run.progress.stage(TaskStage.UPLOADING, product.id, ratio)
+        await _upload(run, ratio_timer, image_result, key)
+        renditions = await _renditions(run, ratio_timer, image_result, key)
+        generated.append((
+          _generated_asset(
+            campaign,
+            product,
+            ratio,
+            key,
+            creative_prompt,
+            image_result,
+            cache_keys[ratio],
+            RenderMode.MASTER_DERIVE,
+            ratio_timer,
+          ),
+          image_result,
+          renditions,
+        ))
+
+      started = time.monotonic()
+      async with run.sessions() as db:
+        for asset, _, renditions in generated:
+          await _add_completed(db, asset, task_ids[asset.aspect_ratio], renditions)
+        await db.commit()
+      elapsed = time.monotonic() - started
+      for ratio in pending:
+        timers[ratio].add("db_commit", elapsed)
+        run.timers.append(timers[ratio])
+        run.progress.stage(TaskStage.DONE, product.id, ratio)
+      completed.update(pending)
+
+      for asset, image_result, _ in generated:
+        cache.store(asset.cache_key, _cache_entry(asset, creative_prompt, image_result))
+
+    except Exception as e:
+      failed = [ratio for ratio in aspect_ratios if ratio not in completed]
+      stage = _task_failed(run, product, failed, e)
+      await _fail_tasks(run, [task_ids[ratio] for ratio in failed], e)
+      for ratio in failed:
+        run.progress.stage(stage, product.id, ratio, error=e)
+      raise
+
+
+async def _finish_workflow(
+    sessions: async_sessionmaker[AsyncSession],
+    workflow_run_id: int,
+    errors: list[BaseException],
+    deferred: list[CircuitOpenError],
+    progress: WorkflowProgress,
+    timers: list[StageTimer],
+) -> None:
+  async with sessions() as db:
+    workflow = await db.get(Workflow, workflow_run_id)
+    if not workflow:
+      logger.error("Workflow %s not found when finalizing.", workflow_run_id)
+      return
+
+    if errors:
+      logger.error(
+        "Workflow %s completed with %d asset errors; marking FAILED.",
+        workflow_run_id,
+        len(errors),
+      )
+      workflow.status = WorkflowStatus.FAILED
+      workflow.error_message = (
+          await db.run_sync(lambda session: failure_summary(session, workflow_run_id))
+          or str(errors[0])
+      )
+    elif deferred:
+      retry_after = _deferral(workflow_run_id, deferred)
+      defer_workflow(db, workflow, retry_after, str(deferred[0]))
+      workflow.stage_timings_json = summarize(timers)
+      await db.commit()
+      progress.retry_scheduled(retry_after, workflow.error_message)
+      return
+    else:
+      workflow.status = WorkflowStatus.COMPLETE
+      # left by a deferred run
+      workflow.error_message = None
+
+    workflow.stage_timings_json = summarize(timers)
+    workflow.finished_at = datetime.utcnow()
+    await db.commit()
+    progress.finished(WorkflowStatus(workflow.status).name, workflow.error_message)
+
+
+async def _run_workflow_async(
+    sessions: async_sessionmaker[AsyncSession],
+    s3: object,
+    in_flight: asyncio.Semaphore,
+    uploads: asyncio.Semaphore,
+    workflow_run_id: int,
+    campaign_id: int,
+) -> None:
+  async with sessions() as db:
+    try:
+      workflow = await db.get(Workflow, workflow_run_id)
+      if not workflow:
+        logger.error("Workflow %s not found; aborting generation.", workflow_run_id)
+        return
+      workflow.status = WorkflowStatus.RUNNING
+      workflow.started_at = datetime.utcnow()
+      use_cache = settings.GENERATION_CACHE_ENABLED and not workflow.bypass_cache
+      await db.commit()
+
+      campaign = await db.get(Campaign, campaign_id)
+      if not campaign:
+        raise ValueError(f"Campaign {campaign_id} not found")
+
+      brand = await db.get(Brand, campaign.brand_id)
+      if not brand:
+        raise ValueError(
+            f"Brand {campaign.brand_id} not found for campaign {campaign_id}")
+
+      # planner and ledger are sync code; run them on this session's connection
+      force = workflow.force
+      profile = await db.run_sync(
+          lambda session: resolve_render_profile(session.get(Campaign, campaign_id)),
+      )
+      image_tasks = await db.run_sync(
+          lambda session: _prepare_workflow_tasks(
+              session, workflow_run_id, session.get(Campaign, campaign_id), force, profile),
+      )
+      references = await db.run_sync(
+          lambda session: reference_keys(session, {task.product_id for task in image_tasks}),
+      )
+      progress = WorkflowProgress(workflow_run_id, total=len(image_tasks))
+      progress.planned()
+    except Exception as e:
+      logger.exception("Error preparing workflow %s", workflow_run_id)
+      WorkflowProgress(workflow_run_id, total=0).finished(WorkflowStatus.FAILED.name, str(e))
+      try:
+        await db.rollback()
+        workflow = await db.get(Workflow, workflow_run_id)
+        if workflow:
+          workflow.status = WorkflowStatus.FAILED
+          workflow.finished_at = datetime.utcnow()
+          workflow.error_message = str(e)
+          await db.commit()
+      except Exception:
+        await db.rollback()
+      raise
+
+  product_groups = group_by_product(image_tasks)
+  derive = campaign.render_mode == RenderMode.MASTER_DERIVE
+  image_calls = len(product_groups) if derive else len(image_tasks)
+  # model call slots are shared fairly between brands and priority classes
+  flow = Flow(campaign.brand_id, WorkflowPriority(workflow.priority))
+
+  run = _AsyncRun(
+      workflow_run_id=workflow_run_id,
+      brand=brand,
+      campaign=campaign,
+      profile=profile,
+      use_cache=use_cache,
+      sessions=sessions,
+      s3=s3,
+      text_generator=get_text_generator(flow),
+      image_generator=get_image_generator(
+          hedge_budget=HedgeBudget.for_tasks(image_calls),
+          flow=flow,
+      ),
+      progress=progress,
+      in_flight=in_flight,
+      uploads=uploads,
+      references=references,
+  )
+
+  # localization no longer holds up the asset tasks
+  coroutines = [_localize_campaign_async(run)]
+  if derive:
+    coroutines += [
+        _generate_derived_assets_async(
+            run,
+            product_tasks[0].product,
+            {task.aspect_ratio: task.id for task in product_tasks},
+        )
+        for _, product_tasks in product_groups
+    ]
+  else:
+    coroutines += [
+        _generate_single_asset_async(run, task.id, task.product, task.aspect_ratio)
+        for task in image_tasks
+    ]
+  results = await asyncio.gather(*coroutines, return_exceptions=True)
+
+  # tasks refused by an open circuit are retried later, not failures
+  deferred = [result for result in results if isinstance(result, CircuitOpenError)]
+  errors = [
+      result
+      for result in results
+      if isinstance(result, BaseException) and not isinstance(result, CircuitOpenError)
+  ]
+  await _finish_workflow(sessions, workflow_run_id, errors, deferred, progress, run.timers)
+
+  if errors:
+    raise RuntimeError(f"Workflow {workflow_run_id} failed; {len(errors)} asset errors")
+
+
+async def run_campaign_generation_async(
+    workflow_run_id: int,
+    campaign_id: int,
+) -> None:
+  '''
+    Orchestration of a creative generation workflow for a campaign.
+    Asset generation and localization run as tasks on the current loop.
+  '''
+  async with async_session_scope(pool_size=settings.ASYNC_DB_POOL_SIZE) as sessions:
+    async with async_s3_client() as s3:
+      await _run_workflow_async(
+          sessions,
+          s3,
+          asyncio.Semaphore(settings.ASYNC_MAX_IN_FLIGHT_TASKS),
+          asyncio.Semaphore(settings.ASYNC_MAX_UPLOADS),
+          workflow_run_id,
+          campaign_id,
+      )
+
+
+async def run_batch_generation_async(workflows: Sequence[tuple[int, int]]) -> None:
+  '''
+  Several (workflow_id, campaign_id) runs, e.g. the workflows of one batch
+  claimed together by a worker, concurrently on the current loop with one
+  DB pool, one S3 client and one in-flight task bound between them.
+  '''
+  async with async_session_scope(pool_size=settings.ASYNC_DB_POOL_SIZE) as sessions:
+    async with async_s3_client() as s3:
+      in_flight = asyncio.Semaphore(settings.ASYNC_MAX_IN_FLIGHT_TASKS)
+      uploads = asyncio.Semaphore(settings.ASYNC_MAX_UPLOADS)
+      results = await asyncio.gather(
+          *(
+              _run_workflow_async(sessions, s3, in_flight, uploads, workflow_run_id, campaign_id)
+              for workflow_run_id, campaign_id in workflows
+          ),
+          return_exceptions=True,
+      )
+
+  failed = [
+      workflow_run_id
+      for (workflow_run_id, _), result in zip(workflows, results)
+      if isinstance(result, BaseException)
+  ]
+  if failed:
+    raise RuntimeError(f"Workflows {sorted(failed)} of the batch failed")
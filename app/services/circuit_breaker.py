@@ -0,0 +1,219 @@
+'''
+Circuit breakers in front of the model providers.
+
+While a model's recent calls keep failing with provider errors the circuit
+opens and calls fail fast with CircuitOpenError instead of tying up limiter
+slots and workflow time on a provider that is down. After OPEN_SECONDS a
+few probe calls are let through (half-open); they close the circuit again
+or re-open it.
+
+Generators catch CircuitOpenError to move on to their fallback tier, see
+get_image_generator / get_text_generator; a task with no tier left is
+deferred and its workflow retried later (app/services/workflows.py).
+'''
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from typing import Dict, Iterator, Optional
+from app.core.config import settings
+from app.services.concurrency import is_overload_error
+from app.services.metrics import register_metrics_source
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+  '''
+  A call was refused because the model's circuit is open; retry_after is
+  the number of seconds until it is probed again.
+  '''
+
+  def __init__(self, name: str, retry_after: float):
+    super().__init__(f"Circuit for {name} is open, retry in {retry_after:.0f}s")
+    self.name = name
+    self.retry_after = retry_after
+
+
+def is_provider_error(exc: BaseException) -> bool:
+  '''
+  True for failures on the provider's side (overload, 5xx, timeouts, lost
+  connections); only these count towards opening a circuit.
+  '''
+  if isinstance(exc, CircuitOpenError):
+    return False
+  if is_overload_error(exc) or isinstance(exc, (TimeoutError, ConnectionError)):
+    return True
+  code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+  return isinstance(code, int) and code >= 500
+
+
+class CircuitBreaker:
+  def __init__(
+      self,
+      name: str,
+      failure_rate: float,
+      window: int,
+      min_calls: int,
+      open_seconds: float,
+      half_open_probes: int = 1,
+  ):
+    self.name = name
+    self.failure_rate = failure_rate
+    self.min_calls = max(1, min_calls)
+    self.open_seconds = open_seconds
+    self.half_open_probes = max(1, half_open_probes)
+    self._lock = threading.Lock()
+    self._state = CircuitState.CLOSED
+    # True for a failed call
+    self._outcomes: deque[bool] = deque(maxlen=max(self.min_calls, window))
+    self._opened_at = 0.0
+    self._probes_in_flight = 0
+    self._probe_successes = 0
+
+    self.trips = 0
+    self.rejected = 0
+
+  def _refresh(self) -> None:
+    if self._state == CircuitState.OPEN and self._retry_after() <= 0:
+      self._state = CircuitState.HALF_OPEN
+      self._probes_in_flight = 0
+      self._probe_successes = 0
+
+  def _retry_after(self) -> float:
+    return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+  @property
+  def state(self) -> CircuitState:
+    with self._lock:
+      self._refresh()
+      return self._state
+
+  def retry_after(self) -> float:
+    with self._lock:
+      self._refresh()
+      if self._state == CircuitState.CLOSED:
+        return 0.0
+      # a half-open circuit busy probing is retried after a short while
+      return self._retry_after() if self._state == CircuitState.OPEN else 1.0
+
+  def _open(self) -> None:
+    self._state = CircuitState.OPEN
+    self._opened_at = time.monotonic()
+    self._outcomes.clear()
+    self.trips += 1
+    logger.warning("Circuit for %s opened for %.0fs", self.name, self.open_seconds)
+
+  def _before(self) -> bool:
+    # whether the call is a half-open probe; raises when it may not run
+    with self._lock:
+      self._refresh()
+      if self._state == CircuitState.CLOSED:
+        return False
+      if self._state == CircuitState.HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+        self._probes_in_flight += 1
+        return True
+      self.rejected += 1
+      retry_after = self._retry_after() if self._state == CircuitState.OPEN else 1.0
+    raise CircuitOpenError(self.name, retry_after)
+
+  def _after(self, probe: bool, failed: Optional[bool]) -> None:
+    # failed is None for errors that say nothing about the provider
+    with self._lock:
+      if probe:
+        self._probes_in_flight = max(0, self._probes_in_flight - 1)
+        if self._state != CircuitState.HALF_OPEN:
+          return
+        if failed:
+          self._open()
+        elif failed is False:
+          self._probe_successes += 1
+          if self._probe_successes >= self.half_open_probes:
+            self._state = CircuitState.CLOSED
+            logger.info("Circuit for %s closed", self.name)
+        return
+
+      # calls started before the circuit opened don't count against it
+      if self._state != CircuitState.CLOSED or failed is None:
+        return
+      self._outcomes.append(failed)
+      if (
+          len(self._outcomes) >= self.min_calls
+          and self._outcomes.count(True) / len(self._outcomes) >= self.failure_rate
+      ):
+        self._open()
+
+  @contextmanager
+  def call(self) -> Iterator[None]:
+    '''
+    Guards one model call; raises CircuitOpenError instead of running it
+    while the circuit is open. Holds no lock while the call runs, so it
+    also guards awaits in async code.
+    '''
+    probe = self._before()
+    try:
+      yield
+    except BaseException as exc:
+      self._after(probe, True if is_provider_error(exc) else None)
+      raise
+    else:
+      self._after(probe, False)
+
+  def snapshot(self) -> dict:
+    with self._lock:
+      self._refresh()
+      return {
+          "name": self.name,
+          "state": self._state.value,
+          "failure_rate": (
+              round(self._outcomes.count(True) / len(self._outcomes), 3)
+              if self._outcomes else 0.0
+          ),
+          "calls_in_window": len(self._outcomes),
+          "retry_after_seconds": (
+              round(self._retry_after(), 1) if self._state == CircuitState.OPEN else 0.0
+          ),
+          "trips": self.trips,
+          "rejected": self.rejected,
+      }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+  '''
+  Process-wide breaker per model, shared by every workflow in the process.
+  '''
+  with _breakers_lock:
+    breaker = _breakers.get(model)
+    if breaker is None:
+      breaker = CircuitBreaker(
+          name=model,
+          failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+          window=settings.CIRCUIT_BREAKER_WINDOW,
+          min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+          open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+          half_open_probes=settings.CIRCUIT_BREAKER_HALF_OPEN_PROBES,
+      )
+      _breakers[model] = breaker
+    return breaker
+
+
+def _breaker_metrics() -> list[dict]:
+  with _breakers_lock:
+    breakers = list(_breakers.values())
+  return [breaker.snapshot() for breaker in breakers]
+
+
+register_metrics_source("circuit_breakers", _breaker_metrics)
@@ -0,0 +1,264 @@
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+from app.core.config import settings
+from app.services.metrics import register_metrics_source
+from app.services.scheduling import FairQueue, Flow
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+  '''
+  True for provider push-back (rate limited / overloaded) as opposed to a
+  bad request or a bug on our side.
+  '''
+  code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+  if code in OVERLOAD_STATUS_CODES:
+    return True
+  message = str(exc).lower()
+  return any(
+      marker in message
+      for marker in ("overloaded", "resource_exhausted", "unavailable", "429", "503")
+  )
+
+
+class AdaptiveConcurrencyLimiter:
+  '''
+  AIMD limit on the number of in-flight calls to one model.
+
+  While calls succeed with healthy latency and a low error rate the limit
+  grows additively (about +1 per limit's worth of successes); an overload
+  response (429/503) cuts it multiplicatively. Latency is healthy while it
+  stays within LATENCY_TOLERANCE of the fastest recent call, so no per
+  model latency target has to be configured.
+
+  Callers that have to wait for a slot are queued by flow (brand and
+  priority class) and served in weighted fair order, see
+  app/services/scheduling.py.
+  '''
+
+  LATENCY_TOLERANCE = 2.0
+  # how often async callers re-check for a free slot
+  ASYNC_POLL_SECONDS = 0.05
+  # sub-50ms jitter is never a congestion signal
+  LATENCY_SLACK_SECONDS = 0.05
+  ERROR_RATE_THRESHOLD = 0.1
+  WINDOW = 50
+
+  def __init__(
+      self,
+      name: str,
+      initial_limit: int,
+      min_limit: int,
+      max_limit: int,
+      backoff_factor: float = 0.5,
+  ):
+    self.name = name
+    self.min_limit = max(1, min_limit)
+    self.max_limit = max(self.min_limit, max_limit)
+    self.backoff_factor = backoff_factor
+    self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+    self._in_flight = 0
+    self._cond = threading.Condition()
+    self._waiting = FairQueue()
+
+    self._latencies: deque[float] = deque(maxlen=self.WINDOW)
+    self._outcomes: deque[bool] = deque(maxlen=self.WINDOW)
+    self._last_backoff_at = 0.0
+
+    self.successes = 0
+    self.errors = 0
+    self.overloads = 0
+    self.backoff_events = 0
+
+  @property
+  def limit(self) -> int:
+    return int(self._limit)
+
+  @property
+  def in_flight(self) -> int:
+    return self._in_flight
+
+  def _has_slot(self) -> bool:
+    return self._in_flight < int(self._limit)
+
+  def _enqueue(self, flow: Optional[Flow]) -> Optional[int]:
+    # takes a slot right away if nobody is waiting, else returns a ticket
+    if self._has_slot() and not len(self._waiting):
+      self._in_flight += 1
+      return None
+    return self._waiting.push(flow)
+
+  def _try_take(self, ticket: int) -> bool:
+    if not (self._has_slot() and self._waiting.head() == ticket):
+      return False
+    self._waiting.pop()
+    self._in_flight += 1
+    # the next waiter may fit as well
+    self._cond.notify_all()
+    return True
+
+  def acquire(self, flow: Optional[Flow] = None) -> None:
+    with self._cond:
+      ticket = self._enqueue(flow)
+      if ticket is None:
+        return
+      while not self._try_take(ticket):
+        self._cond.wait()
+
+  def release(self, latency: float, ok: bool, overloaded: bool = False) -> None:
+    with self._cond:
+      self._in_flight = max(0, self._in_flight - 1)
+      self._outcomes.append(ok)
+
+      if overloaded:
+        self.overloads += 1
+        self._backoff()
+      elif not ok:
+        self.errors += 1
+      else:
+        self.successes += 1
+        self._latencies.append(latency)
+        if self._healthy(latency):
+          self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+
+      self._cond.notify_all()
+
+  def abandon(self) -> None:
+    # frees the slot of a call cancelled by its caller (e.g. the losing
+    # half of a hedged request), which says nothing about the provider
+    with self._cond:
+      self._in_flight = max(0, self._in_flight - 1)
+      self._cond.notify_all()
+
+  def _healthy(self, latency: float) -> bool:
+    error_rate = self._outcomes.count(False) / len(self._outcomes)
+    if error_rate > self.ERROR_RATE_THRESHOLD:
+      return False
+    baseline = min(self._latencies)
+    return latency <= max(baseline * self.LATENCY_TOLERANCE, self.LATENCY_SLACK_SECONDS)
+
+  def _backoff(self) -> None:
+    # all calls in flight when the provider pushed back see the same
+    # congestion event; only cut once per typical call duration
+    now = time.monotonic()
+    window = max(self._latencies) if self._latencies else 1.0
+    if now - self._last_backoff_at < window:
+      return
+    self._last_backoff_at = now
+
+    previous = self._limit
+    self._limit = max(float(self.min_limit), self._limit * self.backoff_factor)
+    self.backoff_events += 1
+    logger.warning(
+        "Backing off %s concurrency: %.1f -> %.1f (in flight: %d)",
+        self.name,
+        previous,
+        self._limit,
+        self._in_flight,
+    )
+
+  @contextmanager
+  def slot(self, flow: Optional[Flow] = None) -> Iterator[None]:
+    self.acquire(flow)
+    started = time.monotonic()
+    try:
+      yield
+    except BaseException as exc:
+      self.release(
+          time.monotonic() - started,
+          ok=False,
+          overloaded=is_overload_error(exc),
+      )
+      raise
+    else:
+      self.release(time.monotonic() - started, ok=True)
+
+  @asynccontextmanager
+  async def aslot(self, flow: Optional[Flow] = None) -> AsyncIterator[None]:
+    # same as slot() without blocking the event loop while waiting
+    with self._cond:
+      ticket = self._enqueue(flow)
+    if ticket is not None:
+      try:
+        while True:
+          with self._cond:
+            if self._try_take(ticket):
+              break
+          await asyncio.sleep(self.ASYNC_POLL_SECONDS)
+      except BaseException:
+        with self._cond:
+          self._waiting.remove(ticket)
+          self._cond.notify_all()
+        raise
+    started = time.monotonic()
+    try:
+      yield
+    except asyncio.CancelledError:
+      self.abandon()
+      raise
+    except BaseException as exc:
+      self.release(
+          time.monotonic() - started,
+          ok=False,
+          overloaded=is_overload_error(exc),
+      )
+      raise
+    else:
+      self.release(time.monotonic() - started, ok=True)
+
+  def snapshot(self) -> dict:
+    with self._cond:
+      return {
+          "name": self.name,
+          "limit": self.limit,
+          "in_flight": self._in_flight,
+          "waiting": len(self._waiting),
+          "min_limit": self.min_limit,
+          "max_limit": self.max_limit,
+          "successes": self.successes,
+          "errors": self.errors,
+          "overloads": self.overloads,
+          "backoff_events": self.backoff_events,
+          "baseline_latency_ms": (
+              round(min(self._latencies) * 1000) if self._latencies else None
+          ),
+      }
+
+
+_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_adaptive_limiter(model: str) -> AdaptiveConcurrencyLimiter:
+  '''
+  Process-wide limiter per model, shared by every workflow in the process.
+  '''
+  with _limiters_lock:
+    limiter = _limiters.get(model)
+    if limiter is None:
+      limiter = AdaptiveConcurrencyLimiter(
+          name=model,
+          initial_limit=settings.ADAPTIVE_CONCURRENCY_INITIAL,
+          min_limit=settings.ADAPTIVE_CONCURRENCY_MIN,
+          max_limit=settings.ADAPTIVE_CONCURRENCY_MAX,
+      )
+      _limiters[model] = limiter
+    return limiter
+
+
+def _limiter_metrics() -> list[dict]:
+  with _limiters_lock:
+    limiters = list(_limiters.values())
+  return [limiter.snapshot() for limiter in limiters]
+
+
+register_metrics_source("concurrency_limiters", _limiter_metrics)
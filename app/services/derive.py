@@ -0,0 +1,137 @@
+'''
+Local derivation of aspect ratio variants from one master render.
+
+A variant is produced by a saliency-weighted crop of the master, limited to
+MAX_CROP_FRACTION of the master's extent so the product is never cut away;
+whatever the crop cannot cover is padded with the brand color.
+'''
+from __future__ import annotations
+from io import BytesIO
+from typing import Optional, Tuple
+from PIL import Image, ImageColor, ImageFilter, ImageOps
+
+# the ratio the master is rendered at
+MASTER_ASPECT_RATIO = "1:1"
+
+# at most this fraction of the master's width/height is cropped away, the
+# rest of the ratio change is padding
+MAX_CROP_FRACTION = 0.25
+
+# saliency is computed on a downscaled copy of the master
+_SALIENCY_SIZE = 128
+# how strongly the crop window is pulled towards the center (0 = pure saliency)
+_CENTER_WEIGHT = 0.35
+
+_DEFAULT_PAD_COLOR = "#FFFFFF"
+
+
+def parse_aspect_ratio(aspect_ratio: str) -> float:
+  width, height = aspect_ratio.split(":", 1)
+  return float(width) / float(height)
+
+
+def _pad_color(color_hex: Optional[str]) -> Tuple[int, int, int]:
+  try:
+    return ImageColor.getrgb(color_hex or _DEFAULT_PAD_COLOR)[:3]  # type: ignore[return-value]
+  except ValueError:
+    return ImageColor.getrgb(_DEFAULT_PAD_COLOR)[:3]  # type: ignore[return-value]
+
+
+def _saliency_profile(img: Image.Image, axis: int) -> list[float]:
+  '''
+  Edge energy of the image summed along one axis (0 = per column,
+  1 = per row), on a downscaled grayscale copy. Cheap stand-in for a
+  saliency map: product shots have their detail where the product is.
+  '''
+  small = ImageOps.grayscale(img)
+  small.thumbnail((_SALIENCY_SIZE, _SALIENCY_SIZE))
+  edges = small.filter(ImageFilter.FIND_EDGES)
+  width, height = edges.size
+  pixels = edges.load()
+  # the filter reports the image border itself as an edge, skip it
+  xs, ys = range(1, width - 1), range(1, height - 1)
+  if axis == 0:
+    profile = [0] + [sum(pixels[x, y] for y in ys) for x in xs] + [0]  # type: ignore[index]
+  else:
+    profile = [0] + [sum(pixels[x, y] for x in xs) for y in ys] + [0]  # type: ignore[index]
+  floor = min(profile[1:-1], default=0)
+  return [max(0, value - floor) for value in profile]
+
+
+def _best_offset(profile: list[float], window: int) -> int:
+  '''
+  Start of the window (in profile units) with the highest center-weighted
+  energy.
+  '''
+  size = len(profile)
+  if window >= size:
+    return 0
+
+  total = sum(profile) or 1.0
+  centered = (size - window) / 2
+  best_offset, best_score = 0, float("-inf")
+  current = sum(profile[:window])
+  for offset in range(size - window + 1):
+    if offset:
+      current += profile[offset + window - 1] - profile[offset - 1]
+    distance = abs(offset - centered) / max(centered, 1)
+    score = (1 - _CENTER_WEIGHT) * current / total - _CENTER_WEIGHT * distance
+    if score > best_score:
+      best_offset, best_score = offset, score
+  return best_offset
+
+
+def _smart_crop(img: Image.Image, ratio: float) -> Image.Image:
+  width, height = img.size
+  if ratio > width / height:
+    # wider target: crop height
+    crop_height = max(round(width / ratio), round(height * (1 - MAX_CROP_FRACTION)))
+    if crop_height >= height:
+      return img
+    profile = _saliency_profile(img, axis=1)
+    scale = len(profile) / height
+    top = round(_best_offset(profile, max(1, round(crop_height * scale))) / scale)
+    top = min(top, height - crop_height)
+    return img.crop((0, top, width, top + crop_height))
+
+  crop_width = max(round(height * ratio), round(width * (1 - MAX_CROP_FRACTION)))
+  if crop_width >= width:
+    return img
+  profile = _saliency_profile(img, axis=0)
+  scale = len(profile) / width
+  left = round(_best_offset(profile, max(1, round(crop_width * scale))) / scale)
+  left = min(left, width - crop_width)
+  return img.crop((left, 0, left + crop_width, height))
+
+
+def derive_aspect_ratio(
+    master: bytes,
+    aspect_ratio: str,
+    pad_color_hex: Optional[str] = None,
+) -> Tuple[bytes, int, int]:
+  '''
+  Derive an aspect_ratio variant of a master image. The output keeps the
+  master's longer side. Returns (png bytes, width, height).
+  '''
+  ratio = parse_aspect_ratio(aspect_ratio)
+  img = Image.open(BytesIO(master)).convert("RGB")
+  long_side = max(img.size)
+
+  cropped = _smart_crop(img, ratio)
+
+  if ratio >= 1:
+    target = (long_side, round(long_side / ratio))
+  else:
+    target = (round(long_side * ratio), long_side)
+
+  # fit the crop inside the target and pad the remainder with brand color
+  fitted = ImageOps.contain(cropped, target, method=Image.Resampling.LANCZOS)
+  canvas = Image.new("RGB", target, _pad_color(pad_color_hex))
+  canvas.paste(
+      fitted,
+      ((target[0] - fitted.width) // 2, (target[1] - fitted.height) // 2),
+  )
+
+  buf = BytesIO()
+  canvas.save(buf, format="PNG")
+  return buf.getvalue(), canvas.width, canvas.height
@@ -3,6 +3,7 @@ from typing import List
 from zipfile import ZipFile, ZIP_DEFLATED
 from app.models.asset import Asset
 from app.models.campaign import Campaign
+from app.services.image_probe import probe_image
 from app.services.storage import download_fileobj
 
 def create_zip(campaign: Campaign, assets: List[Asset]) -> BytesIO:
@@ -51,13 +52,21 @@ def create_zip(campaign: Campaign, assets: List[Asset]) -> BytesIO:
         continue
 
       # Write image bytes into the ZIP
-      zipf.writestr(asset.s3_key, file_obj.getvalue())
+      data = file_obj.getvalue()
+      zipf.writestr(asset.s3_key, data)
+
+      # size and type from the image header; assets stored before their
+      # dimensions were recorded get them now (committed by the caller)
+      info = probe_image(data)
+      if info is not None and asset.width is None:
+        asset.width, asset.height = info.width, info.height
+      details = f", size={info.width}x{info.height}, content_type={info.content_type}" if info else ""
 
       # Record in manifest
       manifest_lines.append(
           f"- asset_id={asset.id}, product_id={asset.product_id}, "
           f"aspect_ratio={asset.aspect_ratio}, s3_key={asset.s3_key}, "
-          f"zip_path={asset.s3_key}"
+          f"zip_path={asset.s3_key}{details}"
       )
 
     # Add a text file with campaign + asset info
@@ -67,6 +76,10 @@ def create_zip(campaign: Campaign, assets: List[Asset]) -> BytesIO:
     # add post content
     zipf.writestr(post_txt_zip_path, post_content)
 
+    # and one post per target locale
+    for locale, message in (campaign.localized_messages_json or {}).items():
+      zipf.writestr(f"{campaign_folder}/post_{locale.replace('/', '_')}.txt", message)
+
   zip_buffer.seek(0)
 
   return zip_buffer
\ No newline at end of file
@@ -0,0 +1,245 @@
+'''
+Output encoding of creatives: fit to the render profile's pixel size and
+encode as optimized PNG, JPEG or WebP with the profile's quality,
+compression level and metadata settings. Renditions (smaller sizes, WebP
+and AVIF variants) are encoded here too, all from one decode.
+
+Encoding is CPU bound and Pillow holds the GIL for much of it, so it runs
+in a pool of ENCODING_PROCESSES worker processes; the calling thread (or
+event loop) only waits. Only bytes and plain options cross the process
+boundary, keep this module's imports light: pool processes are spawned
+and import it fresh.
+'''
+from __future__ import annotations
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple
+from PIL import Image, ImageOps, features
+from app.core.config import settings
+from app.services.image_hash import image_hash, image_hash_bytes
+from app.services.image_probe import CONTENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+# defaults when the profile leaves them unset
+DEFAULT_JPEG_QUALITY = 90
+DEFAULT_WEBP_QUALITY = 85
+DEFAULT_PNG_COMPRESSION = 6
+# WebP method (speed/size trade-off), Pillow's default
+DEFAULT_WEBP_METHOD = 4
+MAX_WEBP_METHOD = 6
+DEFAULT_AVIF_QUALITY = 60
+
+EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp", "AVIF": "avif"}
+
+
+def format_supported(output_format: str) -> bool:
+  # AVIF needs a Pillow built with libavif
+  return output_format != "AVIF" or features.check("avif")
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+  '''
+  output_format is a Pillow format name (PNG, JPEG, WEBP). quality is
+  used by JPEG, WebP (100 makes WebP lossless) and AVIF; compression_level
+  is the zlib level of PNG and the method of WebP.
+  '''
+  output_format: str = "PNG"
+  quality: Optional[int] = None
+  compression_level: Optional[int] = None
+  strip_metadata: bool = True
+
+  @property
+  def content_type(self) -> str:
+    return CONTENT_TYPES[self.output_format]
+
+  @property
+  def extension(self) -> str:
+    return EXTENSIONS[self.output_format]
+
+  def cache_key_part(self) -> Optional[str]:
+    # None for the defaults, so their generation cache keys don't change
+    parts = []
+    if self.quality is not None:
+      parts.append(f"q{self.quality}")
+    if self.compression_level is not None:
+      parts.append(f"c{self.compression_level}")
+    if not self.strip_metadata:
+      parts.append("meta")
+    return "-".join(parts) or None
+
+
+@dataclass
+class EncodedImage:
+  content: bytes
+  width: int
+  height: int
+  content_type: str
+  # perceptual hash (app/services/image_hash.py), set by encode_image
+  image_hash: Optional[int] = None
+
+
+def _save_args(img: Image.Image, options: EncodeOptions, source: Image.Image) -> dict:
+  args: dict = {}
+  if options.output_format == "PNG":
+    args["optimize"] = True
+    args["compress_level"] = (
+        DEFAULT_PNG_COMPRESSION if options.compression_level is None else options.compression_level
+    )
+  elif options.output_format == "JPEG":
+    quality = DEFAULT_JPEG_QUALITY if options.quality is None else options.quality
+    args.update(quality=quality, optimize=True, progressive=True)
+    if quality >= 90:
+      # no chroma subsampling at high quality, keeps brand colors and text crisp
+      args["subsampling"] = 0
+  elif options.output_format == "AVIF":
+    args["quality"] = DEFAULT_AVIF_QUALITY if options.quality is None else options.quality
+  else:
+    quality = DEFAULT_WEBP_QUALITY if options.quality is None else options.quality
+    method = DEFAULT_WEBP_METHOD if options.compression_level is None else options.compression_level
+    args.update(quality=quality, method=min(method, MAX_WEBP_METHOD), lossless=quality >= 100)
+
+  if not options.strip_metadata:
+    for key in ("exif", "icc_profile"):
+      if source.info.get(key):
+        args[key] = source.info[key]
+  return args
+
+
+def encode_image(
+    content: bytes,
+    size: Optional[Tuple[int, int]],
+    options: EncodeOptions,
+) -> EncodedImage:
+  '''
+  The image scaled to cover size (the overflow cropped evenly from both
+  sides; kept as is when size is None) and encoded per options, with its
+  perceptual hash. Runs in the pool processes.
+  '''
+  source = Image.open(BytesIO(content))
+  img = ImageOps.exif_transpose(source) if options.strip_metadata else source
+  if size is not None and img.size != tuple(size):
+    img = ImageOps.fit(img, tuple(size), method=Image.Resampling.LANCZOS)
+  encoded = _save(img, options, source)
+  encoded.image_hash = image_hash(img)
+  return encoded
+
+
+def _save(img: Image.Image, options: EncodeOptions, source: Image.Image) -> EncodedImage:
+  if options.output_format == "JPEG" and img.mode != "RGB":
+    img = img.convert("RGB")
+  elif img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+  buf = BytesIO()
+  img.save(buf, format=options.output_format, **_save_args(img, options, source))
+  return EncodedImage(
+      content=buf.getvalue(),
+      width=img.width,
+      height=img.height,
+      content_type=options.content_type,
+  )
+
+
+def encode_renditions(
+    content: bytes,
+    targets: Sequence[Tuple[Optional[int], EncodeOptions]],
+) -> List[EncodedImage]:
+  '''
+  One encoded image per (max_side, options) target: the image scaled down
+  to fit max_side (never up; None keeps its size). Decoded once, each
+  size scaled once for all of its formats. Runs in the pool processes.
+  '''
+  source = Image.open(BytesIO(content))
+  img = ImageOps.exif_transpose(source)
+  scaled: Dict[Optional[int], Image.Image] = {None: img}
+  # largest first, so smaller sizes scale down from an already reduced image
+  for max_side in sorted({side for side, _ in targets if side is not None}, reverse=True):
+    smaller = min(
+        (scaled[side] for side in scaled if side is None or side >= max_side),
+        key=lambda candidate: max(candidate.size),
+    )
+    if max(smaller.size) > max_side:
+      smaller = smaller.copy()
+      smaller.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    scaled[max_side] = smaller
+  return [_save(scaled[max_side], options, source) for max_side, options in targets]
+
+
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[Executor]:
+  global _pool
+  if settings.ENCODING_PROCESSES <= 0:
+    return None
+  with _pool_lock:
+    if _pool is None:
+      # spawned, not forked: the workers are multi-threaded
+      _pool = ProcessPoolExecutor(
+          max_workers=settings.ENCODING_PROCESSES,
+          mp_context=multiprocessing.get_context("spawn"),
+      )
+    return _pool
+
+
+def encode(
+    content: bytes,
+    size: Optional[Tuple[int, int]],
+    options: EncodeOptions,
+) -> EncodedImage:
+  '''
+  encode_image in the process pool; blocks the calling thread until done.
+  In the calling thread when ENCODING_PROCESSES is 0.
+  '''
+  pool = _get_pool()
+  if pool is None:
+    return encode_image(content, size, options)
+  return pool.submit(encode_image, content, size, options).result()
+
+
+def hash_image(content: bytes) -> int:
+  # image_hash_bytes in the process pool
+  pool = _get_pool()
+  if pool is None:
+    return image_hash_bytes(content)
+  return pool.submit(image_hash_bytes, content).result()
+
+
+def encode_many(
+    content: bytes,
+    targets: Sequence[Tuple[Optional[int], EncodeOptions]],
+) -> List[EncodedImage]:
+  # encode_renditions in the process pool
+  pool = _get_pool()
+  if pool is None:
+    return encode_renditions(content, targets)
+  return pool.submit(encode_renditions, content, list(targets)).result()
+
+
+async def aencode_many(
+    content: bytes,
+    targets: Sequence[Tuple[Optional[int], EncodeOptions]],
+) -> List[EncodedImage]:
+  pool = _get_pool()
+  if pool is None:
+    return await asyncio.to_thread(encode_renditions, content, targets)
+  return await asyncio.wrap_future(pool.submit(encode_renditions, content, list(targets)))
+
+
+async def aencode(
+    content: bytes,
+    size: Optional[Tuple[int, int]],
+    options: EncodeOptions,
+) -> EncodedImage:
+  pool = _get_pool()
+  if pool is None:
+    return await asyncio.to_thread(encode_image, content, size, options)
+  return await asyncio.wrap_future(pool.submit(encode_image, content, size, options))
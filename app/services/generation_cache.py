@@ -0,0 +1,147 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.asset import Asset, AssetType
+from app.services.image_hash import to_unsigned
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedGeneration:
+  asset_id: int
+  s3_key: str
+  width: Optional[int]
+  height: Optional[int]
+  model_name: Optional[str]
+  prompt: Optional[str]
+  image_hash: Optional[int] = None
+
+
+def generation_cache_key(
+    prompt: str,
+    model: str,
+    aspect_ratio: str,
+    images: Sequence[bytes] | None = None,
+    size: Tuple[int, int] | None = None,
+    output_format: str | None = None,
+    encoding: str | None = None,
+    references: Sequence[str] | None = None,
+) -> str:
+  '''
+  Content address of a generation: sha256 over the normalized inputs.
+  Whitespace in the prompt is collapsed so that formatting-only changes to
+  prompt templates still hit; reference images are included by digest,
+  stored reference images (references) by object key. The output size,
+  format and non-default encoder settings of the render profile are part
+  of the key when given.
+  '''
+  normalized = {
+      "prompt": " ".join(prompt.split()),
+      "model": model,
+      "aspect_ratio": aspect_ratio,
+      "images": [hashlib.sha256(image).hexdigest() for image in images or []],
+  }
+  if size is not None:
+    normalized["size"] = f"{size[0]}x{size[1]}"
+  if output_format is not None:
+    normalized["output_format"] = output_format
+  if encoding is not None:
+    normalized["encoding"] = encoding
+  if references:
+    normalized["references"] = list(references)
+  payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+  '''
+  Finds an already generated creative for a cache key.
+
+  Generated Asset rows record their cache_key, so a lookup is a metadata
+  query and a hit only costs a new Asset row pointing at the existing S3
+  object. Recent lookups are kept in a size-bounded in-process LRU so
+  repeated keys don't hit the database either. Entries older than the TTL
+  are treated as misses in both places.
+  '''
+
+  def __init__(self, ttl_seconds: int, max_entries: int):
+    self.ttl_seconds = ttl_seconds
+    self.max_entries = max_entries
+    self._lock = threading.Lock()
+    # key -> (stored_at monotonic, entry)
+    self._entries: OrderedDict[str, tuple[float, CachedGeneration]] = OrderedDict()
+
+  def _get_local(self, key: str) -> Optional[CachedGeneration]:
+    with self._lock:
+      item = self._entries.get(key)
+      if item is None:
+        return None
+      stored_at, entry = item
+      if time.monotonic() - stored_at > self.ttl_seconds:
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return entry
+
+  def store(self, key: str, entry: CachedGeneration, age_seconds: float = 0.0) -> None:
+    # age_seconds: how old the creative already is, so it expires on time
+    if self.max_entries <= 0:
+      return
+    with self._lock:
+      self._entries[key] = (time.monotonic() - max(age_seconds, 0.0), entry)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def lookup(self, db: Session, key: str) -> Optional[CachedGeneration]:
+    entry = self._get_local(key)
+    if entry is not None:
+      return entry
+
+    cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+    asset = (
+        db.query(Asset)
+        .filter(
+            Asset.cache_key == key,
+            Asset.type == AssetType.CREATIVE,
+            Asset.created_at >= cutoff,
+        )
+        .order_by(Asset.created_at.desc())
+        .first()
+    )
+    if asset is None:
+      return None
+
+    metadata = asset.gen_metadata_json or {}
+    entry = CachedGeneration(
+        asset_id=asset.id,
+        s3_key=asset.s3_key,
+        width=asset.width,
+        height=asset.height,
+        model_name=metadata.get("model_name"),
+        prompt=metadata.get("prompt"),
+        image_hash=to_unsigned(asset.image_hash) if asset.image_hash is not None else None,
+    )
+    created_at = asset.created_at
+    now = datetime.now(created_at.tzinfo) if created_at.tzinfo else datetime.utcnow()
+    self.store(key, entry, (now - created_at).total_seconds())
+    return entry
+
+
+@lru_cache
+def get_generation_cache() -> GenerationCache:
+  return GenerationCache(
+      ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS,
+      max_entries=settings.GENERATION_CACHE_MAX_ENTRIES,
+  )
@@ -0,0 +1,303 @@
+'''
+Recorded generator profiles: per model call latencies, error codes and
+payload sizes.
+
+Workers record every real model call (record_call in the provider
+generators) and, with GENERATOR_RECORD_PATH set, write the samples out as
+a JSON profile:
+
+  {
+    "recorded_at": "2026-01-01T00:00:00",
+    "models": {
+      "gemini-2.5-flash-image": {
+        "calls": 1200,
+        "latency_ms": [8123, 9410, ...],
+        "errors": {"503": 31, "429": 4, "timeout": 1, "other": 2},
+        "error_latency_ms": [412, 388, ...],
+        "payload_bytes": [1523114, 1498032, ...]
+      }
+    }
+  }
+
+With GENERATOR_BACKEND=simulated the simulated generators replay such a
+profile (SIMULATED_GENERATOR_PROFILE) instead of calling the provider:
+latencies, errors and payload sizes are drawn from the recorded samples.
+'''
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.services.metrics import register_metrics_source
+
+logger = logging.getLogger(__name__)
+
+# profile entry used for models the profile has no samples of
+ANY_MODEL = "*"
+
+
+class SimulatedProviderError(RuntimeError):
+  '''
+  A recorded provider error replayed; carries its HTTP code like the
+  provider client's errors do.
+  '''
+
+  def __init__(self, model: str, code: int):
+    super().__init__(f"{code} simulated error from {model}")
+    self.code = code
+
+
+def _error_kind(exc: BaseException) -> str:
+  if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+    return "timeout"
+  code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+  return str(code) if isinstance(code, int) else "other"
+
+
+# --- replay ------------------------------------------------------------------
+
+@dataclass
+class ModelProfile:
+  model: str
+  calls: int
+  latency_ms: List[float]
+  errors: Dict[str, int] = field(default_factory=dict)
+  error_latency_ms: List[float] = field(default_factory=list)
+  payload_bytes: List[int] = field(default_factory=list)
+
+  @classmethod
+  def from_json(cls, model: str, data: dict) -> "ModelProfile":
+    latency_ms = [float(value) for value in data.get("latency_ms", [])]
+    if not latency_ms:
+      raise ValueError(f"Generator profile of {model} has no latency_ms samples")
+    return cls(
+        model=model,
+        calls=int(data.get("calls", len(latency_ms))),
+        latency_ms=latency_ms,
+        errors={str(kind): int(count) for kind, count in data.get("errors", {}).items()},
+        error_latency_ms=[float(value) for value in data.get("error_latency_ms", [])],
+        payload_bytes=[int(value) for value in data.get("payload_bytes", [])],
+    )
+
+  def error_rate(self) -> float:
+    return min(1.0, sum(self.errors.values()) / self.calls) if self.calls else 0.0
+
+  def sample_error(self, rng: random.Random) -> Optional[str]:
+    # the kind of error this call fails with, None for a success
+    if not self.errors or rng.random() >= self.error_rate():
+      return None
+    kinds = list(self.errors)
+    return rng.choices(kinds, weights=[self.errors[kind] for kind in kinds])[0]
+
+  def sample_latency(self, rng: random.Random, error: Optional[str]) -> float:
+    # seconds, scaled by SIMULATED_LATENCY_SCALE
+    samples = self.error_latency_ms if error and self.error_latency_ms else self.latency_ms
+    return rng.choice(samples) / 1000 * settings.SIMULATED_LATENCY_SCALE
+
+  def sample_payload(self, rng: random.Random, default: int) -> int:
+    return rng.choice(self.payload_bytes) if self.payload_bytes else default
+
+  def raise_error(self, error: str) -> None:
+    if error == "timeout":
+      raise TimeoutError(f"simulated timeout from {self.model}")
+    if error.isdigit():
+      raise SimulatedProviderError(self.model, int(error))
+    raise RuntimeError(f"simulated error from {self.model}")
+
+
+class SimulatedCall:
+  '''
+  The outcome of one replayed call, drawn up front: how long it takes and
+  whether it fails.
+  '''
+
+  def __init__(self, profile: ModelProfile, rng: random.Random):
+    self.profile = profile
+    self.error = profile.sample_error(rng)
+    self.seconds = profile.sample_latency(rng, self.error)
+
+  def play(self) -> None:
+    time.sleep(self.seconds)
+    if self.error:
+      self.profile.raise_error(self.error)
+
+  async def aplay(self) -> None:
+    await asyncio.sleep(self.seconds)
+    if self.error:
+      self.profile.raise_error(self.error)
+
+
+@lru_cache
+def load_generator_profile(path: str) -> Dict[str, ModelProfile]:
+  with open(path) as f:
+    data = json.load(f)
+  return {
+      model: ModelProfile.from_json(model, entry)
+      for model, entry in data.get("models", {}).items()
+  }
+
+
+def model_profile(model: str) -> ModelProfile:
+  '''
+  The recorded profile of model from SIMULATED_GENERATOR_PROFILE, else its
+  "*" entry.
+  '''
+  path = settings.SIMULATED_GENERATOR_PROFILE
+  if not path:
+    raise ValueError("GENERATOR_BACKEND=simulated needs SIMULATED_GENERATOR_PROFILE")
+  profiles = load_generator_profile(path)
+  profile = profiles.get(model) or profiles.get(ANY_MODEL)
+  if profile is None:
+    raise ValueError(f"Generator profile {path} has no samples for {model} (nor {ANY_MODEL!r})")
+  return profile
+
+
+def simulation_rng() -> random.Random:
+  return random.Random(settings.SIMULATED_GENERATOR_SEED)
+
+
+# --- recording ---------------------------------------------------------------
+
+class _Reservoir:
+  '''
+  Uniform sample of at most `size` values out of all values added.
+  '''
+
+  def __init__(self, size: int, rng: random.Random):
+    self.size = size
+    self.rng = rng
+    self.seen = 0
+    self.values: List[float] = []
+
+  def add(self, value: float) -> None:
+    self.seen += 1
+    if len(self.values) < self.size:
+      self.values.append(value)
+      return
+    index = self.rng.randrange(self.seen)
+    if index < self.size:
+      self.values[index] = value
+
+
+class _ModelRecord:
+  def __init__(self, size: int, rng: random.Random):
+    self.calls = 0
+    self.errors: Counter[str] = Counter()
+    self.latency_ms = _Reservoir(size, rng)
+    self.error_latency_ms = _Reservoir(size, rng)
+    self.payload_bytes = _Reservoir(size, rng)
+
+
+class RecordedCall:
+  # set by the generator once the response is in
+  payload_bytes: Optional[int] = None
+
+
+class CallRecorder:
+  '''
+  Samples of the real model calls made by this process, per model.
+  '''
+
+  def __init__(self, max_samples: int):
+    self.max_samples = max(1, max_samples)
+    self._rng = random.Random()
+    self._lock = threading.Lock()
+    self._models: Dict[str, _ModelRecord] = {}
+
+  def _record(self, model: str) -> _ModelRecord:
+    record = self._models.get(model)
+    if record is None:
+      record = self._models[model] = _ModelRecord(self.max_samples, self._rng)
+    return record
+
+  def success(self, model: str, seconds: float, payload_bytes: Optional[int]) -> None:
+    with self._lock:
+      record = self._record(model)
+      record.calls += 1
+      record.latency_ms.add(round(seconds * 1000, 1))
+      if payload_bytes is not None:
+        record.payload_bytes.add(payload_bytes)
+
+  def error(self, model: str, seconds: float, kind: str) -> None:
+    with self._lock:
+      record = self._record(model)
+      record.calls += 1
+      record.errors[kind] += 1
+      record.error_latency_ms.add(round(seconds * 1000, 1))
+
+  def profile(self) -> dict:
+    with self._lock:
+      return {
+          "recorded_at": datetime.utcnow().isoformat(),
+          "models": {
+              model: {
+                  "calls": record.calls,
+                  "latency_ms": list(record.latency_ms.values),
+                  "errors": dict(record.errors),
+                  "error_latency_ms": list(record.error_latency_ms.values),
+                  "payload_bytes": [int(value) for value in record.payload_bytes.values],
+              }
+              for model, record in self._models.items()
+          },
+      }
+
+  def snapshot(self) -> List[dict]:
+    with self._lock:
+      return [
+          {
+              "model": model,
+              "calls": record.calls,
+              "errors": dict(record.errors),
+              "latency_samples": len(record.latency_ms.values),
+          }
+          for model, record in self._models.items()
+      ]
+
+
+@lru_cache
+def get_call_recorder() -> CallRecorder:
+  return CallRecorder(settings.GENERATOR_RECORD_MAX_SAMPLES)
+
+
+@contextmanager
+def record_call(model: str) -> Iterator[RecordedCall]:
+  '''
+  Records the latency and outcome of one provider call; the caller sets
+  payload_bytes on the yielded call once it has the response.
+  '''
+  call = RecordedCall()
+  started = time.monotonic()
+  try:
+    yield call
+  except BaseException as exc:
+    get_call_recorder().error(model, time.monotonic() - started, _error_kind(exc))
+    raise
+  else:
+    get_call_recorder().success(model, time.monotonic() - started, call.payload_bytes)
+
+
+def save_recorded_profile(path: str) -> None:
+  '''
+  Write the calls recorded so far as a generator profile, replacing the
+  file atomically. Nothing is written before the first call.
+  '''
+  profile = get_call_recorder().profile()
+  if not profile["models"]:
+    return
+  tmp = f"{path}.tmp"
+  with open(tmp, "w") as f:
+    json.dump(profile, f)
+  os.replace(tmp, path)
+
+
+register_metrics_source("recorded_generator_calls", lambda: get_call_recorder().snapshot())
@@ -0,0 +1,249 @@
+'''
+Hedged image generation requests.
+
+A call still running after the model's rolling p90 latency gets a
+duplicate request, and whichever finishes first wins. Hedges are drawn from
+a per-workflow budget so a slow provider cannot double the cost of a run.
+'''
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, ContextManager, Dict, Optional, TypeVar
+from app.core.config import settings
+from app.services.metrics import register_metrics_source
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+  '''
+  Rolling window of successful call latencies of one model.
+  '''
+
+  def __init__(self, window: int, min_samples: int):
+    self.min_samples = min_samples
+    self._latencies: deque[float] = deque(maxlen=window)
+    self._lock = threading.Lock()
+
+  def record(self, latency: float) -> None:
+    with self._lock:
+      self._latencies.append(latency)
+
+  def percentile(self, q: float) -> Optional[float]:
+    '''
+    None until min_samples calls have been seen; no hedging before that.
+    '''
+    with self._lock:
+      if len(self._latencies) < self.min_samples:
+        return None
+      ordered = sorted(self._latencies)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+  '''
+  Number of hedges one workflow may fire.
+  '''
+
+  def __init__(self, limit: int):
+    self.limit = limit
+    self.spent = 0
+    self._lock = threading.Lock()
+
+  @classmethod
+  def for_tasks(cls, task_count: int) -> "HedgeBudget":
+    return cls(max(1, math.ceil(task_count * settings.HEDGE_BUDGET_FRACTION)))
+
+  def try_spend(self) -> bool:
+    with self._lock:
+      if self.spent >= self.limit:
+        return False
+      self.spent += 1
+      return True
+
+
+class HedgeStats:
+  def __init__(self, model: str, tracker: LatencyTracker):
+    self.model = model
+    self.tracker = tracker
+    self._lock = threading.Lock()
+    self.calls = 0
+    # hedge fired, and it finished first / the primary finished first anyway
+    self.fired = 0
+    self.won = 0
+    self.wasted = 0
+    # a hedge was due but the workflow's budget was spent
+    self.budget_exhausted = 0
+
+  def incr(self, **counts: int) -> None:
+    with self._lock:
+      for name, value in counts.items():
+        setattr(self, name, getattr(self, name) + value)
+
+  def snapshot(self) -> dict:
+    threshold = self.tracker.percentile(settings.HEDGE_LATENCY_PERCENTILE)
+    with self._lock:
+      return {
+          "model": self.model,
+          "calls": self.calls,
+          "hedges_fired": self.fired,
+          "hedges_won": self.won,
+          "hedges_wasted": self.wasted,
+          "budget_exhausted": self.budget_exhausted,
+          "hedge_after_ms": round(threshold * 1000) if threshold is not None else None,
+      }
+
+
+_stats: Dict[str, HedgeStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_hedge_stats(model: str) -> HedgeStats:
+  '''
+  Process-wide latency window and counters per model.
+  '''
+  with _stats_lock:
+    stats = _stats.get(model)
+    if stats is None:
+      tracker = LatencyTracker(
+          window=settings.HEDGE_LATENCY_WINDOW,
+          min_samples=settings.HEDGE_MIN_SAMPLES,
+      )
+      stats = HedgeStats(model, tracker)
+      _stats[model] = stats
+    return stats
+
+
+def _hedge_metrics() -> list[dict]:
+  with _stats_lock:
+    stats = list(_stats.values())
+  return [s.snapshot() for s in stats]
+
+
+register_metrics_source("hedging", _hedge_metrics)
+
+
+def _spawn(fn: Callable[[], T]) -> Future[T]:
+  # a blocking call can't be abandoned, so each attempt gets its own thread
+  # and the loser finishes in the background
+  future: Future[T] = Future()
+
+  def run() -> None:
+    if not future.set_running_or_notify_cancel():
+      return
+    try:
+      future.set_result(fn())
+    except BaseException as exc:
+      future.set_exception(exc)
+
+  threading.Thread(target=run, name="hedged-call", daemon=True).start()
+  return future
+
+
+class Hedger:
+  '''
+  Runs calls of one model with hedging against the given budget.
+  '''
+
+  def __init__(self, stats: HedgeStats, budget: HedgeBudget):
+    self.stats = stats
+    self.budget = budget
+
+  def _timed(self, fn: Callable[[], T], slot: Optional[Callable[[], ContextManager]]) -> Callable[[], T]:
+    # each attempt holds its own slot (a hedge is one more call in flight);
+    # timed inside it, so the threshold is learnt from service time
+    def call() -> T:
+      with slot() if slot is not None else nullcontext():
+        started = time.monotonic()
+        result = fn()
+        self.stats.tracker.record(time.monotonic() - started)
+        return result
+    return call
+
+  def _begin(self) -> Optional[float]:
+    # seconds after which the call is hedged, None to not hedge it
+    self.stats.incr(calls=1)
+    return self.stats.tracker.percentile(settings.HEDGE_LATENCY_PERCENTILE)
+
+  def _fire(self) -> bool:
+    if not self.budget.try_spend():
+      self.stats.incr(budget_exhausted=1)
+      return False
+    self.stats.incr(fired=1)
+    logger.info(
+        "Hedging slow %s call (budget %d/%d)",
+        self.stats.model,
+        self.budget.spent,
+        self.budget.limit,
+    )
+    return True
+
+  def call(self, fn: Callable[[], T], slot: Optional[Callable[[], ContextManager]] = None) -> T:
+    hedge_after = self._begin()
+    if hedge_after is None:
+      return self._timed(fn, slot)()
+
+    primary = _spawn(self._timed(fn, slot))
+    done, _ = wait([primary], timeout=hedge_after)
+    if done or not self._fire():
+      return primary.result()
+
+    hedge = _spawn(self._timed(fn, slot))
+    done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+    first = primary if primary in done else hedge
+    if first.exception() is not None:
+      # the first to finish failed, the other one may still succeed
+      other = hedge if first is primary else primary
+      if other.exception() is None:
+        first = other
+    self.stats.incr(won=int(first is hedge), wasted=int(first is primary))
+    return first.result()
+
+  async def acall(
+      self,
+      fn: Callable[[], Awaitable[T]],
+      slot: Optional[Callable[[], AsyncContextManager]] = None,
+  ) -> T:
+    hedge_after = self._begin()
+
+    async def timed() -> T:
+      async with slot() if slot is not None else nullcontext():
+        started = time.monotonic()
+        result = await fn()
+        self.stats.tracker.record(time.monotonic() - started)
+        return result
+
+    if hedge_after is None:
+      return await timed()
+
+    primary = asyncio.ensure_future(timed())
+    hedge: Optional[asyncio.Future[T]] = None
+    try:
+      done, _ = await asyncio.wait([primary], timeout=hedge_after)
+      if done or not self._fire():
+        return await primary
+
+      hedge = asyncio.ensure_future(timed())
+      done, _ = await asyncio.wait([primary, hedge], return_when=asyncio.FIRST_COMPLETED)
+      first = primary if primary in done else hedge
+      if first.exception() is not None:
+        # the first to finish failed, the other one may still succeed
+        other = hedge if first is primary else primary
+        await asyncio.wait([other])
+        if other.exception() is None:
+          first = other
+      self.stats.incr(won=int(first is hedge), wasted=int(first is primary))
+      return first.result()
+    finally:
+      # unlike threads, the losing request can actually be abandoned
+      for task in (primary, hedge):
+        if task is not None and not task.done():
+          task.cancel()
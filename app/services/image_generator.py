@@ -1,11 +1,22 @@
 from __future__ import annotations
+import asyncio
+import math
 import os
 from typing import Optional, Protocol
 from dataclasses import dataclass
 from PIL import Image, ImageDraw, ImageFont
+from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
 from google import genai
 from google.genai import types
+from app.core.config import settings
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker
+from app.services.concurrency import AdaptiveConcurrencyLimiter, get_adaptive_limiter
+from app.services.generator_profiles import SimulatedCall, model_profile, record_call, simulation_rng
+from app.services.hedging import HedgeBudget, Hedger, get_hedge_stats
+from app.services.image_probe import probe_image
+from app.services.rate_limiter import arate_limited, rate_limited
+from app.services.scheduling import Flow
 
 
 @dataclass
@@ -14,26 +25,58 @@ class ImageResult:
   width: int
   height: int
   model_name: str
+  content_type: str = "image/png"
+  # set when a fallback tier rendered the image instead of the primary model
+  fallback_model: Optional[str] = None
+  # perceptual hash, set once fitted to the render profile
+  image_hash: Optional[int] = None
 
 
 class ImageGenerator(Protocol):
-  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None) -> ImageResult:
+  # model identifier, part of the generation cache key
+  model: str
+
+  # size is the (width, height) the render profile wants; a generator
+  # renders at or near it, the workflow fits the result exactly
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
     raise NotImplementedError(
         "Subclasses should implement the 'generate' method.")
 
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    raise NotImplementedError(
+        "Subclasses should implement the 'agenerate' method.")
+
+
+def _ratio(aspect_ratio: str) -> float:
+  width, height = aspect_ratio.split(":", 1)
+  return float(width) / float(height)
+
+
+def _default_size(aspect_ratio: str) -> tuple[int, int]:
+  # 1024 on the long side
+  ratio = _ratio(aspect_ratio)
+  return (1024, round(1024 / ratio)) if ratio >= 1 else (round(1024 * ratio), 1024)
+
 
 class DummyImageGenerator:
-  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None) -> ImageResult:
-    # Map aspect ratio string to a basic size
-    if aspect_ratio == "1:1":
-      size = (1024, 1024)
-    elif aspect_ratio == "9:16":
-      size = (768, 1365)
-    elif aspect_ratio == "16:9":
-      size = (1365, 768)
-    else:
-      # default square
-      size = (1024, 1024)
+  model = "dummy"
+
+  def __init__(self, model: Optional[str] = None):
+    if model is not None:
+      self.model = model
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    with rate_limited(self.model):
+      return self._generate(prompt, aspect_ratio, size)
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    async with arate_limited(self.model):
+      # rendering is cpu work, keep it off the event loop
+      return await asyncio.to_thread(self._generate, prompt, aspect_ratio, size)
+
+  def _generate(self, prompt: str, aspect_ratio: str, size: tuple[int, int] | None) -> ImageResult:
+    if size is None:
+      size = _default_size(aspect_ratio)
 
     img = Image.new("RGB", size, color=(40, 40, 60))
     draw = ImageDraw.Draw(img)
@@ -60,26 +103,47 @@ class DummyImageGenerator:
 
 
 class GoogleGeminiNanoBananaGenerator:
-  def __init__(self):
+  model = "gemini-2.5-flash-image"
+  # ratios the model renders at; others are rendered at the closest one
+  # and cropped to the profile's size by the workflow
+  aspect_ratios = ("1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9")
+
+  def __init__(self, model: Optional[str] = None):
+    if model is not None:
+      self.model = model
     self.client = genai.Client()
-  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None) -> ImageResult:
-    # add reference images to call if they exist
-    if images is not None:
-      images = [Image.open(BytesIO(image)) for image in images]
-      contents = images + [prompt]
-    else:
-      contents = [prompt]
-    response = self.client.models.generate_content(
-        model="gemini-2.5-flash-image",
-        contents=contents, # type: ignore
-        config=types.GenerateContentConfig(
-            response_modalities=["Image"],
-            image_config=types.ImageConfig(
-                aspect_ratio=aspect_ratio,
-            ),
-        )
+  def _contents(self, prompt: str, images: list | None) -> list:
+    # add reference images to call if they exist; sent as the encoded
+    # bytes, typed from their header rather than decoded
+    if images:
+      parts = []
+      for image in images:
+        info = probe_image(image)
+        if info is None:
+          raise ValueError("Reference image is not a PNG, JPEG or WebP image")
+        parts.append(types.Part.from_bytes(data=image, mime_type=info.content_type))
+      return parts + [prompt]
+    return [prompt]
+
+  def _aspect_ratio(self, aspect_ratio: str) -> str:
+    if aspect_ratio in self.aspect_ratios:
+      return aspect_ratio
+    wanted = math.log(_ratio(aspect_ratio))
+    return min(self.aspect_ratios, key=lambda ratio: abs(math.log(_ratio(ratio)) - wanted))
+
+  def _config(self, aspect_ratio: str, size: tuple[int, int] | None) -> types.GenerateContentConfig:
+    # the default 1K output covers sizes up to 1024 on the long side
+    long_side = max(size) if size else 0
+    image_size = None if long_side <= 1024 else "2K" if long_side <= 2048 else "4K"
+    return types.GenerateContentConfig(
+        response_modalities=["Image"],
+        image_config=types.ImageConfig(
+            aspect_ratio=self._aspect_ratio(aspect_ratio),
+            image_size=image_size,
+        ),
     )
 
+  def _result(self, response) -> ImageResult:
     image_parts = [
         part.inline_data.data  # type: ignore
         for part in response.candidates[0].content.parts  # type: ignore
@@ -91,16 +155,273 @@ class GoogleGeminiNanoBananaGenerator:
 
     image_bytes = bytes(image_parts[0])  # type: ignore
 
-    img = Image.open(BytesIO(image_bytes))  # type: ignore
-    width, height = img.size
+    # size and type from the header, the pixels are decoded once when encoding
+    info = probe_image(image_bytes)
+    if info is None:
+      raise RuntimeError("Gemini returned an image that is not PNG, JPEG or WebP.")
+
+    return ImageResult(
+        content=image_bytes,
+        width=info.width,
+        height=info.height,
+        model_name="gemini",
+        content_type=info.content_type,
+    )
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    contents = self._contents(prompt, images)
+    with rate_limited(self.model), record_call(self.model) as call:
+      response = self.client.models.generate_content(
+          model=self.model,
+          contents=contents, # type: ignore
+          config=self._config(aspect_ratio, size),
+      )
+      result = self._result(response)
+      call.payload_bytes = len(result.content)
+    return result
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    contents = self._contents(prompt, images)
+    async with arate_limited(self.model):
+      with record_call(self.model) as call:
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=contents, # type: ignore
+            config=self._config(aspect_ratio, size),
+        )
+        result = self._result(response)
+        call.payload_bytes = len(result.content)
+    return result
+
+
+class SimulatedImageGenerator:
+  '''
+  Stand-in for the image model replaying its recorded profile: each call
+  takes a recorded latency, fails at the recorded rate with the recorded
+  error codes and returns a PNG padded to a recorded payload size. Goes
+  through the same rate limiter as the model it stands in for.
+  '''
+  model = GoogleGeminiNanoBananaGenerator.model
+  # PNG chunk overhead: length, type and crc
+  _CHUNK_OVERHEAD = 12
+
+  def __init__(self, model: Optional[str] = None):
+    if model is not None:
+      self.model = model
+    self.profile = model_profile(self.model)
+    self.rng = simulation_rng()
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    call = SimulatedCall(self.profile, self.rng)
+    with rate_limited(self.model):
+      call.play()
+    return self._image(aspect_ratio, size)
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    call = SimulatedCall(self.profile, self.rng)
+    async with arate_limited(self.model):
+      await call.aplay()
+    return await asyncio.to_thread(self._image, aspect_ratio, size)
+
+  def _image(self, aspect_ratio: str, size: tuple[int, int] | None) -> ImageResult:
+    if size is None:
+      size = _default_size(aspect_ratio)
+    img = Image.new("RGB", size, color=(40, 40, 60))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    padding = self.profile.sample_payload(self.rng, 0) - buf.tell() - self._CHUNK_OVERHEAD
+    if padding > 0:
+      # private ancillary chunk, skipped by decoders
+      info = PngInfo()
+      info.add(b"siMu", bytes(padding))
+      buf = BytesIO()
+      img.save(buf, format="PNG", pnginfo=info)
+    return ImageResult(content=buf.getvalue(), width=size[0], height=size[1], model_name="simulated")
+
+class AdaptiveImageGenerator:
+  '''
+  Runs every call of the wrapped generator through the model's adaptive
+  concurrency limiter, queued as the given flow when it has to wait.
+  '''
+
+  def __init__(
+      self,
+      inner: ImageGenerator,
+      limiter: AdaptiveConcurrencyLimiter,
+      flow: Optional[Flow] = None,
+  ):
+    self.inner = inner
+    self.limiter = limiter
+    self.flow = flow
+    self.model = inner.model
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    with self.limiter.slot(self.flow):
+      return self.inner.generate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    async with self.limiter.aslot(self.flow):
+      return await self.inner.agenerate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+
+
+class HedgedImageGenerator:
+  '''
+  Sends a duplicate of any call still running past the model's rolling p90
+  latency and returns whichever finishes first, within a hedge budget.
+  Takes the place of AdaptiveImageGenerator: the original and the hedge
+  each run in their own slot of the model's limiter, so it counts every
+  call in flight, including a losing call finishing in the background.
+  '''
+
+  def __init__(
+      self,
+      inner: ImageGenerator,
+      hedger: Hedger,
+      limiter: AdaptiveConcurrencyLimiter,
+      flow: Optional[Flow] = None,
+  ):
+    self.inner = inner
+    self.hedger = hedger
+    self.limiter = limiter
+    self.flow = flow
+    self.model = inner.model
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    return self.hedger.call(
+        lambda: self.inner.generate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size),
+        lambda: self.limiter.slot(self.flow),
+    )
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    return await self.hedger.acall(
+        lambda: self.inner.agenerate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size),
+        lambda: self.limiter.aslot(self.flow),
+    )
+
+
+class CircuitBreakerImageGenerator:
+  '''
+  Fails calls fast with CircuitOpenError while the model's circuit is open.
+  '''
+
+  def __init__(self, inner: ImageGenerator, breaker: CircuitBreaker):
+    self.inner = inner
+    self.breaker = breaker
+    self.model = inner.model
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    with self.breaker.call():
+      return self.inner.generate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    with self.breaker.call():
+      return await self.inner.agenerate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+
+
+class FallbackImageGenerator:
+  '''
+  Calls the first tier whose circuit is not open. The primary tier's model
+  stays the generator's model (and cache key); results from a later tier
+  carry its model as fallback_model. Raises CircuitOpenError, with the
+  soonest retry, when every tier is open.
+  '''
+
+  def __init__(self, tiers: list[ImageGenerator]):
+    self.tiers = tiers
+    self.model = tiers[0].model
+
+  @property
+  def models(self) -> list[str]:
+    return [tier.model for tier in self.tiers]
+
+  def _served(self, result: ImageResult, index: int) -> ImageResult:
+    if index:
+      result.fallback_model = self.tiers[index].model
+    return result
+
+  def _all_open(self, errors: list[CircuitOpenError]) -> CircuitOpenError:
+    return CircuitOpenError(
+        "/".join(self.models),
+        min(error.retry_after for error in errors),
+    )
+
+  def generate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    errors: list[CircuitOpenError] = []
+    for index, tier in enumerate(self.tiers):
+      try:
+        result = tier.generate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+      except CircuitOpenError as e:
+        errors.append(e)
+        continue
+      return self._served(result, index)
+    raise self._all_open(errors)
+
+  async def agenerate(self, prompt: str, aspect_ratio: str, images: list | None = None, size: tuple[int, int] | None = None) -> ImageResult:
+    errors: list[CircuitOpenError] = []
+    for index, tier in enumerate(self.tiers):
+      try:
+        result = await tier.agenerate(prompt=prompt, aspect_ratio=aspect_ratio, images=images, size=size)
+      except CircuitOpenError as e:
+        errors.append(e)
+        continue
+      return self._served(result, index)
+    raise self._all_open(errors)
+
+
+def _gemini_models() -> bool:
+  # simulated generators stand in for the gemini models, under their names
+  return settings.GENERATOR_BACKEND == "simulated" or "GEMINI_API_KEY" in os.environ
+
+
+def image_models() -> list[str]:
+  '''
+  Models get_image_generator may render with, primary first.
+  '''
+  if _gemini_models():
+    primary = GoogleGeminiNanoBananaGenerator.model
+  else:
+    primary = DummyImageGenerator.model
+  if not settings.CIRCUIT_BREAKER_ENABLED:
+    return [primary]
+  return [primary] + [model for model in settings.IMAGE_FALLBACK_MODELS if model != primary]
+
+
+def _image_tier(
+    model: str,
+    hedge_budget: Optional[HedgeBudget],
+    flow: Optional[Flow],
+) -> ImageGenerator:
+  generator: ImageGenerator
+  if settings.GENERATOR_BACKEND == "simulated":
+    generator = SimulatedImageGenerator(model)
+  elif "GEMINI_API_KEY" in os.environ:
+    generator = GoogleGeminiNanoBananaGenerator(model)
+  else:
+    generator = DummyImageGenerator(model)
+  limiter = get_adaptive_limiter(generator.model)
+  if settings.HEDGING_ENABLED and hedge_budget is not None:
+    # takes a limiter slot per attempt, hedges included
+    hedger = Hedger(get_hedge_stats(generator.model), hedge_budget)
+    generator = HedgedImageGenerator(generator, hedger, limiter, flow)
+  else:
+    generator = AdaptiveImageGenerator(generator, limiter, flow)
+  if settings.CIRCUIT_BREAKER_ENABLED:
+    # outside the limiter: an open circuit fails fast instead of queueing
+    generator = CircuitBreakerImageGenerator(generator, get_circuit_breaker(generator.model))
+  return generator
 
-    # type: ignore
-    return ImageResult(content=image_bytes, width=width, height=height, model_name="gemini")
 
 # Factory method to return the appropriate image generator.
 # right now it just checks if the gemini api key exists in .env,
 # but could be extended for adding more models
-def get_image_generator() -> ImageGenerator:
-  if "GEMINI_API_KEY" in os.environ:
-    return GoogleGeminiNanoBananaGenerator()
-  return DummyImageGenerator()
+def get_image_generator(
+    hedge_budget: Optional[HedgeBudget] = None,
+    flow: Optional[Flow] = None,
+) -> ImageGenerator:
+  '''
+  Calls are hedged when HEDGING_ENABLED and the workflow passes its budget,
+  queue for the model's limiter as the workflow's flow and go through the
+  model's circuit breaker, falling back to IMAGE_FALLBACK_MODELS in order.
+  '''
+  tiers = [_image_tier(model, hedge_budget, flow) for model in image_models()]
+  return tiers[0] if len(tiers) == 1 else FallbackImageGenerator(tiers)
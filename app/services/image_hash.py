@@ -0,0 +1,76 @@
+'''
+Perceptual image hash (64 bit difference hash) for near-duplicate
+detection: images that look alike have hashes a small Hamming distance
+apart, whatever their size, format or encoder settings.
+
+The hash is stored on each Asset with its four 16 bit bands in indexed
+columns. Two hashes at most 3 bits apart share at least one band exactly
+(pigeonhole), so near duplicates are found from the band indexes without
+comparing against every asset (multi-index hashing); see
+app/services/similarity.py.
+'''
+from __future__ import annotations
+from io import BytesIO
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_COLUMNS = tuple(f"image_hash_band_{band}" for band in range(BANDS))
+
+# dHash grid: each row of HASH_SIZE + 1 pixels gives HASH_SIZE bits
+_HASH_SIZE = 8
+
+
+def image_hash(img: Image.Image) -> int:
+  '''
+  dHash of a decoded image: shrunk to a 9x8 grayscale grid, one bit per
+  pair of horizontally adjacent pixels (left brighter than right).
+  '''
+  gray = img.convert("L")
+  # box-reduce first, LANCZOS on a multi-megapixel image is the slow part
+  factor = min(gray.width // (_HASH_SIZE * 8), gray.height // (_HASH_SIZE * 8))
+  if factor > 1:
+    gray = gray.reduce(factor)
+  pixels = gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.LANCZOS).tobytes()
+  value = 0
+  for row in range(_HASH_SIZE):
+    offset = row * (_HASH_SIZE + 1)
+    for col in range(_HASH_SIZE):
+      value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+  return value
+
+
+def image_hash_bytes(content: bytes) -> int:
+  # the hash of encoded image bytes, as displayed (EXIF orientation applied)
+  source = Image.open(BytesIO(content))
+  if source.format == "JPEG":
+    # decode at a fraction of the size, plenty for a 9x8 grid
+    source.draft("L", (_HASH_SIZE * 8, _HASH_SIZE * 8))
+  return image_hash(ImageOps.exif_transpose(source))
+
+
+def hamming_distance(a: int, b: int) -> int:
+  return (a ^ b).bit_count()
+
+
+def hash_bands(value: int) -> tuple[int, ...]:
+  mask = (1 << BAND_BITS) - 1
+  return tuple((value >> (band * BAND_BITS)) & mask for band in range(BANDS))
+
+
+def to_signed(value: int) -> int:
+  # stored in a signed BIGINT column
+  return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+  return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hash_columns(value: Optional[int]) -> Dict[str, Optional[int]]:
+  # Asset column values for an (unsigned) hash, None for none
+  if value is None:
+    return {"image_hash": None, **{column: None for column in BAND_COLUMNS}}
+  return {"image_hash": to_signed(value), **dict(zip(BAND_COLUMNS, hash_bands(value)))}
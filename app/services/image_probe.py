@@ -0,0 +1,114 @@
+'''
+Image format, dimensions and MIME type read from the file header alone
+(PNG IHDR, JPEG SOF, WebP VP8/VP8L/VP8X), without decoding any pixels.
+
+Used wherever only the size or type of an image is needed: generator
+responses, uploads (rejected cheaply when not an image or not of the
+declared content_type) and downloads. JPEG dimensions are as stored,
+before any EXIF orientation.
+'''
+from __future__ import annotations
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+CONTENT_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp", "AVIF": "image/avif"}
+
+# content types clients send for the same formats
+_CONTENT_TYPE_ALIASES = {"image/jpg": "image/jpeg", "image/pjpeg": "image/jpeg", "image/x-png": "image/png"}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start of frame markers carrying the frame size (not DHT, JPG, DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without a length field
+_JPEG_STANDALONE = {0x01, *range(0xD0, 0xD8)}
+_JPEG_SOS = 0xDA
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+  format: str
+  width: int
+  height: int
+
+  @property
+  def content_type(self) -> str:
+    return CONTENT_TYPES[self.format]
+
+  @property
+  def size(self) -> Tuple[int, int]:
+    return (self.width, self.height)
+
+
+def _png(data: bytes) -> Optional[Tuple[int, int]]:
+  # signature, then the IHDR chunk: length, type, width, height
+  if len(data) < 24 or data[12:16] != b"IHDR":
+    return None
+  return struct.unpack(">II", data[16:24])
+
+
+def _jpeg(data: bytes) -> Optional[Tuple[int, int]]:
+  offset = 2
+  while offset + 4 <= len(data):
+    if data[offset] != 0xFF:
+      return None
+    marker = data[offset + 1]
+    if marker == 0xFF:
+      # fill byte
+      offset += 1
+      continue
+    if marker in _JPEG_STANDALONE:
+      offset += 2
+      continue
+    if marker == _JPEG_SOS:
+      # entropy-coded data follows, no frame header before it
+      return None
+    (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+    if marker in _JPEG_SOF:
+      if offset + 9 > len(data):
+        return None
+      height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+      return (width, height)
+    offset += 2 + length
+  return None
+
+
+def _webp(data: bytes) -> Optional[Tuple[int, int]]:
+  chunk = data[12:16]
+  if chunk == b"VP8X" and len(data) >= 30:
+    # extended: 24 bit canvas width - 1 and height - 1
+    width = int.from_bytes(data[24:27], "little") + 1
+    height = int.from_bytes(data[27:30], "little") + 1
+    return (width, height)
+  if chunk == b"VP8 " and len(data) >= 30 and data[23:26] == b"\x9d\x01\x2a":
+    # lossy: 14 bit width and height after the key frame start code
+    width, height = struct.unpack("<HH", data[26:30])
+    return (width & 0x3FFF, height & 0x3FFF)
+  if chunk == b"VP8L" and len(data) >= 25 and data[20] == 0x2F:
+    # lossless: 14 bit width - 1 and height - 1, packed
+    bits = int.from_bytes(data[21:25], "little")
+    return ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+  return None
+
+
+def probe_image(data: bytes) -> Optional[ImageInfo]:
+  '''
+  Format and size of a PNG, JPEG or WebP image from its header; None when
+  data is none of those (or its header is truncated).
+  '''
+  if data.startswith(_PNG_SIGNATURE):
+    image_format, size = "PNG", _png(data)
+  elif data.startswith(b"\xff\xd8"):
+    image_format, size = "JPEG", _jpeg(data)
+  elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+    image_format, size = "WEBP", _webp(data)
+  else:
+    return None
+  if size is None or not all(size):
+    return None
+  return ImageInfo(format=image_format, width=size[0], height=size[1])
+
+
+def normalize_content_type(content_type: str) -> str:
+  content_type = content_type.split(";", 1)[0].strip().lower()
+  return _CONTENT_TYPE_ALIASES.get(content_type, content_type)
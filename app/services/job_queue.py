@@ -0,0 +1,355 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional, Sequence
+from sqlalchemy import and_, func, or_, text, update
+from sqlalchemy.orm import Session
+from app.models.workflow import Workflow, WorkflowPriority, WorkflowStatus
+from app.models.workflow_batch import WorkflowBatch, WorkflowBatchMember
+
+logger = logging.getLogger(__name__)
+
+# first key of the (namespace, campaign_id) advisory lock serializing
+# generate requests per campaign
+_GENERATE_LOCK_NAMESPACE = 0x67656E  # "gen"
+
+IN_FLIGHT_STATUSES = (WorkflowStatus.STARTED, WorkflowStatus.RUNNING)
+
+
+@dataclass
+class ClaimedWorkflow:
+  workflow_id: int
+  campaign_id: int
+  attempt: int
+  priority: WorkflowPriority
+  batch_id: Optional[int] = None
+
+
+def _lease_deadline(lease_seconds: int):
+  # lease times are computed with the database clock so that workers on
+  # different nodes agree on when a lease has expired
+  return func.now() + timedelta(seconds=lease_seconds)
+
+
+def _retry_due():
+  return or_(Workflow.retry_at.is_(None), Workflow.retry_at <= func.now())
+
+
+def claim_next_workflow(
+    db: Session,
+    worker_id: str,
+    lease_seconds: int,
+    max_attempts: int,
+    priorities: Optional[Sequence[WorkflowPriority]] = None,
+) -> Optional[ClaimedWorkflow]:
+  '''
+  Claim the most urgent runnable workflow for this worker: by priority
+  class, then oldest first. priorities restricts the classes considered.
+
+  Runnable means either queued (STARTED, and past its retry_at if it was
+  deferred) or RUNNING with an expired lease, i.e. the worker that owned
+  it stopped sending heartbeats or gave it up unfinished, or with no lease
+  at all (left RUNNING by the pre-queue BackgroundTasks). Rows locked by
+  other workers are skipped instead of waited on, so any number of workers
+  can poll the same table concurrently.
+  '''
+  while True:
+    query = db.query(Workflow).filter(
+        or_(
+            and_(Workflow.status == WorkflowStatus.STARTED, _retry_due()),
+            and_(
+                Workflow.status == WorkflowStatus.RUNNING,
+                or_(
+                    Workflow.lease_expires_at.is_(None),
+                    Workflow.lease_expires_at < func.now(),
+                ),
+            ),
+        )
+    )
+    if priorities is not None:
+      query = query.filter(Workflow.priority.in_([int(p) for p in priorities]))
+    workflow = (
+        query
+        .order_by(Workflow.priority, Workflow.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+
+    if workflow is None:
+      db.rollback()
+      return None
+
+    if workflow.attempts >= max_attempts:
+      # keeps crashing whoever picks it up, stop re-claiming it
+      logger.error(
+          "Workflow %s exceeded %d attempts; marking FAILED.",
+          workflow.id,
+          max_attempts,
+      )
+      workflow.status = WorkflowStatus.FAILED
+      workflow.finished_at = func.now()
+      workflow.error_message = (
+          f"Workflow abandoned after {workflow.attempts} attempts "
+          f"(last lease owner: {workflow.lease_owner})"
+      )
+      workflow.lease_owner = None
+      workflow.lease_expires_at = None
+      db.commit()
+      continue
+
+    if workflow.status == WorkflowStatus.RUNNING:
+      logger.warning(
+          "Re-claiming workflow %s from %s (lease expired at %s)",
+          workflow.id,
+          workflow.lease_owner,
+          workflow.lease_expires_at,
+      )
+
+    claimed = _take_lease(workflow, worker_id, lease_seconds)
+    db.commit()
+    return claimed
+
+
+def _take_lease(workflow: Workflow, worker_id: str, lease_seconds: int) -> ClaimedWorkflow:
+  workflow.status = WorkflowStatus.RUNNING
+  workflow.attempts = workflow.attempts + 1
+  workflow.lease_owner = worker_id
+  workflow.lease_expires_at = _lease_deadline(lease_seconds)
+  workflow.heartbeat_at = func.now()
+  workflow.retry_at = None
+  return ClaimedWorkflow(
+      workflow_id=workflow.id,
+      campaign_id=workflow.campaign_id,
+      attempt=workflow.attempts,
+      priority=WorkflowPriority(workflow.priority),
+      batch_id=workflow.batch_id,
+  )
+
+
+def claim_batch_workflows(
+    db: Session,
+    batch_id: int,
+    worker_id: str,
+    lease_seconds: int,
+    limit: int,
+) -> List[ClaimedWorkflow]:
+  '''
+  Claim up to `limit` more queued workflows of a batch, after its first one
+  was claimed with claim_next_workflow, so they run through one pipeline.
+  Workflows of the batch claimed by other workers are skipped; re-claiming
+  expired leases is left to claim_next_workflow.
+  '''
+  if limit <= 0:
+    return []
+  workflows = (
+      db.query(Workflow)
+      .filter(
+          Workflow.batch_id == batch_id,
+          Workflow.status == WorkflowStatus.STARTED,
+          _retry_due(),
+      )
+      .order_by(Workflow.id)
+      .limit(limit)
+      .with_for_update(skip_locked=True)
+      .all()
+  )
+  claimed = [_take_lease(workflow, worker_id, lease_seconds) for workflow in workflows]
+  db.commit()
+  return claimed
+
+
+def renew_leases(
+    db: Session,
+    workflow_ids: Sequence[int],
+    worker_id: str,
+    lease_seconds: int,
+) -> List[int]:
+  '''
+  Heartbeat: extend the leases this worker still owns. Returns the ids
+  still owned; a missing one was lost (e.g. expired and re-claimed).
+  '''
+  result = db.execute(
+      update(Workflow)
+      .where(
+          Workflow.id.in_(workflow_ids),
+          Workflow.lease_owner == worker_id,
+          Workflow.status == WorkflowStatus.RUNNING,
+      )
+      .values(
+          heartbeat_at=func.now(),
+          lease_expires_at=_lease_deadline(lease_seconds),
+      )
+      .returning(Workflow.id)
+  )
+  owned = [row[0] for row in result]
+  db.commit()
+  return owned
+
+
+def release_leases(db: Session, workflow_ids: Sequence[int], worker_id: str) -> None:
+  '''
+  Give up this worker's leases once it is done with the workflows. One
+  still RUNNING was not finalized (e.g. its final commit failed): its lease
+  is expired rather than cleared, so another claim picks it up again.
+  '''
+  owned = and_(Workflow.id.in_(workflow_ids), Workflow.lease_owner == worker_id)
+  db.execute(
+      update(Workflow)
+      .where(owned, Workflow.status != WorkflowStatus.RUNNING)
+      .values(lease_owner=None, lease_expires_at=None)
+  )
+  db.execute(
+      update(Workflow)
+      .where(owned, Workflow.status == WorkflowStatus.RUNNING)
+      .values(lease_expires_at=func.now())
+  )
+  db.commit()
+
+
+def lock_campaign_generation(db: Session, campaign_id: int) -> None:
+  '''
+  Serialize generate requests of one campaign across API processes until
+  the current transaction ends.
+  '''
+  db.execute(
+      text("SELECT pg_advisory_xact_lock(:namespace, :campaign_id)"),
+      {"namespace": _GENERATE_LOCK_NAMESPACE, "campaign_id": campaign_id},
+  )
+
+
+def in_flight_workflow(
+    db: Session,
+    campaign_id: int,
+    exclude_id: Optional[int] = None,
+) -> Optional[Workflow]:
+  '''
+  The queued or running non-forced workflow of the campaign, if any. A
+  RUNNING one whose worker died or gave it up is claimable again
+  (claim_next_workflow), so requests attaching to it are not stranded.
+  '''
+  query = db.query(Workflow).filter(
+      Workflow.campaign_id == campaign_id,
+      Workflow.status.in_([int(s) for s in IN_FLIGHT_STATUSES]),
+      Workflow.force.is_(False),
+  )
+  if exclude_id is not None:
+    query = query.filter(Workflow.id != exclude_id)
+  return query.order_by(Workflow.id).first()
+
+
+def _enqueue_locked(
+    db: Session,
+    campaign_id: int,
+    bypass_cache: bool,
+    priority: WorkflowPriority,
+    force: bool,
+    batch_id: Optional[int] = None,
+) -> tuple[Workflow, bool]:
+  lock_campaign_generation(db, campaign_id)
+
+  if not force:
+    existing = in_flight_workflow(db, campaign_id)
+    if existing is not None:
+      # an urgent request makes the shared workflow urgent
+      if priority < existing.priority:
+        existing.priority = priority
+      if batch_id is not None:
+        db.add(WorkflowBatchMember(batch_id=batch_id, workflow_id=existing.id))
+        if existing.batch_id is None:
+          existing.batch_id = batch_id
+      return existing, True
+
+  workflow = Workflow(
+      campaign_id=campaign_id,
+      status=WorkflowStatus.STARTED,
+      bypass_cache=bypass_cache,
+      priority=priority,
+      force=force,
+      batch_id=batch_id,
+  )
+  db.add(workflow)
+  db.flush()
+  if batch_id is not None:
+    db.add(WorkflowBatchMember(batch_id=batch_id, workflow_id=workflow.id))
+  return workflow, False
+
+
+def enqueue_generation(
+    db: Session,
+    campaign_id: int,
+    bypass_cache: bool,
+    priority: WorkflowPriority,
+    force: bool = False,
+) -> tuple[Workflow, bool]:
+  '''
+  Single-flight enqueue of a campaign's generation: while a workflow of the
+  campaign is queued or running, further requests attach to it instead of
+  planning and paying for the same creatives again. Forced regenerations
+  always get their own workflow. Returns (workflow, attached); commits.
+
+  A partial unique index on workflows backs this up at the database level.
+  '''
+  workflow, attached = _enqueue_locked(db, campaign_id, bypass_cache, priority, force)
+  db.commit()
+  return workflow, attached
+
+
+def enqueue_batch(
+    db: Session,
+    campaign_ids: Sequence[int],
+    bypass_cache: bool,
+    priority: WorkflowPriority,
+    force: bool = False,
+    brand_id: Optional[int] = None,
+) -> tuple[WorkflowBatch, List[tuple[Workflow, bool]]]:
+  '''
+  enqueue_generation for many campaigns in one transaction, under a new
+  batch. A campaign with a workflow already in flight attaches to it: that
+  workflow becomes a member of the batch, and runs with it unless it
+  already belongs to another one.
+  Returns (batch, [(workflow, attached)] in campaign id order); commits.
+  '''
+  batch = WorkflowBatch(brand_id=brand_id, priority=priority)
+  db.add(batch)
+  db.flush()
+  # campaign locks are always taken in id order, so concurrent batches
+  # over overlapping campaigns can't deadlock
+  enqueued = [
+      _enqueue_locked(db, campaign_id, bypass_cache, priority, force, batch.id)
+      for campaign_id in sorted(set(campaign_ids))
+  ]
+  db.commit()
+  return batch, enqueued
+
+
+def requeue_workflow(db: Session, workflow: Workflow) -> None:
+  '''
+  Put a finished workflow back in the queue. Its workflow_tasks ledger is
+  kept, so the next run only picks up tasks that are not COMPLETE.
+  '''
+  workflow.status = WorkflowStatus.STARTED
+  workflow.finished_at = None
+  workflow.error_message = None
+  workflow.retry_at = None
+  # a resume is a new run, not another attempt of the crashed one
+  workflow.attempts = 0
+  workflow.lease_owner = None
+  workflow.lease_expires_at = None
+  db.commit()
+
+
+def defer_workflow(db: Session, workflow: Workflow, retry_after: float, reason: str) -> None:
+  '''
+  Put a workflow whose remaining tasks were deferred (model circuit open)
+  back in the queue, not to be claimed for retry_after seconds. Not
+  committed.
+  '''
+  workflow.status = WorkflowStatus.STARTED
+  workflow.finished_at = None
+  workflow.error_message = reason
+  workflow.retry_at = _lease_deadline(max(1, round(retry_after)))
+  # waiting out a provider outage does not use up attempts
+  workflow.attempts = 0
+  workflow.lease_owner = None
+  workflow.lease_expires_at = None
@@ -0,0 +1,457 @@
+'''
+Localization of the campaign message into every target locale.
+
+Locales are resolved to languages, translations already in the
+translation_cache table are reused, and the misses are requested from the
+text model in one batched JSON call; languages missing from (or unparseable
+in) the batch response are fanned out as concurrent single-language calls.
+'''
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.brand import Brand
+from app.models.campaign import Campaign
+from app.models.translation_cache import TranslationCache
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.text_generator import TextGenerator, TextResult
+
+if TYPE_CHECKING:
+  from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SOURCE_LANGUAGE = "english"
+
+# bare region codes, as used by Campaign.target_region
+REGION_LANGUAGES = {
+  "US": "english",
+  "GB": "english",
+  "UK": "english",
+  "AU": "english",
+  "FR": "french",
+  "DE": "german",
+  "AT": "german",
+  "ES": "spanish",
+  "MX": "spanish",
+  "IT": "italian",
+  "PT": "portuguese",
+  "BR": "portuguese",
+  "NL": "dutch",
+  "SE": "swedish",
+  "DK": "danish",
+  "NO": "norwegian",
+  "FI": "finnish",
+  "PL": "polish",
+  "CZ": "czech",
+  "TR": "turkish",
+  "JP": "japanese",
+  "KR": "korean",
+  "CN": "chinese (simplified)",
+  "TW": "chinese (traditional)",
+}
+
+# language subtags of locale tags such as "fr-CA" or "pt_BR"
+LANGUAGE_CODES = {
+  "en": "english",
+  "fr": "french",
+  "de": "german",
+  "es": "spanish",
+  "it": "italian",
+  "pt": "portuguese",
+  "nl": "dutch",
+  "sv": "swedish",
+  "da": "danish",
+  "nb": "norwegian",
+  "no": "norwegian",
+  "fi": "finnish",
+  "pl": "polish",
+  "cs": "czech",
+  "tr": "turkish",
+  "ja": "japanese",
+  "ko": "korean",
+  "zh": "chinese (simplified)",
+  "ar": "arabic",
+  "hi": "hindi",
+}
+
+
+def locale_language(locale: str) -> Optional[str]:
+  '''
+  Language of a region code ("FR") or locale tag ("fr-CA"), None if unknown.
+  '''
+  locale = locale.strip()
+  if "-" in locale or "_" in locale:
+    return LANGUAGE_CODES.get(locale.replace("_", "-").split("-", 1)[0].lower())
+  return REGION_LANGUAGES.get(locale.upper()) or LANGUAGE_CODES.get(locale.lower())
+
+
+def campaign_locales(campaign: Campaign) -> List[str]:
+  # the target region first, it backs localized_campaign_message
+  locales = [campaign.target_region, *(campaign.target_locales or [])]
+  return list(dict.fromkeys(locale for locale in locales if locale))
+
+
+def _message_hash(message: str) -> str:
+  return hashlib.sha256(" ".join(message.split()).encode("utf-8")).hexdigest()
+
+
+def translation_cache_key(message: str, tone: str, audience: str, language: str) -> str:
+  normalized = {
+      "message": _message_hash(message),
+      "tone": " ".join(tone.split()),
+      "audience": " ".join(audience.split()),
+      "language": language,
+  }
+  payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _build_campaign_message_localization_prompt(brand, campaign, language) -> str:
+  brand_tone_of_voice = getattr(brand, "tone_of_voice", "")
+  campaign_message = getattr(campaign, "campaign_message", "")
+  campaign_target_audience = getattr(campaign, "target_audience", "")
+
+  return f"""
+    Instruction:
+    You will receive:
+      - A short caption written in English.
+      - A description of the brand's tone of voice.
+      - Information about the target audience.
+      - The target language for localization.
+
+    Task:
+    Rewrite (localize) the caption into the target language so that:
+      - The meaning is preserved, not translated word-for-word.
+      - The brand tone is fully maintained (e.g., playful, premium, minimal, energetic, friendly, luxury, etc.).
+      - The phrasing feels natural and culturally appropriate for the target audience.
+      - The result reads like a native-quality marketing caption, not a direct translation.
+      - Keep it short, punchy, and suitable for social media.
+
+    Output:
+      - Only output the final localized caption — no explanations.
+
+    Inputs:
+      - Original caption: {campaign_message}
+      - Brand tone: {brand_tone_of_voice}
+      - Target audience: {campaign_target_audience}
+      - Target language: {language}
+  """
+
+
+def _build_batch_localization_prompt(brand, campaign, languages: List[str]) -> str:
+  brand_tone_of_voice = getattr(brand, "tone_of_voice", "")
+  campaign_message = getattr(campaign, "campaign_message", "")
+  campaign_target_audience = getattr(campaign, "target_audience", "")
+  example = json.dumps({language: "..." for language in languages[:2]}, ensure_ascii=False)
+
+  return f"""
+    Instruction:
+    You will receive:
+      - A short caption written in English.
+      - A description of the brand's tone of voice.
+      - Information about the target audience.
+      - A list of target languages for localization.
+
+    Task:
+    For every target language, rewrite (localize) the caption so that:
+      - The meaning is preserved, not translated word-for-word.
+      - The brand tone is fully maintained (e.g., playful, premium, minimal, energetic, friendly, luxury, etc.).
+      - The phrasing feels natural and culturally appropriate for the target audience.
+      - The result reads like a native-quality marketing caption, not a direct translation.
+      - Keep it short, punchy, and suitable for social media.
+
+    Output:
+      - Only output a JSON object mapping each target language, exactly as
+        listed, to its localized caption — no explanations, no markdown.
+      - Example: {example}
+
+    Inputs:
+      - Original caption: {campaign_message}
+      - Brand tone: {brand_tone_of_voice}
+      - Target audience: {campaign_target_audience}
+      - Target languages: {", ".join(languages)}
+  """
+
+
+def _parse_batch_result(content: str, languages: List[str]) -> Dict[str, str]:
+  '''
+  Translations found in a batch response; languages that are missing or
+  empty are left out.
+  '''
+  text = content.strip()
+  if text.startswith("```"):
+    # tolerate a fenced code block despite the instructions
+    text = text.strip("`").strip()
+    if text.lower().startswith("json"):
+      text = text[4:]
+  try:
+    parsed = json.loads(text)
+  except ValueError:
+    return {}
+  if not isinstance(parsed, dict):
+    return {}
+  by_language = {str(key).strip().lower(): value for key, value in parsed.items()}
+  return {
+      language: by_language[language].strip()
+      for language in languages
+      if isinstance(by_language.get(language), str) and by_language[language].strip()
+  }
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+  for start in range(0, len(items), size):
+    yield items[start:start + size]
+
+
+@dataclass
+class LocalizationJob:
+  '''
+  Localization of one campaign: which locales need which language and
+  what is already known (source language and cache hits).
+  '''
+  brand: Brand
+  campaign: Campaign
+  locale_languages: Dict[str, str]
+  # language -> translation; the source language maps to the message itself
+  translations: Dict[str, str] = field(default_factory=dict)
+  cache_keys: Dict[str, str] = field(default_factory=dict)
+  cache_hits: int = 0
+  # language -> model that produced a new translation
+  generated: Dict[str, str] = field(default_factory=dict)
+
+  @property
+  def missing(self) -> List[str]:
+    languages = dict.fromkeys(self.locale_languages.values())
+    return [language for language in languages if language not in self.translations]
+
+  def add(self, language: str, result: TextResult) -> None:
+    if result and result.content and result.content.strip():
+      self.translations[language] = result.content.strip()
+      self.generated[language] = result.model_name
+
+  def messages(self) -> Dict[str, str]:
+    return {
+        locale: self.translations[language]
+        for locale, language in self.locale_languages.items()
+        if language in self.translations
+    }
+
+
+def prepare_localization(db: Session, brand: Brand, campaign: Campaign) -> LocalizationJob:
+  locale_languages: Dict[str, str] = {}
+  for locale in campaign_locales(campaign):
+    language = locale_language(locale)
+    if language is None:
+      logger.warning(
+          "No language known for locale %s of campaign_id=%s; not localizing it",
+          locale,
+          campaign.id,
+      )
+      continue
+    locale_languages[locale] = language
+
+  job = LocalizationJob(brand=brand, campaign=campaign, locale_languages=locale_languages)
+  if SOURCE_LANGUAGE in locale_languages.values():
+    job.translations[SOURCE_LANGUAGE] = campaign.campaign_message
+
+  for language in job.missing:
+    job.cache_keys[language] = translation_cache_key(
+        campaign.campaign_message,
+        getattr(brand, "tone_of_voice", "") or "",
+        campaign.target_audience or "",
+        language,
+    )
+  if job.cache_keys:
+    rows = (
+        db.query(TranslationCache.language, TranslationCache.translation)
+        .filter(TranslationCache.cache_key.in_(list(job.cache_keys.values())))
+        .all()
+    )
+    job.translations.update({language: translation for language, translation in rows})
+    job.cache_hits = len(rows)
+  return job
+
+
+def save_localization(db: Session, job: LocalizationJob) -> Dict[str, str]:
+  '''
+  Store new translations in the cache and the localized messages on the
+  campaign. Commits.
+  '''
+  message_hash = _message_hash(job.campaign.campaign_message)
+  if job.generated:
+    db.execute(
+        insert(TranslationCache)
+        .values([
+            {
+                "cache_key": job.cache_keys[language],
+                "message_hash": message_hash,
+                "language": language,
+                "translation": job.translations[language],
+                "model_name": model_name,
+            }
+            for language, model_name in job.generated.items()
+        ])
+        .on_conflict_do_nothing(index_elements=[TranslationCache.cache_key])
+    )
+
+  messages = job.messages()
+  campaign = db.get(Campaign, job.campaign.id)
+  if campaign is not None:
+    campaign.localized_messages_json = messages
+    if campaign.target_region in messages and locale_language(campaign.target_region) != SOURCE_LANGUAGE:
+      campaign.localized_campaign_message = messages[campaign.target_region]
+  db.commit()
+  return messages
+
+
+def _log_request(job: LocalizationJob, languages: List[str]) -> None:
+  logger.info(
+      "Localizing campaign message: brand_id=%s campaign_id=%s languages=%s",
+      job.brand.id,
+      job.campaign.id,
+      languages,
+  )
+
+
+def _finish(job: LocalizationJob, errors: List[BaseException]) -> None:
+  logger.info(
+      "Localized campaign_id=%s into %d locales (%d languages from cache, %d generated)",
+      job.campaign.id,
+      len(job.messages()),
+      job.cache_hits,
+      len(job.generated),
+  )
+  # what did succeed is already saved; a rerun only asks for the rest
+  missing = job.missing
+  if missing:
+    # refused by an open circuit: the caller defers the workflow
+    circuit_open = next((e for e in errors if isinstance(e, CircuitOpenError)), None)
+    if circuit_open is not None:
+      raise circuit_open
+    detail = f": {type(errors[0]).__name__}: {errors[0]}" if errors else ""
+    raise RuntimeError(
+        f"Localization of campaign {job.campaign.id} failed for {', '.join(missing)}{detail}")
+
+
+def localize_campaign(
+    db: Session,
+    text_generator: TextGenerator,
+    brand: Brand,
+    campaign: Campaign,
+) -> Dict[str, str]:
+  '''
+  Localize the campaign message into every target locale. Returns
+  locale -> message; locales whose translation failed are left out.
+  '''
+  job = prepare_localization(db, brand, campaign)
+
+  errors: List[BaseException] = []
+  missing = job.missing
+  if len(missing) > 1:
+    for languages in _chunks(missing, settings.LOCALIZATION_BATCH_MAX_LANGUAGES):
+      _log_request(job, languages)
+      try:
+        result = text_generator.generate(
+            prompt=_build_batch_localization_prompt(brand, campaign, languages))
+      except CircuitOpenError as e:
+        logger.warning("Batched localization refused for campaign_id=%s: %s", campaign.id, e)
+        errors.append(e)
+        break
+      except Exception:
+        logger.exception("Batched localization failed for campaign_id=%s", campaign.id)
+        continue
+      for language, translation in _parse_batch_result(result.content, languages).items():
+        job.add(language, TextResult(content=translation, model_name=result.model_name))
+
+  missing = job.missing
+  # single-language calls would be refused by the same open circuit
+  if missing and not errors:
+    _log_request(job, missing)
+
+    def translate(language: str) -> TextResult:
+      return text_generator.generate(
+          prompt=_build_campaign_message_localization_prompt(brand, campaign, language))
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(missing), settings.LOCALIZATION_MAX_CONCURRENCY)) as executor:
+      futures = {language: executor.submit(translate, language) for language in missing}
+    for language, future in futures.items():
+      try:
+        job.add(language, future.result())
+      except Exception as e:
+        logger.exception("Localization into %s failed for campaign_id=%s", language, campaign.id)
+        errors.append(e)
+
+  messages = save_localization(db, job)
+  _finish(job, errors)
+  return messages
+
+
+async def alocalize_campaign(
+    db: "AsyncSession",
+    text_generator: TextGenerator,
+    brand: Brand,
+    campaign: Campaign,
+) -> Dict[str, str]:
+  '''
+  localize_campaign on an AsyncSession; the fan-out runs on the event loop.
+  '''
+  job = await db.run_sync(lambda session: prepare_localization(session, brand, campaign))
+  errors: List[BaseException] = []
+
+  async def batch(languages: List[str]) -> None:
+    _log_request(job, languages)
+    try:
+      result = await text_generator.agenerate(
+          prompt=_build_batch_localization_prompt(brand, campaign, languages))
+    except CircuitOpenError as e:
+      logger.warning("Batched localization refused for campaign_id=%s: %s", campaign.id, e)
+      errors.append(e)
+      return
+    except Exception:
+      logger.exception("Batched localization failed for campaign_id=%s", campaign.id)
+      return
+    for language, translation in _parse_batch_result(result.content, languages).items():
+      job.add(language, TextResult(content=translation, model_name=result.model_name))
+
+  missing = job.missing
+  if len(missing) > 1:
+    await asyncio.gather(*[
+        batch(languages)
+        for languages in _chunks(missing, settings.LOCALIZATION_BATCH_MAX_LANGUAGES)
+    ])
+
+  missing = job.missing
+  # single-language calls would be refused by the same open circuit
+  if missing and not errors:
+    _log_request(job, missing)
+    semaphore = asyncio.Semaphore(settings.LOCALIZATION_MAX_CONCURRENCY)
+
+    async def translate(language: str) -> TextResult:
+      async with semaphore:
+        return await text_generator.agenerate(
+            prompt=_build_campaign_message_localization_prompt(brand, campaign, language))
+
+    results = await asyncio.gather(
+        *[translate(language) for language in missing],
+        return_exceptions=True,
+    )
+    for language, result in zip(missing, results):
+      if isinstance(result, BaseException):
+        logger.error(
+            "Localization into %s failed for campaign_id=%s: %s", language, campaign.id, result)
+        errors.append(result)
+      else:
+        job.add(language, result)
+
+  messages = await db.run_sync(lambda session: save_localization(session, job))
+  _finish(job, errors)
+  return messages
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models.worker_metrics import WorkerMetrics
+
+logger = logging.getLogger(__name__)
+
+# name -> callable returning a JSON-serializable snapshot
+_sources: Dict[str, Callable[[], Any]] = {}
+_sources_lock = threading.Lock()
+
+
+def register_metrics_source(name: str, source: Callable[[], Any]) -> None:
+  with _sources_lock:
+    _sources[name] = source
+
+
+def collect_metrics() -> Dict[str, Any]:
+  '''
+  Snapshot of every registered in-process metrics source.
+  '''
+  with _sources_lock:
+    sources = dict(_sources)
+
+  snapshot: Dict[str, Any] = {}
+  for name, source in sources.items():
+    try:
+      snapshot[name] = source()
+    except Exception:
+      logger.exception("Failed to collect metrics from %s", name)
+  return snapshot
+
+
+def publish_worker_metrics(db: Session, worker_id: str) -> None:
+  '''
+  Upsert this process' metrics so the API can serve them; generation runs
+  in worker processes, not in the API process.
+  '''
+  metrics = collect_metrics()
+  statement = insert(WorkerMetrics).values(
+      worker_id=worker_id,
+      metrics_json=metrics,
+      updated_at=datetime.utcnow(),
+  )
+  db.execute(
+      statement.on_conflict_do_update(
+          index_elements=[WorkerMetrics.worker_id],
+          set_={
+              "metrics_json": statement.excluded.metrics_json,
+              "updated_at": statement.excluded.updated_at,
+          },
+      )
+  )
+  db.commit()
+
+
+def load_worker_metrics(db: Session, max_age_seconds: int) -> List[WorkerMetrics]:
+  cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+  return (
+      db.query(WorkerMetrics)
+      .filter(WorkerMetrics.updated_at >= cutoff)
+      .order_by(WorkerMetrics.worker_id)
+      .all()
+  )
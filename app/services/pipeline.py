@@ -0,0 +1,155 @@
+'''
+Bounded multi-threaded stages, the building blocks of the threads engine's
+asset pipeline (app/services/workflows.py).
+
+Each stage is a pool of threads consuming a bounded queue. put() blocks
+while the queue is full, so a slow stage pushes back on the stages feeding
+it instead of buffering unbounded work.
+'''
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Generic, List, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_STOP = object()
+
+
+class Stage(Generic[T]):
+  '''
+  handler is called once per item on one of `workers` threads; an item
+  whose handler raises is passed to on_error.
+  '''
+
+  def __init__(
+      self,
+      name: str,
+      workers: int,
+      handler: Callable[[T], None],
+      on_error: Callable[[T, Exception], None],
+      capacity: int,
+  ):
+    self.name = name
+    self.workers = max(1, workers)
+    self.handler = handler
+    self.on_error = on_error
+    self._queue: queue.Queue = queue.Queue(maxsize=max(1, capacity))
+    self._threads: List[threading.Thread] = []
+    self._lock = threading.Lock()
+    self._started_at = 0.0
+    self._finished_at = 0.0
+    self.processed = 0
+    self.busy_seconds = 0.0
+
+  def start(self) -> "Stage[T]":
+    self._started_at = time.monotonic()
+    for i in range(self.workers):
+      thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+      thread.start()
+      self._threads.append(thread)
+    return self
+
+  def put(self, item: T) -> None:
+    self._queue.put(item)
+
+  def close(self) -> None:
+    '''
+    Wait until everything put so far is handled, then stop the workers.
+    '''
+    for _ in self._threads:
+      self._queue.put(_STOP)
+    for thread in self._threads:
+      thread.join()
+    self._finished_at = time.monotonic()
+
+  def _take(self) -> Tuple[List[T], bool]:
+    # (items to handle, whether to stop afterwards)
+    item = self._queue.get()
+    return ([], True) if item is _STOP else ([item], False)
+
+  def _handle(self, items: List[T]) -> None:
+    for item in items:
+      try:
+        self.handler(item)
+      except Exception as e:
+        self._fail(item, e)
+
+  def _fail(self, item: T, error: Exception) -> None:
+    try:
+      self.on_error(item, error)
+    except Exception:
+      logger.exception("Error handler of stage %s failed", self.name)
+
+  def _run(self) -> None:
+    stop = False
+    while not stop:
+      items, stop = self._take()
+      if not items:
+        continue
+      started = time.monotonic()
+      self._handle(items)
+      with self._lock:
+        self.processed += len(items)
+        self.busy_seconds += time.monotonic() - started
+
+  def utilization(self) -> float:
+    # share of the stage's thread time spent handling items
+    elapsed = (self._finished_at or time.monotonic()) - self._started_at
+    if elapsed <= 0:
+      return 0.0
+    return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+
+class BatchStage(Stage[T]):
+  '''
+  handler is called with up to batch_size items at a time: whatever queued
+  up while the previous batch was being handled. If it raises, the items
+  are retried one at a time so one bad item does not fail its whole batch.
+  '''
+
+  def __init__(
+      self,
+      name: str,
+      workers: int,
+      handler: Callable[[List[T]], None],
+      on_error: Callable[[T, Exception], None],
+      capacity: int,
+      batch_size: int,
+  ):
+    super().__init__(name, workers, handler, on_error, capacity)  # type: ignore[arg-type]
+    self.batch_size = max(1, batch_size)
+
+  def _take(self) -> Tuple[List[T], bool]:
+    item = self._queue.get()
+    if item is _STOP:
+      return [], True
+    items = [item]
+    while len(items) < self.batch_size:
+      try:
+        item = self._queue.get_nowait()
+      except queue.Empty:
+        break
+      if item is _STOP:
+        return items, True
+      items.append(item)
+    return items, False
+
+  def _handle(self, items: List[T]) -> None:
+    try:
+      self.handler(items)  # type: ignore[arg-type]
+      return
+    except Exception as e:
+      if len(items) == 1:
+        self._fail(items[0], e)
+        return
+      logger.exception("Batch of %d in stage %s failed; retrying one by one", len(items), self.name)
+    for item in items:
+      try:
+        self.handler([item])  # type: ignore[list-item]
+      except Exception as e:
+        self._fail(item, e)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.asset import Asset, AssetSource, AssetType
+from app.models.brand import Brand
+from app.models.campaign import Campaign
+from app.models.campaign_product import CampaignProduct
+from app.models.product import Product
+from app.services.render_profiles import RenderSpec, resolve_render_profile
+
+
+class TaskReason(str, Enum):
+  # no creative exists for the (product, ratio) pair
+  MISSING = "missing"
+  # the newest generated creative predates a change to its product, brand
+  # or product reference images, or none was generated at the size the
+  # render profile asks for
+  STALE = "stale"
+  # regeneration was explicitly requested
+  FORCED = "forced"
+
+
+@dataclass
+class PlannedTask:
+  product: Product
+  aspect_ratio: str
+  reason: TaskReason
+  existing_created_at: Optional[datetime] = None
+
+
+@dataclass
+class GenerationPlan:
+  campaign_id: int
+  profile: RenderSpec
+  tasks: List[PlannedTask] = field(default_factory=list)
+  # (product, ratio) pairs that already have an up-to-date creative
+  up_to_date: int = 0
+
+  @property
+  def aspect_ratios(self) -> List[str]:
+    return self.profile.aspect_ratios
+
+  def __len__(self) -> int:
+    return len(self.tasks)
+
+  def __bool__(self) -> bool:
+    return bool(self.tasks)
+
+  def __iter__(self):
+    return iter(self.tasks)
+
+
+@dataclass
+class _Existing:
+  # newest creative of a (product, ratio) pair
+  latest: datetime
+  has_uploaded: bool = False
+  # (width, height) -> newest generated creative of that size
+  sizes: Dict[tuple[int, int], datetime] = field(default_factory=dict)
+
+
+def _latest_creatives(
+    db: Session,
+    campaign_id: int,
+) -> Dict[tuple[int, str], _Existing]:
+  '''
+  One grouped query: (product_id, aspect_ratio) -> newest created_at
+  overall and per pixel size, and whether any of the creatives was
+  uploaded rather than generated.
+  '''
+  rows = (
+      db.query(
+          Asset.product_id,
+          Asset.aspect_ratio,
+          Asset.width,
+          Asset.height,
+          func.max(Asset.created_at),
+          func.bool_or(Asset.source == AssetSource.UPLOADED),
+      )
+      .filter(
+          Asset.campaign_id == campaign_id,
+          Asset.type == AssetType.CREATIVE,
+      )
+      .group_by(Asset.product_id, Asset.aspect_ratio, Asset.width, Asset.height)
+      .all()
+  )
+  existing: Dict[tuple[int, str], _Existing] = {}
+  for product_id, ratio, width, height, latest, has_uploaded in rows:
+    pair = existing.setdefault((product_id, ratio), _Existing(latest))
+    pair.latest = max(pair.latest, latest)
+    pair.has_uploaded = pair.has_uploaded or has_uploaded
+    if not has_uploaded and width and height:
+      pair.sizes[(width, height)] = latest
+  return existing
+
+
+def _latest_references(db: Session, product_ids: List[int]) -> Dict[int, datetime]:
+  # product_id -> newest reference image (product photo) upload
+  if not product_ids:
+    return {}
+  rows = (
+      db.query(Asset.product_id, func.max(Asset.created_at))
+      .filter(Asset.product_id.in_(product_ids), Asset.type == AssetType.PRODUCT)
+      .group_by(Asset.product_id)
+      .all()
+  )
+  return dict(rows)
+
+
+def plan_campaign_generation(
+    db: Session,
+    campaign: Campaign,
+    profile: Optional[RenderSpec] = None,
+    force: bool = False,
+) -> GenerationPlan:
+  '''
+  Plan which (product, aspect ratio) creatives a campaign needs, for the
+  ratios of its render profile (resolved from the campaign when not given).
+
+  Set-based diff: the campaign's products and its existing creatives are
+  each fetched with a single query, so planning costs the same number of
+  round-trips for 2 or 200 products. Missing and stale combinations are
+  computed in memory. Uploaded creatives are never considered stale.
+  '''
+  plan = GenerationPlan(
+      campaign_id=campaign.id,
+      profile=profile or resolve_render_profile(campaign),
+  )
+
+  products = (
+      db.query(Product)
+      .join(CampaignProduct, CampaignProduct.product_id == Product.id)
+      .filter(CampaignProduct.campaign_id == campaign.id)
+      .order_by(Product.id)
+      .all()
+  )
+
+  existing = _latest_creatives(db, campaign.id)
+  references = _latest_references(db, [product.id for product in products])
+  brand: Optional[Brand] = campaign.brand
+
+  for product in products:
+    # a creative is stale once the inputs it was generated from changed
+    inputs_changed_at = max(
+        (
+            ts
+            for ts in (product.updated_at, getattr(brand, "updated_at", None), references.get(product.id))
+            if ts
+        ),
+        default=None,
+    )
+
+    for ratio in plan.aspect_ratios:
+      pair = existing.get((product.id, ratio))
+      # newest generated creative at the size the profile asks for
+      at_size = pair.sizes.get(plan.profile.output(ratio).size) if pair else None
+
+      if force:
+        reason = TaskReason.FORCED
+      elif pair is None:
+        reason = TaskReason.MISSING
+      elif pair.has_uploaded:
+        plan.up_to_date += 1
+        continue
+      elif at_size is None or (
+          inputs_changed_at is not None
+          and at_size < inputs_changed_at
+      ):
+        reason = TaskReason.STALE
+      else:
+        plan.up_to_date += 1
+        continue
+
+      plan.tasks.append(PlannedTask(
+          product=product,
+          aspect_ratio=ratio,
+          reason=reason,
+          existing_created_at=pair.latest if pair else None,
+      ))
+
+  return plan
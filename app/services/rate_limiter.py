@@ -0,0 +1,289 @@
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Protocol, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.models.rate_limit import RateLimitBucket, RateLimitLease
+from app.services.metrics import register_metrics_source
+
+logger = logging.getLogger(__name__)
+
+# how long to wait before re-checking when only the concurrency ceiling,
+# not the token bucket, is what blocks a call
+_CONCURRENCY_RETRY_SECONDS = 0.05
+
+
+@dataclass(frozen=True)
+class ModelRateLimit:
+  requests_per_minute: int
+  max_concurrent: int
+
+  @property
+  def refill_per_second(self) -> float:
+    return self.requests_per_minute / 60.0
+
+  @property
+  def capacity(self) -> float:
+    # allow bursting up to RATE_LIMIT_BURST_SECONDS worth of quota
+    return max(1.0, self.refill_per_second * settings.RATE_LIMIT_BURST_SECONDS)
+
+
+class RateLimiter(Protocol):
+  def try_acquire(self, model: str) -> Tuple[Optional[Any], float]:
+    '''
+    Returns (permit, 0.0) when the call may proceed, otherwise
+    (None, seconds to wait before trying again).
+    '''
+    ...
+
+  def release(self, model: str, permit: Any) -> None:
+    ...
+
+
+class _Bucket:
+  def __init__(self, limit: ModelRateLimit):
+    self.limit = limit
+    self.tokens = limit.capacity
+    self.refilled_at = time.monotonic()
+    self.in_flight = 0
+    self.granted = 0
+    self.throttled = 0
+
+  def refill(self) -> None:
+    now = time.monotonic()
+    elapsed = now - self.refilled_at
+    self.tokens = min(
+        self.limit.capacity,
+        self.tokens + elapsed * self.limit.refill_per_second,
+    )
+    self.refilled_at = now
+
+
+class InProcessRateLimiter:
+  '''
+  Token bucket (requests per minute) plus an in-flight ceiling per model,
+  shared by every workflow running in this process.
+  '''
+
+  def __init__(self, limits: Dict[str, ModelRateLimit]):
+    self._lock = threading.Lock()
+    self._buckets = {model: _Bucket(limit) for model, limit in limits.items()}
+
+  def try_acquire(self, model: str) -> Tuple[Optional[Any], float]:
+    bucket = self._buckets.get(model)
+    if bucket is None:
+      # no limits configured for this model
+      return True, 0.0
+
+    with self._lock:
+      if bucket.in_flight >= bucket.limit.max_concurrent:
+        bucket.throttled += 1
+        return None, _CONCURRENCY_RETRY_SECONDS
+
+      bucket.refill()
+      if bucket.tokens < 1.0:
+        bucket.throttled += 1
+        return None, (1.0 - bucket.tokens) / bucket.limit.refill_per_second
+
+      bucket.tokens -= 1.0
+      bucket.in_flight += 1
+      bucket.granted += 1
+      return True, 0.0
+
+  def release(self, model: str, permit: Any) -> None:
+    bucket = self._buckets.get(model)
+    if bucket is None:
+      return
+    with self._lock:
+      bucket.in_flight = max(0, bucket.in_flight - 1)
+
+  def snapshot(self) -> list[dict]:
+    with self._lock:
+      return [
+          {
+              "model": model,
+              "backend": "memory",
+              "requests_per_minute": bucket.limit.requests_per_minute,
+              "max_concurrent": bucket.limit.max_concurrent,
+              "tokens": round(bucket.tokens, 2),
+              "in_flight": bucket.in_flight,
+              "granted": bucket.granted,
+              "throttled": bucket.throttled,
+          }
+          for model, bucket in self._buckets.items()
+      ]
+
+
+class PostgresRateLimiter:
+  '''
+  Same limits as InProcessRateLimiter, but enforced across every worker
+  process: the token bucket is a row locked with SELECT ... FOR UPDATE and
+  each in-flight call holds a lease row. Leases expire so that a crashed
+  worker cannot leak concurrency permanently.
+  '''
+
+  def __init__(self, limits: Dict[str, ModelRateLimit], lease_seconds: int):
+    self.limits = limits
+    self.lease_seconds = lease_seconds
+    self._lock = threading.Lock()
+    self._granted: Dict[str, int] = {model: 0 for model in limits}
+    self._throttled: Dict[str, int] = {model: 0 for model in limits}
+
+  def _count(self, counter: Dict[str, int], model: str) -> None:
+    with self._lock:
+      counter[model] = counter.get(model, 0) + 1
+
+  def try_acquire(self, model: str) -> Tuple[Optional[Any], float]:
+    limit = self.limits.get(model)
+    if limit is None:
+      return True, 0.0
+
+    with SessionLocal() as db:
+      db.execute(
+          insert(RateLimitBucket)
+          .values(model=model, tokens=limit.capacity, refilled_at=func.now())
+          .on_conflict_do_nothing(index_elements=[RateLimitBucket.model])
+      )
+
+      bucket, now = (
+          db.query(RateLimitBucket, func.now())
+          .filter(RateLimitBucket.model == model)
+          .with_for_update()
+          .one()
+      )
+
+      in_flight = db.scalar(
+          select(func.count(RateLimitLease.id)).where(
+              RateLimitLease.model == model,
+              RateLimitLease.expires_at > now,
+          )
+      ) or 0
+      if in_flight >= limit.max_concurrent:
+        db.rollback()
+        self._count(self._throttled, model)
+        return None, _CONCURRENCY_RETRY_SECONDS
+
+      elapsed = max(0.0, (now - bucket.refilled_at).total_seconds())
+      tokens = min(limit.capacity, bucket.tokens + elapsed * limit.refill_per_second)
+      bucket.refilled_at = now
+
+      if tokens < 1.0:
+        bucket.tokens = tokens
+        db.commit()
+        self._count(self._throttled, model)
+        return None, (1.0 - tokens) / limit.refill_per_second
+
+      bucket.tokens = tokens - 1.0
+      lease = RateLimitLease(
+          model=model,
+          expires_at=now + timedelta(seconds=self.lease_seconds),
+      )
+      db.add(lease)
+      db.flush()
+      lease_id = lease.id
+      # opportunistic cleanup of leases left behind by crashed workers
+      db.execute(
+          delete(RateLimitLease).where(
+              RateLimitLease.model == model,
+              RateLimitLease.expires_at <= now,
+          )
+      )
+      db.commit()
+      self._count(self._granted, model)
+      return lease_id, 0.0
+
+  def release(self, model: str, permit: Any) -> None:
+    if model not in self.limits:
+      return
+    with SessionLocal() as db:
+      db.execute(delete(RateLimitLease).where(RateLimitLease.id == permit))
+      db.commit()
+
+  def snapshot(self) -> list[dict]:
+    with self._lock:
+      return [
+          {
+              "model": model,
+              "backend": "postgres",
+              "requests_per_minute": limit.requests_per_minute,
+              "max_concurrent": limit.max_concurrent,
+              "granted": self._granted.get(model, 0),
+              "throttled": self._throttled.get(model, 0),
+          }
+          for model, limit in self.limits.items()
+      ]
+
+
+def _configured_limits() -> Dict[str, ModelRateLimit]:
+  return {
+      model: ModelRateLimit(
+          requests_per_minute=int(limit["requests_per_minute"]),
+          max_concurrent=int(limit["max_concurrent"]),
+      )
+      for model, limit in settings.MODEL_RATE_LIMITS.items()
+  }
+
+
+@lru_cache
+def get_rate_limiter() -> InProcessRateLimiter | PostgresRateLimiter:
+  limits = _configured_limits()
+  if settings.RATE_LIMIT_BACKEND == "postgres":
+    return PostgresRateLimiter(limits, lease_seconds=settings.RATE_LIMIT_LEASE_SECONDS)
+  return InProcessRateLimiter(limits)
+
+
+@contextmanager
+def rate_limited(model: str) -> Iterator[None]:
+  '''
+  Blocks until the shared rate limiter grants a permit for one call to
+  model, and returns the permit when the call is done.
+  '''
+  limiter = get_rate_limiter()
+  while True:
+    permit, retry_after = limiter.try_acquire(model)
+    if permit is not None:
+      break
+    time.sleep(retry_after)
+
+  try:
+    yield
+  finally:
+    try:
+      limiter.release(model, permit)
+    except Exception:
+      # an unreleased postgres lease expires on its own
+      logger.exception("Failed to release rate limit permit for %s", model)
+
+
+@asynccontextmanager
+async def arate_limited(model: str) -> AsyncIterator[None]:
+  '''
+  Async variant of rate_limited; the limiter itself may hit the database,
+  so it is consulted from a thread.
+  '''
+  limiter = get_rate_limiter()
+  while True:
+    permit, retry_after = await asyncio.to_thread(limiter.try_acquire, model)
+    if permit is not None:
+      break
+    await asyncio.sleep(retry_after)
+
+  try:
+    yield
+  finally:
+    try:
+      await asyncio.to_thread(limiter.release, model, permit)
+    except Exception:
+      logger.exception("Failed to release rate limit permit for %s", model)
+
+
+register_metrics_source("rate_limits", lambda: get_rate_limiter().snapshot())
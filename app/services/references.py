@@ -0,0 +1,158 @@
+'''
+Reference images: uploaded product photography (AssetType.PRODUCT) passed
+to the image model to anchor a product's renders.
+
+Originals can be large camera exports, so each is downloaded, downscaled
+to REFERENCE_IMAGE_MAX_SIDE and re-encoded once (in the encoding process
+pool) and the prepared bytes are kept in a process-wide LRU keyed by
+s3_key, bounded by REFERENCE_CACHE_MAX_BYTES. Object keys are never
+rewritten (a new upload gets a new key), so cached bytes don't go stale.
+
+The workflow loads the reference keys of its products up front; they are
+part of the generation cache key, and only renders that miss the cache
+fetch the bytes, once per product and run.
+'''
+from __future__ import annotations
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.asset import Asset, AssetType
+from app.services.encoding import EncodeOptions, aencode, encode
+from app.services.image_probe import probe_image
+from app.services.metrics import register_metrics_source
+from app.services.storage import download_fileobj
+
+logger = logging.getLogger(__name__)
+
+# WebP keeps the alpha of cut-out product shots and is small to send
+REFERENCE_ENCODING = EncodeOptions(output_format="WEBP", quality=90)
+
+
+def reference_keys(db: Session, product_ids: Iterable[int]) -> Dict[int, Tuple[str, ...]]:
+  '''
+  s3_keys of the newest REFERENCE_IMAGES_MAX product photos per product,
+  oldest first; products without any are left out.
+  '''
+  product_ids = list(product_ids)
+  if not product_ids or settings.REFERENCE_IMAGES_MAX <= 0:
+    return {}
+  rows = (
+      db.query(Asset.product_id, Asset.s3_key)
+      .filter(Asset.product_id.in_(product_ids), Asset.type == AssetType.PRODUCT)
+      .order_by(Asset.id.desc())
+      .all()
+  )
+  keys: Dict[int, List[str]] = {}
+  for product_id, s3_key in rows:
+    product_keys = keys.setdefault(product_id, [])
+    if len(product_keys) < settings.REFERENCE_IMAGES_MAX:
+      product_keys.append(s3_key)
+  return {product_id: tuple(reversed(product_keys)) for product_id, product_keys in keys.items()}
+
+
+def _prepared_size(content: bytes) -> Optional[Tuple[int, int]]:
+  # the original's size from its header, scaled to the max side; None
+  # keeps the size
+  info = probe_image(content)
+  if info is None:
+    raise ValueError("Reference image is not a PNG, JPEG or WebP image")
+  scale = settings.REFERENCE_IMAGE_MAX_SIDE / max(info.size)
+  if scale >= 1:
+    return None
+  return (max(1, round(info.width * scale)), max(1, round(info.height * scale)))
+
+
+class ReferenceCache:
+  '''
+  Prepared reference image bytes by s3_key, least recently used evicted
+  first once their total size exceeds max_bytes.
+  '''
+
+  def __init__(self, max_bytes: int):
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    self._entries: OrderedDict[str, bytes] = OrderedDict()
+    self._bytes = 0
+    self.hits = 0
+    self.misses = 0
+
+  def _get(self, key: str) -> Optional[bytes]:
+    with self._lock:
+      content = self._entries.get(key)
+      if content is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._entries.move_to_end(key)
+      return content
+
+  def _store(self, key: str, content: bytes) -> None:
+    if len(content) > self.max_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._bytes -= len(previous)
+      self._entries[key] = content
+      self._bytes += len(content)
+      while self._bytes > self.max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self._bytes -= len(evicted)
+
+  def get(self, key: str) -> bytes:
+    content = self._get(key)
+    if content is not None:
+      return content
+    original = download_fileobj(key)
+    if original is None:
+      raise ValueError(f"Reference image {key} not found in storage")
+    data = original.getvalue()
+    content = encode(data, _prepared_size(data), REFERENCE_ENCODING).content
+    self._prepared(key, data, content)
+    return content
+
+  async def aget(self, s3, key: str) -> bytes:
+    content = self._get(key)
+    if content is not None:
+      return content
+    response = await s3.get_object(Bucket=settings.S3_BUCKET, Key=key)
+    data = await response["Body"].read()
+    content = (await aencode(data, _prepared_size(data), REFERENCE_ENCODING)).content
+    self._prepared(key, data, content)
+    return content
+
+  def _prepared(self, key: str, original: bytes, content: bytes) -> None:
+    logger.info("Prepared reference image %s: %d -> %d bytes", key, len(original), len(content))
+    self._store(key, content)
+
+  def snapshot(self) -> dict:
+    with self._lock:
+      return {
+          "entries": len(self._entries),
+          "bytes": self._bytes,
+          "max_bytes": self.max_bytes,
+          "hits": self.hits,
+          "misses": self.misses,
+      }
+
+
+@lru_cache
+def get_reference_cache() -> ReferenceCache:
+  return ReferenceCache(settings.REFERENCE_CACHE_MAX_BYTES)
+
+
+def reference_images(keys: Sequence[str]) -> List[bytes]:
+  cache = get_reference_cache()
+  return [cache.get(key) for key in keys]
+
+
+async def areference_images(s3, keys: Sequence[str]) -> List[bytes]:
+  cache = get_reference_cache()
+  return [await cache.aget(s3, key) for key in keys]
+
+
+register_metrics_source("reference_cache", lambda: get_reference_cache().snapshot())
@@ -0,0 +1,164 @@
+'''
+Render profiles: the aspect ratios a campaign's creatives are rendered at,
+the pixel size of each and the image format and encoder settings.
+
+A campaign uses its own profile, else its brand's, else DEFAULT_PROFILE
+(the three ratios every campaign used to get, at the image model's native
+sizes). The planner only plans the profile's ratios; generators are asked
+for the profile's size and every creative is fitted to it exactly and
+encoded (app/services/encoding.py) before upload.
+'''
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.models.campaign import Campaign
+from app.models.render_profile import OutputFormat, RenderProfile
+from app.services.derive import parse_aspect_ratio
+from app.services.encoding import EncodeOptions, EncodedImage, aencode, encode
+from app.services.image_generator import ImageResult
+
+# width/height may be off the nominal ratio by this much (model native
+# sizes are multiples of 64, e.g. 768x1344 for 9:16)
+RATIO_TOLERANCE = 0.02
+
+# long side of a ratio the profile has no size for
+_FALLBACK_LONG_SIDE = 1024
+
+
+
+@dataclass(frozen=True)
+class RenderOutput:
+  aspect_ratio: str
+  width: int
+  height: int
+
+  @property
+  def size(self) -> Tuple[int, int]:
+    return (self.width, self.height)
+
+
+@dataclass(frozen=True)
+class RenderSpec:
+  '''
+  A render profile as used by a workflow; plain data, safe to share between
+  threads after the session it was loaded in is closed.
+  '''
+  profile_id: Optional[int]
+  name: str
+  outputs: Tuple[RenderOutput, ...]
+  output_format: OutputFormat = OutputFormat.PNG
+  quality: Optional[int] = None
+  compression_level: Optional[int] = None
+  strip_metadata: bool = True
+
+  @property
+  def aspect_ratios(self) -> List[str]:
+    return [output.aspect_ratio for output in self.outputs]
+
+  @property
+  def encoding(self) -> EncodeOptions:
+    return EncodeOptions(
+        output_format=self.output_format.name,
+        quality=self.quality,
+        compression_level=self.compression_level,
+        strip_metadata=self.strip_metadata,
+    )
+
+  @property
+  def content_type(self) -> str:
+    return self.encoding.content_type
+
+  @property
+  def extension(self) -> str:
+    return self.encoding.extension
+
+  def output(self, aspect_ratio: str) -> RenderOutput:
+    for output in self.outputs:
+      if output.aspect_ratio == aspect_ratio:
+        return output
+    # a task planned before its ratio was dropped from the profile
+    return fallback_output(aspect_ratio)
+
+  def master_size(self) -> Tuple[int, int]:
+    # the master render of master + derive covers every output's long side
+    side = max(max(output.size) for output in self.outputs)
+    return (side, side)
+
+
+DEFAULT_PROFILE = RenderSpec(
+    profile_id=None,
+    name="default",
+    outputs=(
+        RenderOutput("1:1", 1024, 1024),
+        RenderOutput("9:16", 768, 1344),
+        RenderOutput("16:9", 1344, 768),
+    ),
+)
+
+
+def fallback_output(aspect_ratio: str) -> RenderOutput:
+  ratio = parse_aspect_ratio(aspect_ratio)
+  if ratio >= 1:
+    return RenderOutput(aspect_ratio, _FALLBACK_LONG_SIDE, round(_FALLBACK_LONG_SIDE / ratio))
+  return RenderOutput(aspect_ratio, round(_FALLBACK_LONG_SIDE * ratio), _FALLBACK_LONG_SIDE)
+
+
+def size_matches_ratio(width: int, height: int, aspect_ratio: str) -> bool:
+  ratio = parse_aspect_ratio(aspect_ratio)
+  return abs(width / height - ratio) <= RATIO_TOLERANCE * ratio
+
+
+def render_spec(profile: RenderProfile) -> RenderSpec:
+  return RenderSpec(
+      profile_id=profile.id,
+      name=profile.name,
+      outputs=tuple(
+          RenderOutput(str(output["aspect_ratio"]), int(output["width"]), int(output["height"]))
+          for output in profile.outputs_json
+      ),
+      output_format=OutputFormat(profile.output_format),
+      quality=profile.quality,
+      compression_level=profile.compression_level,
+      strip_metadata=profile.strip_metadata,
+  )
+
+
+def resolve_render_profile(campaign: Campaign) -> RenderSpec:
+  # campaign's own profile, else its brand's, else the default
+  profile = campaign.render_profile
+  if profile is None and campaign.brand is not None:
+    profile = campaign.brand.render_profile
+  return render_spec(profile) if profile is not None else DEFAULT_PROFILE
+
+
+def output_dicts(outputs: Sequence[RenderOutput]) -> List[Dict[str, int | str]]:
+  # RenderProfile.outputs_json
+  return [
+      {"aspect_ratio": output.aspect_ratio, "width": output.width, "height": output.height}
+      for output in outputs
+  ]
+
+
+def _encoded(image: ImageResult, encoded: EncodedImage) -> ImageResult:
+  return ImageResult(
+      content=encoded.content,
+      width=encoded.width,
+      height=encoded.height,
+      model_name=image.model_name,
+      content_type=encoded.content_type,
+      fallback_model=image.fallback_model,
+      image_hash=encoded.image_hash,
+  )
+
+
+def fit_to_output(image: ImageResult, output: RenderOutput, spec: RenderSpec) -> ImageResult:
+  '''
+  The image at exactly the output's pixel size (scaled to cover it, the
+  overflow cropped evenly from both sides), encoded with the profile's
+  format and encoder settings in the encoding process pool.
+  '''
+  return _encoded(image, encode(image.content, output.size, spec.encoding))
+
+
+async def afit_to_output(image: ImageResult, output: RenderOutput, spec: RenderSpec) -> ImageResult:
+  return _encoded(image, await aencode(image.content, output.size, spec.encoding))
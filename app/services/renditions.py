@@ -0,0 +1,195 @@
+'''
+Renditions: each creative at RENDITION_SIZES (thumbnail, preview, full)
+in its own format plus the RENDITION_FORMATS (WebP, AVIF), so clients
+such as the review grid can fetch a few KB instead of the full original.
+
+Made right after the original is uploaded, encoded in the encoding
+process pool from one decode, and stored next to the original under a
+derived key (creative_1.png -> creative_1.thumbnail.webp). Renditions are
+best effort: an asset whose renditions failed is served as its original.
+Assets served from the generation cache share the rendition objects of
+the asset they were cached from.
+'''
+from __future__ import annotations
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.render_profile import OutputFormat
+from app.models.rendition import Rendition
+from app.services.encoding import EXTENSIONS, EncodedImage, EncodeOptions, aencode_many, encode_many, format_supported
+from app.services.image_probe import CONTENT_TYPES
+from app.services.storage import upload_bytes, upload_bytes_async
+
+logger = logging.getLogger(__name__)
+
+_FORMATS_BY_CONTENT_TYPE = {content_type: name for name, content_type in CONTENT_TYPES.items()}
+_FORMATS_BY_EXTENSION = {extension: name for name, extension in EXTENSIONS.items()}
+
+
+@dataclass(frozen=True)
+class RenditionSpec:
+  name: str
+  # long side; None for the original's size
+  max_side: Optional[int]
+  options: EncodeOptions
+
+
+@dataclass
+class RenditionImage:
+  spec: RenditionSpec
+  image: EncodedImage
+  key: str
+
+
+def rendition_specs(original_format: str) -> List[RenditionSpec]:
+  '''
+  Every size in the original's format and in the RENDITION_FORMATS this
+  Pillow can write, except the original's own size and format (the
+  original itself).
+  '''
+  if not settings.RENDITIONS_ENABLED:
+    return []
+  formats = [original_format] + [
+      output_format
+      for output_format in settings.RENDITION_FORMATS
+      if output_format != original_format and format_supported(output_format)
+  ]
+  return [
+      RenditionSpec(name, max_side or None, EncodeOptions(output_format=output_format))
+      for name, max_side in settings.RENDITION_SIZES.items()
+      for output_format in formats
+      if max_side or output_format != original_format
+  ]
+
+
+def rendition_key(s3_key: str, name: str, extension: str) -> str:
+  return f"{s3_key.rsplit('.', 1)[0]}.{name}.{extension}"
+
+
+def original_format(s3_key: str) -> str:
+  return _FORMATS_BY_EXTENSION.get(s3_key.rsplit(".", 1)[-1].lower(), "PNG")
+
+
+def _targets(content_type: str, s3_key: str) -> List[RenditionSpec]:
+  return rendition_specs(_FORMATS_BY_CONTENT_TYPE.get(content_type) or original_format(s3_key))
+
+
+def _images(specs: Sequence[RenditionSpec], images: Sequence[EncodedImage], s3_key: str) -> List[RenditionImage]:
+  return [
+      RenditionImage(spec, image, rendition_key(s3_key, spec.name, spec.options.extension))
+      for spec, image in zip(specs, images)
+  ]
+
+
+def make_renditions(content: bytes, s3_key: str, content_type: str) -> List[RenditionImage]:
+  '''
+  Encodes (in the encoding pool) and uploads the renditions of the image
+  stored at s3_key; none when that fails.
+  '''
+  specs = _targets(content_type, s3_key)
+  if not specs:
+    return []
+  try:
+    renditions = _images(specs, encode_many(content, [(spec.max_side, spec.options) for spec in specs]), s3_key)
+    for rendition in renditions:
+      upload_bytes(data=rendition.image.content, key=rendition.key, content_type=rendition.image.content_type)
+  except Exception:
+    _log_failure(s3_key)
+    return []
+  return renditions
+
+
+async def amake_renditions(s3, content: bytes, s3_key: str, content_type: str) -> List[RenditionImage]:
+  specs = _targets(content_type, s3_key)
+  if not specs:
+    return []
+  try:
+    images = await aencode_many(content, [(spec.max_side, spec.options) for spec in specs])
+    renditions = _images(specs, images, s3_key)
+    await asyncio.gather(*(
+        upload_bytes_async(s3, data=rendition.image.content, key=rendition.key, content_type=rendition.image.content_type)
+        for rendition in renditions
+    ))
+  except Exception:
+    _log_failure(s3_key)
+    return []
+  return renditions
+
+
+def _log_failure(s3_key: str) -> None:
+  logger.warning("Renditions of %s failed; it is served as the original only", s3_key, exc_info=True)
+
+
+def rendition_rows(asset_id: int, renditions: Iterable[RenditionImage]) -> List[Rendition]:
+  return [
+      Rendition(
+          asset_id=asset_id,
+          name=rendition.spec.name,
+          output_format=OutputFormat[rendition.spec.options.output_format],
+          width=rendition.image.width,
+          height=rendition.image.height,
+          size_bytes=len(rendition.image.content),
+          s3_key=rendition.key,
+      )
+      for rendition in renditions
+  ]
+
+
+def copy_renditions(db: Session, served_from: Dict[int, List[int]]) -> None:
+  '''
+  Rendition rows for assets served from the generation cache, pointing at
+  the objects of the asset each was cached from; served_from maps source
+  asset id -> ids of the new assets.
+  '''
+  if not served_from:
+    return
+  for row in db.query(Rendition).filter(Rendition.asset_id.in_(list(served_from))):
+    for asset_id in served_from[row.asset_id]:
+      db.add(Rendition(
+          asset_id=asset_id,
+          name=row.name,
+          output_format=row.output_format,
+          width=row.width,
+          height=row.height,
+          size_bytes=row.size_bytes,
+          s3_key=row.s3_key,
+      ))
+
+
+def renditions_by_asset(db: Session, asset_ids: Iterable[int]) -> Dict[int, List[Rendition]]:
+  asset_ids = list(asset_ids)
+  renditions: Dict[int, List[Rendition]] = {asset_id: [] for asset_id in asset_ids}
+  if not asset_ids:
+    return renditions
+  rows = (
+      db.query(Rendition)
+      .filter(Rendition.asset_id.in_(asset_ids))
+      .order_by(Rendition.asset_id, Rendition.size_bytes)
+      .all()
+  )
+  for row in rows:
+    renditions[row.asset_id].append(row)
+  return renditions
+
+
+def select_rendition(
+    renditions: Sequence[Rendition],
+    s3_key: str,
+    name: Optional[str],
+    output_format: Optional[str],
+) -> Optional[Rendition]:
+  '''
+  The rendition a client asked for: name (default "full") in output_format
+  (default the original's format). None when that is the original itself
+  or the asset has no such rendition, e.g. it predates renditions.
+  '''
+  name = name or "full"
+  output_format = output_format or original_format(s3_key)
+  for rendition in renditions:
+    if rendition.name == name and OutputFormat(rendition.output_format).name == output_format:
+      return rendition
+  return None
+
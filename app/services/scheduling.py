@@ -0,0 +1,102 @@
+'''
+Fair sharing of model calls between workflows.
+
+Every model call of a workflow belongs to a Flow: the campaign's brand and
+the workflow's priority class. When calls have to wait for a slot of a
+model's concurrency limiter, slots are handed out by weighted fair queuing
+across flows instead of first come first served, so one brand's bulk
+campaign cannot starve another brand's small interactive one.
+'''
+from __future__ import annotations
+import heapq
+import itertools
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.models.workflow import WorkflowPriority
+
+
+@dataclass(frozen=True)
+class Flow:
+  brand_id: Optional[int]
+  priority: WorkflowPriority
+
+  @property
+  def key(self) -> Tuple[Optional[int], int]:
+    return (self.brand_id, int(self.priority))
+
+  @property
+  def weight(self) -> float:
+    return max(settings.PRIORITY_WEIGHTS.get(self.priority.name, 1.0), 1e-3)
+
+
+def default_priority(task_count: int) -> WorkflowPriority:
+  '''
+  Priority of a workflow that did not ask for one: small runs are
+  interactive.
+  '''
+  if task_count <= settings.INTERACTIVE_MAX_TASKS:
+    return WorkflowPriority.INTERACTIVE
+  return WorkflowPriority.BULK
+
+
+class FairQueue:
+  '''
+  Start-time fair queuing of waiters. Each waiter is tagged with a virtual
+  finish time of start + 1 / weight, where start is the later of the
+  current virtual time and the flow's previous finish tag; the waiter with
+  the smallest finish tag is served first. A flow with weight 10 thus gets
+  ten slots for every one of a weight 1 flow, and a flow that just arrived
+  is not behind the backlog of flows that have been waiting.
+
+  Not thread-safe; callers hold their own lock.
+  '''
+
+  def __init__(self) -> None:
+    # (finish tag, ticket, start tag)
+    self._heap: List[Tuple[float, int, float]] = []
+    self._removed: Set[int] = set()
+    self._finish: Dict[Tuple[Optional[int], int] | None, float] = {}
+    self._virtual_time = 0.0
+    self._tickets = itertools.count()
+
+  def __len__(self) -> int:
+    return len(self._heap) - len(self._removed)
+
+  def push(self, flow: Optional[Flow]) -> int:
+    key = flow.key if flow is not None else None
+    weight = flow.weight if flow is not None else 1.0
+    start = max(self._virtual_time, self._finish.get(key, 0.0))
+    finish = start + 1.0 / weight
+    self._finish[key] = finish
+    ticket = next(self._tickets)
+    heapq.heappush(self._heap, (finish, ticket, start))
+    return ticket
+
+  def _discard_removed(self) -> None:
+    while self._heap and self._heap[0][1] in self._removed:
+      self._removed.discard(heapq.heappop(self._heap)[1])
+
+  def head(self) -> Optional[int]:
+    self._discard_removed()
+    return self._heap[0][1] if self._heap else None
+
+  def pop(self) -> int:
+    self._discard_removed()
+    _, ticket, start = heapq.heappop(self._heap)
+    self._virtual_time = max(self._virtual_time, start)
+    self._reset_if_idle()
+    return ticket
+
+  def remove(self, ticket: int) -> None:
+    # a waiter that gave up (e.g. a cancelled coroutine)
+    self._removed.add(ticket)
+    self._discard_removed()
+    self._reset_if_idle()
+
+  def _reset_if_idle(self) -> None:
+    # with nobody waiting past tags no longer matter
+    if not len(self):
+      self._heap.clear()
+      self._removed.clear()
+      self._finish.clear()
@@ -0,0 +1,65 @@
+'''
+Near-duplicate assets by perceptual hash (app/services/image_hash.py).
+
+Up to 3 bits apart, candidates come from the band indexes alone (any band
+equal) and are compared exactly; further apart, every hashed asset in the
+scope is compared. Either way only (id, hash) pairs are loaded.
+'''
+from __future__ import annotations
+import heapq
+from dataclasses import dataclass
+from typing import List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.models.asset import Asset
+from app.services.image_hash import BAND_COLUMNS, BANDS, hamming_distance, hash_bands, to_unsigned
+
+
+@dataclass(frozen=True)
+class SimilarMatch:
+  asset: Asset
+  distance: int
+
+
+def find_similar(
+    db: Session,
+    image_hash: int,
+    max_distance: int,
+    limit: int,
+    campaign_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    asset_type: Optional[int] = None,
+    exclude_id: Optional[int] = None,
+) -> List[SimilarMatch]:
+  '''
+  Assets whose hash is at most max_distance bits from image_hash, closest
+  (then newest) first, optionally within a campaign, product and type.
+  '''
+  query = db.query(Asset.id, Asset.image_hash).filter(Asset.image_hash.isnot(None))
+  if campaign_id is not None:
+    query = query.filter(Asset.campaign_id == campaign_id)
+  if product_id is not None:
+    query = query.filter(Asset.product_id == product_id)
+  if asset_type is not None:
+    query = query.filter(Asset.type == asset_type)
+  if exclude_id is not None:
+    query = query.filter(Asset.id != exclude_id)
+  if max_distance < BANDS:
+    # pigeonhole: fewer differing bits than bands leaves a band equal
+    query = query.filter(or_(*(
+        getattr(Asset, column) == band for column, band in zip(BAND_COLUMNS, hash_bands(image_hash))
+    )))
+
+  distances = (
+      (hamming_distance(image_hash, to_unsigned(stored)), asset_id)
+      for asset_id, stored in query
+  )
+  matches = heapq.nsmallest(
+      limit,
+      ((distance, asset_id) for distance, asset_id in distances if distance <= max_distance),
+      key=lambda match: (match[0], -match[1]),
+  )
+  if not matches:
+    return []
+  assets = {asset.id: asset for asset in db.query(Asset).filter(Asset.id.in_([asset_id for _, asset_id in matches]))}
+  return [SimilarMatch(assets[asset_id], distance) for distance, asset_id in matches]
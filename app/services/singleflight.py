@@ -0,0 +1,35 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class AsyncSingleFlight(Generic[K, V]):
+  '''
+  Keyed single-flight group for coroutines running on one event loop.
+
+  The first caller for a key runs the function; concurrent callers for the
+  same key await that in-flight call and get the same result. Successful
+  results stay memoized for the lifetime of the group, failures are shared
+  with the callers that were waiting but forgotten afterwards so that a
+  later call can retry. The shared call is shielded, so a cancelled waiter
+  does not cancel it for the others.
+  '''
+
+  def __init__(self) -> None:
+    self._tasks: Dict[K, asyncio.Task] = {}
+
+  async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+    task = self._tasks.get(key)
+    if task is None:
+      task = asyncio.ensure_future(fn())
+      self._tasks[key] = task
+      task.add_done_callback(lambda t: self._forget_failed(key, t))
+    return await asyncio.shield(task)
+
+  def _forget_failed(self, key: K, task: asyncio.Task) -> None:
+    if task.cancelled() or task.exception() is not None:
+      if self._tasks.get(key) is task:
+        del self._tasks[key]
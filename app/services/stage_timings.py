@@ -0,0 +1,83 @@
+'''
+Where the time of a workflow goes.
+
+Each asset task accumulates monotonic timings per stage: waiting in a queue
+(pipeline stage queues, async in-flight/upload slots), the creative prompt
+LLM call, preparing reference images, the image model call, output
+encoding, the S3 upload, renditions and DB work (ledger writes,
+cache lookups, Asset rows). The asset's own timings go into its
+gen_metadata_json; per stage p50/p95/max over the assets of a run are stored
+on the workflow (stage_timings_json).
+'''
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+STAGES = ("queue_wait", "prompt", "references", "render", "encode", "upload", "renditions", "db_commit")
+
+
+class StageTimer:
+  '''
+  Seconds spent per stage by one asset task. Not thread-safe; a task is
+  only worked on by one thread (or coroutine) at a time.
+  '''
+
+  def __init__(self, seconds: Optional[Dict[str, float]] = None):
+    self.seconds: Dict[str, float] = dict(seconds or {})
+    self._queued_at: Optional[float] = None
+
+  def add(self, stage: str, seconds: float) -> None:
+    self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+  @contextmanager
+  def time(self, stage: str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+      yield
+    finally:
+      self.add(stage, time.monotonic() - started)
+
+  def queued(self) -> None:
+    self._queued_at = time.monotonic()
+
+  def dequeued(self) -> None:
+    if self._queued_at is not None:
+      self.add("queue_wait", time.monotonic() - self._queued_at)
+      self._queued_at = None
+
+  def copy(self) -> "StageTimer":
+    # a product's shared prompt/render time, carried into each ratio
+    return StageTimer(self.seconds)
+
+  def as_metadata(self) -> Dict[str, int]:
+    return {stage: round(self.seconds[stage] * 1000) for stage in STAGES if stage in self.seconds}
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+  return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(timers: Iterable[StageTimer]) -> Dict[str, Dict[str, int]]:
+  '''
+  Per stage count, p50/p95/max and total in milliseconds. Assets that
+  skipped a stage (e.g. cache hits never render) are not counted in it.
+  '''
+  by_stage: Dict[str, list[float]] = {stage: [] for stage in STAGES}
+  for timer in timers:
+    for stage, seconds in timer.seconds.items():
+      by_stage.setdefault(stage, []).append(seconds)
+
+  summary: Dict[str, Dict[str, int]] = {}
+  for stage, values in by_stage.items():
+    if not values:
+      continue
+    ordered = sorted(values)
+    summary[stage] = {
+      "count": len(ordered),
+      "p50_ms": round(_percentile(ordered, 0.5) * 1000),
+      "p95_ms": round(_percentile(ordered, 0.95) * 1000),
+      "max_ms": round(ordered[-1] * 1000),
+      "total_ms": round(sum(ordered) * 1000),
+    }
+  return summary
@@ -3,6 +3,8 @@ import os
 from io import BytesIO
 from typing import BinaryIO
 from datetime import datetime
+from uuid import uuid4
+import aioboto3
 import boto3
 from botocore.exceptions import ClientError
 
@@ -32,6 +34,24 @@ else:
   )
 
 
+_async_session = aioboto3.Session()
+
+
+def async_s3_client():
+  """
+  Async context manager yielding an S3 client for the asyncio workflow
+  engine; open one per workflow run and share it between uploads.
+  """
+  kwargs = {
+      "aws_access_key_id": settings.S3_ACCESS_KEY,
+      "aws_secret_access_key": settings.S3_SECRET_KEY,
+      "region_name": settings.S3_REGION_NAME,
+  }
+  if S3_ENDPOINT_URL:
+    kwargs["endpoint_url"] = settings.S3_ENDPOINT_URL
+  return _async_session.client("s3", **kwargs)
+
+
 def upload_fileobj(
     file_obj: BinaryIO,
     key: str,
@@ -58,6 +78,23 @@ def upload_bytes(
   return upload_fileobj(file_obj=file_obj, key=key, content_type=content_type)
 
 
+async def upload_bytes_async(
+    s3,
+    data: bytes,
+    key: str,
+    content_type: str = "application/octet-stream",
+) -> str:
+  await s3.put_object(
+      Bucket=settings.S3_BUCKET,
+      Key=key,
+      Body=data,
+      ContentType=content_type,
+  )
+  logger.info("Uploaded object to S3: bucket=%s key=%s",
+              settings.S3_BUCKET, key)
+  return key
+
+
 def generate_presigned_url(key: str, expires_in: int = 3600) -> str:
   try:
     url = _s3.generate_presigned_url(
@@ -99,14 +136,22 @@ def download_fileobj(key: str) -> BytesIO | None:
     raise
 
 
-def get_object_key(campaign_id: int, product_id: int, ratio: str) -> str:
+def get_reference_key(product_id: int, extension: str) -> str:
+  # product photos, used as reference images of the product's renders:
+  # /product_id/references/reference.<extension>; unique per upload, the
+  # prepared reference cache relies on keys never being overwritten
+  timestamp = int(datetime.utcnow().timestamp())
+  return f"product_{product_id}/references/reference_{timestamp}_{uuid4().hex[:8]}.{extension}"
+
+
+def get_object_key(campaign_id: int, product_id: int, ratio: str, extension: str = "png") -> str:
   # helper method to keep object keys consistent
   # save objects in similar structure:
-  # /campaign_id/product_id/aspect_ratio/asset.png
+  # /campaign_id/product_id/aspect_ratio/asset.<extension>
   safe_ratio = ratio.replace(":", "x")
   timestamp = int(datetime.utcnow().timestamp())
   key = (
       f"campaign_{campaign_id}/product_{product_id}/"
-      f"{safe_ratio}/creative_{timestamp}.png"
+      f"{safe_ratio}/creative_{timestamp}.{extension}"
   )
   return key
\ No newline at end of file
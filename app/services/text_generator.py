@@ -1,8 +1,14 @@
 from __future__ import annotations
 import os
-from typing import Protocol
+from typing import Optional, Protocol
 from dataclasses import dataclass
 from google import genai
+from app.core.config import settings
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker
+from app.services.concurrency import AdaptiveConcurrencyLimiter, get_adaptive_limiter
+from app.services.generator_profiles import SimulatedCall, model_profile, record_call, simulation_rng
+from app.services.rate_limiter import arate_limited, rate_limited
+from app.services.scheduling import Flow
 
 
 @dataclass
@@ -12,30 +18,201 @@ class TextResult:
 
 
 class TextGenerator(Protocol):
+  model: str
+
   def generate(self, prompt: str) -> TextResult:
     raise NotImplementedError(
         "Subclasses should implement the 'generate' method.")
 
+  async def agenerate(self, prompt: str) -> TextResult:
+    raise NotImplementedError(
+        "Subclasses should implement the 'agenerate' method.")
+
 
 class DummyTextGenerator:
+  model = "dummy-text"
+
+  def __init__(self, model: Optional[str] = None):
+    if model is not None:
+      self.model = model
+
   def generate(self, prompt: str) -> TextResult:
-    return TextResult(content="Test output", model_name="dummy")
+    with rate_limited(self.model):
+      return TextResult(content="Test output", model_name="dummy")
+
+  async def agenerate(self, prompt: str) -> TextResult:
+    async with arate_limited(self.model):
+      return TextResult(content="Test output", model_name="dummy")
 
 
 class GoogleGeminiFlashGenerator:
-    def __init__(self):
+    model = "gemini-2.5-flash"
+
+    def __init__(self, model: Optional[str] = None):
+      if model is not None:
+        self.model = model
       self.client = genai.Client()
     def generate(self, prompt: str) -> TextResult:
-      response = self.client.models.generate_content(
-        model="gemini-2.5-flash", contents=prompt
-      )
-      return TextResult(content=response.text, model_name="gemini-2.5-flash") # type: ignore
+      with rate_limited(self.model), record_call(self.model) as call:
+        response = self.client.models.generate_content(
+          model=self.model, contents=prompt
+        )
+        call.payload_bytes = len((response.text or "").encode())
+      return TextResult(content=response.text, model_name=self.model) # type: ignore
+    async def agenerate(self, prompt: str) -> TextResult:
+      async with arate_limited(self.model):
+        with record_call(self.model) as call:
+          response = await self.client.aio.models.generate_content(
+            model=self.model, contents=prompt
+          )
+          call.payload_bytes = len((response.text or "").encode())
+      return TextResult(content=response.text, model_name=self.model) # type: ignore
+
+
+class SimulatedTextGenerator:
+  '''
+  Stand-in for the text model replaying its recorded profile: recorded
+  latencies, error rate and codes, and placeholder text of a recorded
+  length. Goes through the same rate limiter as the model it stands in for.
+  '''
+  model = GoogleGeminiFlashGenerator.model
+  _FILLER = "Simulated output. "
+  _DEFAULT_LENGTH = 200
+
+  def __init__(self, model: Optional[str] = None):
+    if model is not None:
+      self.model = model
+    self.profile = model_profile(self.model)
+    self.rng = simulation_rng()
+
+  def _result(self) -> TextResult:
+    length = self.profile.sample_payload(self.rng, self._DEFAULT_LENGTH)
+    content = (self._FILLER * (length // len(self._FILLER) + 1))[:max(1, length)]
+    return TextResult(content=content, model_name="simulated")
+
+  def generate(self, prompt: str) -> TextResult:
+    call = SimulatedCall(self.profile, self.rng)
+    with rate_limited(self.model):
+      call.play()
+    return self._result()
+
+  async def agenerate(self, prompt: str) -> TextResult:
+    call = SimulatedCall(self.profile, self.rng)
+    async with arate_limited(self.model):
+      await call.aplay()
+    return self._result()
+
+
+class AdaptiveTextGenerator:
+  '''
+  Runs every call of the wrapped generator through the model's adaptive
+  concurrency limiter, queued as the given flow when it has to wait.
+  '''
+
+  def __init__(
+      self,
+      inner: TextGenerator,
+      limiter: AdaptiveConcurrencyLimiter,
+      flow: Optional[Flow] = None,
+  ):
+    self.inner = inner
+    self.limiter = limiter
+    self.flow = flow
+    self.model = inner.model
+
+  def generate(self, prompt: str) -> TextResult:
+    with self.limiter.slot(self.flow):
+      return self.inner.generate(prompt=prompt)
+
+  async def agenerate(self, prompt: str) -> TextResult:
+    async with self.limiter.aslot(self.flow):
+      return await self.inner.agenerate(prompt=prompt)
+
+
+class CircuitBreakerTextGenerator:
+  '''
+  Fails calls fast with CircuitOpenError while the model's circuit is open.
+  '''
+
+  def __init__(self, inner: TextGenerator, breaker: CircuitBreaker):
+    self.inner = inner
+    self.breaker = breaker
+    self.model = inner.model
+
+  def generate(self, prompt: str) -> TextResult:
+    with self.breaker.call():
+      return self.inner.generate(prompt=prompt)
+
+  async def agenerate(self, prompt: str) -> TextResult:
+    with self.breaker.call():
+      return await self.inner.agenerate(prompt=prompt)
+
+
+class FallbackTextGenerator:
+  '''
+  Calls the first tier whose circuit is not open; raises CircuitOpenError,
+  with the soonest retry, when every tier is open.
+  '''
+
+  def __init__(self, tiers: list[TextGenerator]):
+    self.tiers = tiers
+    self.model = tiers[0].model
+
+  def _all_open(self, errors: list[CircuitOpenError]) -> CircuitOpenError:
+    return CircuitOpenError(
+        "/".join(tier.model for tier in self.tiers),
+        min(error.retry_after for error in errors),
+    )
+
+  def generate(self, prompt: str) -> TextResult:
+    errors: list[CircuitOpenError] = []
+    for tier in self.tiers:
+      try:
+        return tier.generate(prompt=prompt)
+      except CircuitOpenError as e:
+        errors.append(e)
+    raise self._all_open(errors)
+
+  async def agenerate(self, prompt: str) -> TextResult:
+    errors: list[CircuitOpenError] = []
+    for tier in self.tiers:
+      try:
+        return await tier.agenerate(prompt=prompt)
+      except CircuitOpenError as e:
+        errors.append(e)
+    raise self._all_open(errors)
+
+
+def _text_tier(model: Optional[str], flow: Optional[Flow]) -> TextGenerator:
+  generator: TextGenerator
+  if settings.GENERATOR_BACKEND == "simulated":
+    generator = SimulatedTextGenerator(model)
+  elif "GEMINI_API_KEY" in os.environ:
+    generator = GoogleGeminiFlashGenerator(model)
+  else:
+    generator = DummyTextGenerator(model)
+  generator = AdaptiveTextGenerator(generator, get_adaptive_limiter(generator.model), flow)
+  if settings.CIRCUIT_BREAKER_ENABLED:
+    # outside the limiter: an open circuit fails fast instead of queueing
+    generator = CircuitBreakerTextGenerator(generator, get_circuit_breaker(generator.model))
+  return generator
 
 
 # Factory method to return the appropriate text generator.
 # right now it just checks if the gemini api key exists in .env,
 # but could be extended for adding more models
-def get_text_generator() -> TextGenerator:
-  if "GEMINI_API_KEY" in os.environ:
-    return GoogleGeminiFlashGenerator()
-  return DummyTextGenerator()
+def get_text_generator(flow: Optional[Flow] = None) -> TextGenerator:
+  '''
+  Calls go through the model's circuit breaker, falling back to
+  TEXT_FALLBACK_MODELS in order.
+  '''
+  primary = _text_tier(None, flow)
+  if not settings.CIRCUIT_BREAKER_ENABLED or not settings.TEXT_FALLBACK_MODELS:
+    return primary
+  return FallbackTextGenerator(
+      [primary] + [
+          _text_tier(model, flow)
+          for model in settings.TEXT_FALLBACK_MODELS
+          if model != primary.model
+      ]
+  )
@@ -0,0 +1,321 @@
+'''
+Live workflow progress events (GET /workflows/{id}/events).
+
+The orchestrator reports progress through a WorkflowProgress; events are
+delivered to subscribers by an in-process pub/sub. With
+WORKFLOW_EVENTS_BACKEND=postgres, events are published with NOTIFY instead
+and every process that has subscribers LISTENs and re-delivers them
+locally, so API processes see progress of workflows run by any worker.
+'''
+from __future__ import annotations
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional, Set
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes
+_MAX_ERROR_LENGTH = 500
+
+
+class TaskStage(str, Enum):
+  PLANNED = "planned"
+  PROMPTING = "prompting"
+  RENDERING = "rendering"
+  UPLOADING = "uploading"
+  DONE = "done"
+  FAILED = "failed"
+  DEFERRED = "deferred"
+
+
+class Subscription:
+  '''
+  Events of one workflow for one consumer running on an event loop.
+  '''
+
+  def __init__(self, bus: "WorkflowEventBus", workflow_id: int, loop: asyncio.AbstractEventLoop):
+    self._bus = bus
+    self.workflow_id = workflow_id
+    self._loop = loop
+    self._queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+
+  def _deliver(self, event: Dict[str, Any]) -> None:
+    # called from publishing threads
+    try:
+      self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+    except RuntimeError:
+      # the consumer's loop is gone
+      self.close()
+
+  async def get(self, timeout: float) -> Dict[str, Any]:
+    return await asyncio.wait_for(self._queue.get(), timeout)
+
+  def close(self) -> None:
+    self._bus.unsubscribe(self)
+
+
+class WorkflowEventBus:
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self._subscriptions: Dict[int, Set[Subscription]] = {}
+
+  def subscribe(self, workflow_id: int) -> Subscription:
+    subscription = Subscription(self, workflow_id, asyncio.get_running_loop())
+    with self._lock:
+      self._subscriptions.setdefault(workflow_id, set()).add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription: Subscription) -> None:
+    with self._lock:
+      subscriptions = self._subscriptions.get(subscription.workflow_id)
+      if subscriptions is not None:
+        subscriptions.discard(subscription)
+        if not subscriptions:
+          del self._subscriptions[subscription.workflow_id]
+
+  def publish(self, event: Dict[str, Any]) -> None:
+    with self._lock:
+      subscriptions = list(self._subscriptions.get(event["workflow_id"], ()))
+    for subscription in subscriptions:
+      subscription._deliver(event)
+
+
+class _PostgresNotifier(threading.Thread):
+  '''
+  Sends events with pg_notify from a background thread, batching whatever
+  queued up into one transaction, so generation threads never wait on it.
+  '''
+
+  def __init__(self, channel: str):
+    super().__init__(name="workflow-events-notify", daemon=True)
+    self.channel = channel
+    self._queue: queue.Queue[Dict[str, Any]] = queue.Queue()
+
+  def enqueue(self, event: Dict[str, Any]) -> None:
+    self._queue.put(event)
+
+  def flush(self, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while self._queue.unfinished_tasks and time.monotonic() < deadline:
+      time.sleep(0.01)
+
+  def run(self) -> None:
+    while True:
+      batch = [self._queue.get()]
+      while True:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      try:
+        with engine.begin() as conn:
+          for event in batch:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": json.dumps(event, default=str)},
+            )
+      except Exception:
+        logger.exception("Failed to publish %d workflow events", len(batch))
+      finally:
+        for _ in batch:
+          self._queue.task_done()
+
+
+class _PostgresListener(threading.Thread):
+  '''
+  LISTENs on the events channel and re-publishes to the local bus.
+  Reconnects after connection errors.
+  '''
+
+  RECONNECT_SECONDS = 2.0
+
+  def __init__(self, channel: str, bus: WorkflowEventBus):
+    super().__init__(name="workflow-events-listen", daemon=True)
+    self.channel = channel
+    self.bus = bus
+
+  def run(self) -> None:
+    while True:
+      try:
+        self._listen()
+      except Exception:
+        logger.exception("Workflow events listener failed; reconnecting")
+        time.sleep(self.RECONNECT_SECONDS)
+
+  def _listen(self) -> None:
+    raw = engine.raw_connection()
+    # a LISTEN connection is never handed back to the pool
+    raw.detach()
+    conn = raw.dbapi_connection
+    try:
+      conn.autocommit = True  # type: ignore[union-attr]
+      with conn.cursor() as cursor:  # type: ignore[union-attr]
+        cursor.execute(f'LISTEN "{self.channel}"')
+      while True:
+        if select.select([conn], [], [], 5.0) == ([], [], []):
+          continue
+        conn.poll()  # type: ignore[union-attr]
+        while conn.notifies:  # type: ignore[union-attr]
+          notify = conn.notifies.pop(0)  # type: ignore[union-attr]
+          try:
+            self.bus.publish(json.loads(notify.payload))
+          except Exception:
+            logger.exception("Dropping malformed workflow event")
+    finally:
+      conn.close()  # type: ignore[union-attr]
+
+
+_bus = WorkflowEventBus()
+_notifier: Optional[_PostgresNotifier] = None
+_listener: Optional[_PostgresListener] = None
+_threads_lock = threading.Lock()
+
+
+def _postgres_backend() -> bool:
+  return settings.WORKFLOW_EVENTS_BACKEND == "postgres"
+
+
+def _get_notifier() -> _PostgresNotifier:
+  global _notifier
+  with _threads_lock:
+    if _notifier is None:
+      _notifier = _PostgresNotifier(settings.WORKFLOW_EVENTS_CHANNEL)
+      _notifier.start()
+      # don't lose the final events of a worker that is shutting down
+      atexit.register(_notifier.flush)
+    return _notifier
+
+
+def _ensure_listener() -> None:
+  global _listener
+  with _threads_lock:
+    if _listener is None:
+      _listener = _PostgresListener(settings.WORKFLOW_EVENTS_CHANNEL, _bus)
+      _listener.start()
+
+
+def publish_workflow_event(event: Dict[str, Any]) -> None:
+  if _postgres_backend():
+    # delivered locally too, by this process' listener if it has one
+    _get_notifier().enqueue(event)
+  else:
+    _bus.publish(event)
+
+
+def subscribe_workflow_events(workflow_id: int) -> Subscription:
+  '''
+  Subscribe from a coroutine; close() the subscription when done.
+  '''
+  if _postgres_backend():
+    _ensure_listener()
+  return _bus.subscribe(workflow_id)
+
+
+class WorkflowProgress:
+  '''
+  Progress of one workflow run: counts per terminal stage and an ETA
+  extrapolated from the tasks finished so far. Every update is published
+  as an event. Thread-safe; used from both workflow engines.
+  '''
+
+  def __init__(self, workflow_id: int, total: int):
+    self.workflow_id = workflow_id
+    self.total = total
+    self.done = 0
+    self.failed = 0
+    self.deferred = 0
+    self._started = time.monotonic()
+    self._lock = threading.Lock()
+
+  def _counts(self) -> Dict[str, Any]:
+    finished = self.done + self.failed + self.deferred
+    eta = None
+    if finished:
+      elapsed = time.monotonic() - self._started
+      eta = round(elapsed / finished * (self.total - finished), 1)
+    return {
+        "counts": {
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "remaining": self.total - finished,
+        },
+        "eta_seconds": eta,
+    }
+
+  def _publish(self, event: str, **fields: Any) -> None:
+    payload = {
+        "workflow_id": self.workflow_id,
+        "event": event,
+        "at": datetime.utcnow().isoformat(),
+        **fields,
+    }
+    try:
+      publish_workflow_event(payload)
+    except Exception:
+      # progress reporting never fails a workflow
+      logger.exception("Failed to publish workflow event for workflow %s", self.workflow_id)
+
+  def planned(self) -> None:
+    with self._lock:
+      counts = self._counts()
+    self._publish("planned", stage=TaskStage.PLANNED.value, **counts)
+
+  def stage(
+      self,
+      stage: TaskStage,
+      product_id: int,
+      aspect_ratio: str,
+      error: Optional[BaseException] = None,
+      **extra: Any,
+  ) -> None:
+    with self._lock:
+      if stage == TaskStage.DONE:
+        self.done += 1
+      elif stage == TaskStage.FAILED:
+        self.failed += 1
+      elif stage == TaskStage.DEFERRED:
+        self.deferred += 1
+      counts = self._counts()
+    fields: Dict[str, Any] = {
+        "stage": stage.value,
+        "product_id": product_id,
+        "aspect_ratio": aspect_ratio,
+        **extra,
+        **counts,
+    }
+    if error is not None:
+      fields["error"] = f"{type(error).__name__}: {error}"[:_MAX_ERROR_LENGTH]
+    self._publish("task", **fields)
+
+  def retry_scheduled(self, retry_after: float, reason: str) -> None:
+    # the run ended with deferred tasks and the workflow is queued again;
+    # not a finished event, subscribers follow the retry as well
+    with self._lock:
+      counts = self._counts()
+    self._publish(
+        "deferred",
+        retry_after_seconds=round(retry_after, 1),
+        error=reason[:_MAX_ERROR_LENGTH],
+        **counts,
+    )
+
+  def finished(self, status: str, error: Optional[str] = None) -> None:
+    with self._lock:
+      counts = self._counts()
+    fields: Dict[str, Any] = {"status": status, **counts}
+    if error:
+      fields["error"] = error[:_MAX_ERROR_LENGTH]
+    self._publish("finished", **fields)
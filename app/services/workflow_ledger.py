@@ -0,0 +1,160 @@
+from __future__ import annotations
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, joinedload
+from app.models.workflow_batch import WorkflowBatchMember
+from app.models.workflow_task import WorkflowTask, WorkflowTaskStatus
+from app.services.planning import GenerationPlan
+
+logger = logging.getLogger(__name__)
+
+# error messages are kept on the task row, long tracebacks are cut
+_MAX_ERROR_LENGTH = 2000
+
+
+def has_tasks(db: Session, workflow_id: int) -> bool:
+  return db.query(
+      db.query(WorkflowTask).filter(WorkflowTask.workflow_id == workflow_id).exists()
+  ).scalar()
+
+
+def record_plan(db: Session, workflow_id: int, plan: GenerationPlan) -> None:
+  '''
+  One PENDING ledger row per planned (product, aspect ratio). Not committed.
+  '''
+  db.add_all([
+      WorkflowTask(
+          workflow_id=workflow_id,
+          product_id=task.product.id,
+          aspect_ratio=task.aspect_ratio,
+          reason=task.reason.value,
+          status=WorkflowTaskStatus.PENDING,
+          attempts=0,
+      )
+      for task in plan
+  ])
+
+
+def runnable_tasks(db: Session, workflow_id: int) -> List[WorkflowTask]:
+  '''
+  Tasks of the workflow that still need to run: pending, failed, deferred,
+  or left RUNNING by a worker that died.
+  '''
+  return (
+      db.query(WorkflowTask)
+      .options(joinedload(WorkflowTask.product))
+      .filter(
+          WorkflowTask.workflow_id == workflow_id,
+          WorkflowTask.status != WorkflowTaskStatus.COMPLETE,
+      )
+      .order_by(WorkflowTask.product_id, WorkflowTask.id)
+      .all()
+  )
+
+
+def group_by_product(tasks: List[WorkflowTask]) -> List[tuple[int, List[WorkflowTask]]]:
+  grouped: Dict[int, List[WorkflowTask]] = {}
+  for task in tasks:
+    grouped.setdefault(task.product_id, []).append(task)
+  return list(grouped.items())
+
+
+def start_task(db: Session, task_id: int) -> None:
+  db.execute(
+      update(WorkflowTask)
+      .where(WorkflowTask.id == task_id)
+      .values(
+          status=WorkflowTaskStatus.RUNNING,
+          attempts=WorkflowTask.attempts + 1,
+          started_at=func.now(),
+          finished_at=None,
+          error_message=None,
+      )
+  )
+
+
+def complete_task(db: Session, task_id: int, asset_id: Optional[int]) -> None:
+  db.execute(
+      update(WorkflowTask)
+      .where(WorkflowTask.id == task_id)
+      .values(
+          status=WorkflowTaskStatus.COMPLETE,
+          asset_id=asset_id,
+          finished_at=func.now(),
+      )
+  )
+
+
+def fail_task(db: Session, task_id: int, error: BaseException) -> None:
+  db.execute(
+      update(WorkflowTask)
+      .where(WorkflowTask.id == task_id)
+      .values(
+          status=WorkflowTaskStatus.FAILED,
+          error_message=f"{type(error).__name__}: {error}"[:_MAX_ERROR_LENGTH],
+          finished_at=func.now(),
+      )
+  )
+
+
+def defer_task(db: Session, task_id: int, error: BaseException) -> None:
+  db.execute(
+      update(WorkflowTask)
+      .where(WorkflowTask.id == task_id)
+      .values(
+          status=WorkflowTaskStatus.DEFERRED,
+          error_message=f"{type(error).__name__}: {error}"[:_MAX_ERROR_LENGTH],
+          finished_at=func.now(),
+      )
+  )
+
+
+def _status_counts(query) -> Dict[str, int]:
+  rows = query.group_by(WorkflowTask.status).all()
+  counts = Counter({WorkflowTaskStatus(status).name: count for status, count in rows})
+  return {status.name: counts.get(status.name, 0) for status in WorkflowTaskStatus}
+
+
+def task_counts(db: Session, workflow_id: int) -> Dict[str, int]:
+  return _status_counts(
+      db.query(WorkflowTask.status, func.count(WorkflowTask.id))
+      .filter(WorkflowTask.workflow_id == workflow_id)
+  )
+
+
+def batch_task_counts(db: Session, batch_id: int) -> Dict[str, int]:
+  '''
+  Task counts over all workflows of a batch; a workflow's tasks only show
+  up once it has been planned, i.e. claimed by a worker.
+  '''
+  return _status_counts(
+      db.query(WorkflowTask.status, func.count(WorkflowTask.id))
+      .join(WorkflowBatchMember, WorkflowBatchMember.workflow_id == WorkflowTask.workflow_id)
+      .filter(WorkflowBatchMember.batch_id == batch_id)
+  )
+
+
+def failure_summary(db: Session, workflow_id: int) -> Optional[str]:
+  '''
+  Workflow level error message: how many tasks failed and the first error.
+  '''
+  failed = (
+      db.query(WorkflowTask)
+      .filter(
+          WorkflowTask.workflow_id == workflow_id,
+          WorkflowTask.status == WorkflowTaskStatus.FAILED,
+      )
+      .order_by(WorkflowTask.id)
+      .all()
+  )
+  if not failed:
+    return None
+  total = db.query(func.count(WorkflowTask.id)).filter(
+      WorkflowTask.workflow_id == workflow_id).scalar()
+  first = failed[0]
+  return (
+      f"{len(failed)} of {total} tasks failed; first: product_id={first.product_id} "
+      f"ratio={first.aspect_ratio}: {first.error_message}"
+  )
@@ -1,62 +1,55 @@
 from __future__ import annotations
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
 from app.core.db import SessionLocal
 from app.models.asset import Asset, AssetType, AssetSource
 from app.models.brand import Brand
-from app.models.campaign import Campaign
-from app.models.campaign_product import CampaignProduct
+from app.models.campaign import Campaign, RenderMode
 from app.models.product import Product
-from app.models.workflow import Workflow, WorkflowStatus
+from app.models.workflow import Workflow, WorkflowPriority, WorkflowStatus
+from app.models.workflow_task import WorkflowTask
+from app.core.config import settings
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.derive import MASTER_ASPECT_RATIO, derive_aspect_ratio
+from app.services.generation_cache import (
+    CachedGeneration,
+    generation_cache_key,
+    get_generation_cache,
+)
+from app.services.planning import GenerationPlan, plan_campaign_generation
+from app.services.render_profiles import RenderSpec, fit_to_output, resolve_render_profile
 from app.services.storage import upload_bytes, get_object_key
-from app.services.image_generator import get_image_generator
+from app.services.hedging import HedgeBudget
+from app.services.image_hash import hash_columns
+from app.services.image_generator import ImageGenerator, ImageResult, get_image_generator, image_models
+from app.services.job_queue import defer_workflow
+from app.services.localization import localize_campaign
+from app.services.pipeline import BatchStage, Stage
+from app.services.references import reference_images, reference_keys
+from app.services.renditions import RenditionImage, copy_renditions, make_renditions, rendition_rows
+from app.services.scheduling import Flow
+from app.services.stage_timings import StageTimer, summarize
+from app.services.workflow_events import TaskStage, WorkflowProgress
+from app.services.workflow_ledger import (
+    complete_task,
+    defer_task,
+    fail_task,
+    failure_summary,
+    group_by_product,
+    has_tasks,
+    record_plan,
+    runnable_tasks,
+    start_task,
+)
 from app.services.text_generator import TextGenerator, get_text_generator
 
 logger = logging.getLogger(__name__)
 
-# hardcode some requirements here for now
-REQUIRED_ASPECT_RATIOS = ["1:1", "9:16", "16:9"]
-
-# hardcode this here for now
-TARGET_REGION_LANGUAGE_MAP = {
-  "FR": "french",
-}
-
-
-def _build_campaign_message_localization_prompt(brand, campaign, language) -> str:
-  brand_tone_of_voice = getattr(brand, "tone_of_voice", "")
-  campaign_message = getattr(campaign, "campaign_message", "")
-  campaign_target_audience = getattr(campaign, "target_audience", "")
-
-  return f"""
-    Instruction:
-    You will receive:
-      - A short caption written in English.
-      - A description of the brand's tone of voice.
-      - Information about the target audience.
-      - The target language for localization.
-
-    Task:
-    Rewrite (localize) the caption into the target language so that:
-      - The meaning is preserved, not translated word-for-word.
-      - The brand tone is fully maintained (e.g., playful, premium, minimal, energetic, friendly, luxury, etc.).
-      - The phrasing feels natural and culturally appropriate for the target audience.
-      - The result reads like a native-quality marketing caption, not a direct translation.
-      - Keep it short, punchy, and suitable for social media.
-
-    Output:
-      - Only output the final localized caption — no explanations.
-
-    Inputs:
-      - Original caption: {campaign_message}
-      - Brand tone: {brand_tone_of_voice}
-      - Target audience: {campaign_target_audience}
-      - Target language: {language}
-  """
-
 def _build_image_prompt(
     brand: Brand,
     campaign: Campaign,
@@ -148,170 +141,760 @@ def _build_image_prompt(
 
 def _determine_image_generation_tasks(
     db: Session,
-    campaign: Campaign
-) -> List[tuple[Product, str]]:
+    campaign: Campaign,
+    profile: RenderSpec,
+    force: bool = False,
+) -> GenerationPlan:
   '''
   Tasks determination:
     - each product has assets for each aspect ratio
-    - required aspect ratios hardcoded as REQUIRED_ASPECT_RATIOS above
+    - the aspect ratios are those of the campaign's render profile
   '''
-  tasks: List[tuple[Product, str]] = []
-
-  products = (
-      db.query(Product)
-      .join(CampaignProduct, CampaignProduct.product_id == Product.id)
-      .filter(CampaignProduct.campaign_id == campaign.id)
-      .all()
+  return plan_campaign_generation(
+      db,
+      campaign,
+      profile=profile,
+      force=force,
   )
 
-  for product in products:
-    for ratio in REQUIRED_ASPECT_RATIOS:
-      existing = (
-          db.query(Asset)
-          .filter(
-              Asset.campaign_id == campaign.id,
-              Asset.product_id == product.id,
-              Asset.aspect_ratio == ratio,
-              Asset.type == AssetType.CREATIVE,
-          )
-          .first()
-      )
-      if not existing:
-        tasks.append((product, ratio))
+def _prepare_workflow_tasks(
+    db: Session,
+    workflow_run_id: int,
+    campaign: Campaign,
+    force: bool = False,
+    profile: Optional[RenderSpec] = None,
+) -> List[WorkflowTask]:
+  '''
+  Tasks to run for this attempt. The first attempt plans the campaign
+  (every creative when force is set) and records the plan in the
+  workflow_tasks ledger; later attempts (resume, or a re-claim after a
+  worker died) only pick up the tasks that are not COMPLETE, without
+  re-planning.
+  '''
+  if has_tasks(db, workflow_run_id):
+    tasks = runnable_tasks(db, workflow_run_id)
+    logger.info(
+        "Resuming workflow_id=%s campaign_id=%s with %d remaining asset tasks",
+        workflow_run_id,
+        campaign.id,
+        len(tasks),
+    )
+    return tasks
 
-  return tasks
+  plan = _determine_image_generation_tasks(
+      db=db,
+      campaign=campaign,
+      profile=profile or resolve_render_profile(campaign),
+      force=force,
+  )
+  logger.info(
+      "Planned %d asset tasks for workflow_id=%s campaign_id=%s (%d up to date)",
+      len(plan),
+      workflow_run_id,
+      campaign.id,
+      plan.up_to_date,
+  )
+  record_plan(db, workflow_run_id, plan)
+  db.commit()
+  return runnable_tasks(db, workflow_run_id)
 
-def _localize_campaign_message(
-    db: Session,
+def _generate_creative_prompt(
+    workflow_run_id: int,
     text_generator: TextGenerator,
     brand: Brand,
-    campaign: Campaign
-) -> None:
-    target_region = campaign.target_region
-    if target_region == "US":
-      return
+    campaign: Campaign,
+    product: Product,
+) -> str:
+  # prompt llm for creative input prompt
+  text_prompt = _build_image_prompt(brand, campaign, product)
 
-    localization_result = ""
-    language = TARGET_REGION_LANGUAGE_MAP.get(target_region, None)
+  logger.info(
+    "Generating text prompt: workflow_id=%s campaign_id=%s product_id=%s prompt=%s",
+    workflow_run_id,
+    campaign.id,
+    product.id,
+    text_prompt,
+  )
 
-    if language is not None:
-      localization_prompt = _build_campaign_message_localization_prompt(brand, campaign, language)
+  text_result = text_generator.generate(prompt=text_prompt)
+  if not text_result or not getattr(text_result, "content", None):
+    raise RuntimeError("Text generator failed to return content.")
 
-      logger.info(
-          "Generating text prompt to localize campaign message: brand_id=%s campaign_id=%s prompt=%s",
-          brand.id,
-          campaign.id,
-          localization_prompt,
-      )
+  return text_result.content
 
-      localization_result = text_generator.generate(prompt=localization_prompt)
+def _asset_cache_key(
+    brand: Brand,
+    campaign: Campaign,
+    product: Product,
+    model: str,
+    aspect_ratio: str,
+    profile: RenderSpec,
+    references: Sequence[str] = (),
+) -> str:
+  # the creative prompt is llm output and differs run to run, so the
+  # cache is keyed on the deterministic brief it is generated from (and
+  # the product's reference images)
+  return generation_cache_key(
+    prompt=_build_image_prompt(brand, campaign, product),
+    model=model,
+    aspect_ratio=aspect_ratio,
+    size=profile.output(aspect_ratio).size,
+    output_format=profile.output_format.name,
+    encoding=profile.encoding.cache_key_part(),
+    references=references,
+  )
 
-    # add localized message to campaign
-    if localization_result and localization_result.content:
-      campaign.localized_campaign_message = localization_result.content
+def _derived_cache_model(model: str) -> str:
+  # a derived variant is not the same image as a direct render at its ratio
+  return f"{model}+derive:{MASTER_ASPECT_RATIO}"
 
-def _generate_single_asset(
-    workflow_run_id: int,
-    campaign_id: int,
-    product_id: int,
+def _creative_cache_key(
+    brand: Brand,
+    campaign: Campaign,
+    product: Product,
+    model: str,
     aspect_ratio: str,
-) -> None:
-  """
-  Generate one asset: prompt text, generate image, upload to S3, create Asset row.
-  Runs in its own thread with its own DB session.
-  """
-  with SessionLocal() as db:
-    try:
-      campaign = db.get(Campaign, campaign_id)
-      if not campaign:
-        raise ValueError(f"Campaign {campaign_id} not found")
+    profile: RenderSpec,
+    render_mode: RenderMode,
+    references: Sequence[str] = (),
+) -> str:
+  derived = render_mode == RenderMode.MASTER_DERIVE and aspect_ratio != MASTER_ASPECT_RATIO
+  return _asset_cache_key(
+    brand, campaign, product, _derived_cache_model(model) if derived else model, aspect_ratio, profile, references
+  )
+
+def _cached_variant(
+    db: Session,
+    cache,
+    brand: Brand,
+    campaign: Campaign,
+    product: Product,
+    aspect_ratio: str,
+    profile: RenderSpec,
+    cache_key: str,
+    references: Sequence[str] = (),
+) -> Optional[CachedGeneration]:
+  # fallback tier while every image model's circuit is open: the same
+  # brief at the same output, rendered by any of the models, directly or
+  # derived from a master
+  for model in image_models():
+    for variant in (model, _derived_cache_model(model)):
+      key = _asset_cache_key(brand, campaign, product, variant, aspect_ratio, profile, references)
+      if key == cache_key:
+        continue
+      cached = cache.lookup(db, key)
+      if cached is not None:
+        return cached
+  return None
+
+def _derived_image(master: ImageResult, aspect_ratio: str, brand: Brand) -> ImageResult:
+  if aspect_ratio == MASTER_ASPECT_RATIO:
+    return master
+  content, width, height = derive_aspect_ratio(
+    master.content, aspect_ratio, getattr(brand, "primary_color_hex", None)
+  )
+  return ImageResult(
+    content=content,
+    width=width,
+    height=height,
+    model_name=master.model_name,
+    fallback_model=master.fallback_model,
+  )
+
+def _cached_asset(
+    campaign: Campaign,
+    product: Product,
+    aspect_ratio: str,
+    cached: CachedGeneration,
+    cache_key: str,
+    render_mode: RenderMode = RenderMode.PER_RATIO,
+    timings: Optional[StageTimer] = None,
+    fallback: Optional[str] = None,
+) -> Asset:
+  # new row for this campaign/product pointing at the already stored object
+  gen_metadata = {
+    "prompt": cached.prompt,
+    "model_name": cached.model_name,
+    "generated_at": datetime.utcnow().isoformat(),
+    "render_mode": render_mode.name,
+    "cache_hit": True,
+    "cache_key": cache_key,
+    "source_asset_id": cached.asset_id,
+  }
+  if fallback:
+    gen_metadata["fallback"] = fallback
+  if timings is not None:
+    gen_metadata["timings_ms"] = timings.as_metadata()
+  return Asset(
+    campaign_id=campaign.id,
+    product_id=product.id,
+    type=AssetType.CREATIVE,
+    aspect_ratio=aspect_ratio,
+    width=cached.width,
+    height=cached.height,
+    s3_key=cached.s3_key,
+    source=AssetSource.GENERATED,
+    gen_metadata_json=gen_metadata,
+    **hash_columns(cached.image_hash),
+  )
+
+def _generated_asset(
+    campaign: Campaign,
+    product: Product,
+    aspect_ratio: str,
+    key: str,
+    creative_prompt: str,
+    image_result: ImageResult,
+    cache_key: str,
+    render_mode: RenderMode = RenderMode.PER_RATIO,
+    timings: Optional[StageTimer] = None,
+) -> Asset:
+  gen_metadata = {
+    "prompt": creative_prompt,
+    "model_name": image_result.model_name,
+    "generated_at": datetime.utcnow().isoformat(),
+    "render_mode": render_mode.name,
+  }
+  if image_result.fallback_model:
+    gen_metadata["fallback"] = image_result.fallback_model
+  if render_mode == RenderMode.MASTER_DERIVE and aspect_ratio != MASTER_ASPECT_RATIO:
+    gen_metadata["derived_from"] = MASTER_ASPECT_RATIO
+  if timings is not None:
+    # up to the write of this row; the commit itself is only in the
+    # workflow's stage_timings_json
+    gen_metadata["timings_ms"] = timings.as_metadata()
+  return Asset(
+    campaign_id=campaign.id,
+    product_id=product.id,
+    type=AssetType.CREATIVE,
+    aspect_ratio=aspect_ratio,
+    width=image_result.width,
+    height=image_result.height,
+    s3_key=key,
+    source=AssetSource.GENERATED,
+    gen_metadata_json=gen_metadata,
+    cache_key=cache_key,
+    **hash_columns(image_result.image_hash),
+  )
+
+def _cache_entry(asset: Asset, creative_prompt: str, image_result: ImageResult) -> CachedGeneration:
+  return CachedGeneration(
+    asset_id=asset.id,
+    s3_key=asset.s3_key,
+    width=asset.width,
+    height=asset.height,
+    model_name=image_result.model_name,
+    prompt=creative_prompt,
+    image_hash=image_result.image_hash,
+  )
+
+def _record_task_failures(db: Session, task_ids: List[int], error: BaseException) -> None:
+  # best effort: the workflow still fails if the ledger can't be written;
+  # tasks refused by an open circuit are deferred, not failed
+  record = defer_task if isinstance(error, CircuitOpenError) else fail_task
+  try:
+    for task_id in task_ids:
+      record(db, task_id, error)
+    db.commit()
+  except Exception:
+    logger.exception("Failed to record failure of workflow tasks %s", task_ids)
+    db.rollback()
+
+
+@dataclass
+class _WorkflowRun:
+  '''
+  One workflow going through the pipeline. Campaign, brand and products are
+  loaded up front and only read by the stages.
+  '''
+  workflow_run_id: int
+  campaign: Campaign
+  brand: Brand
+  render_mode: RenderMode
+  profile: RenderSpec
+  progress: WorkflowProgress
+  use_cache: bool
+  text_generator: TextGenerator
+  image_generator: ImageGenerator
+  jobs: List[_ProductJob] = field(default_factory=list)
+  errors: List[Exception] = field(default_factory=list)
+  # tasks (or localization) refused by an open circuit, retried later
+  deferred: List[CircuitOpenError] = field(default_factory=list)
+  # reference image keys per product id
+  references: Dict[int, Tuple[str, ...]] = field(default_factory=dict)
+  # of the assets written, for the workflow's stage_timings_json
+  timers: List[StageTimer] = field(default_factory=list)
+
+
+@dataclass
+class _ProductJob:
+  '''
+  The asset tasks of one product, keyed by aspect ratio. The creative
+  prompt does not depend on the ratio, so it is produced once per job.
+  '''
+  run: _WorkflowRun
+  product: Product
+  task_ids: Dict[str, int]
+  timer: StageTimer = field(default_factory=StageTimer)
+  cache_keys: Dict[str, str] = field(default_factory=dict)
+  # ratios that missed the cache, set once the lookups are done
+  pending: Optional[List[str]] = None
+  # cache keys this job renders for other jobs waiting on the same creative
+  leads: set[str] = field(default_factory=set)
+  creative_prompt: str = ""
+  # prepared reference images, fetched once the job has something to render
+  reference_images: List[bytes] = field(default_factory=list)
+
+  @property
+  def references(self) -> Tuple[str, ...]:
+    return self.run.references.get(self.product.id, ())
 
-      brand = db.get(Brand, campaign.brand_id)
-      if not brand:
-        raise ValueError(
-          f"Brand {campaign.brand_id} not found for campaign {campaign_id}"
-        )
 
-      product = db.get(Product, product_id)
-      if not product:
-        raise ValueError(f"Product {product_id} not found")
+@dataclass
+class _Render:
+  job: _ProductJob
+  # the ratio sent to the model, and the ratios made from its image
+  # (only itself, unless master + derive)
+  aspect_ratio: str
+  aspect_ratios: List[str]
+  timer: StageTimer
 
-      # thread safe generators
-      text_generator = get_text_generator()
-      image_generator = get_image_generator()
 
-      # prompt llm for creative input prompt
-      text_prompt = _build_image_prompt(brand, campaign, product)
+@dataclass
+class _Creative:
+  job: _ProductJob
+  aspect_ratio: str
+  timer: StageTimer
+  image: Optional[ImageResult] = None
+  cached: Optional[CachedGeneration] = None
+  key: str = ""
+  renditions: List[RenditionImage] = field(default_factory=list)
+  # "cached_variant" when served from the cache with every model unavailable
+  fallback: Optional[str] = None
 
+
+class _AssetPipeline:
+  '''
+  Asset tasks of one or more workflows run as a pipeline of stages, each
+  with its own thread pool and a bounded queue in front of it:
+
+    prompt   ledger start, cache lookups, creative prompt per product
+    render   image model call (plus local derivation in master + derive)
+    encode   fit to the profile's size and encode, in the encoding processes
+    upload   S3 puts
+    renditions  smaller sizes and formats, encoded and put to S3
+    persist  Asset and rendition rows and ledger completions, many per
+             transaction
+
+  so the image model is kept busy while earlier creatives are still being
+  uploaded and written, instead of every task holding a thread through all
+  six steps. Localization runs as one more stage next to them.
+
+  A creative that another job of the pipeline is already rendering (same
+  cache key, e.g. a product shared by campaigns with the same brief) is not
+  rendered again: it waits for that job and is written as a cache hit.
+  '''
+
+  def __init__(self, runs: List[_WorkflowRun]):
+    self.runs = runs
+    self.cache = get_generation_cache()
+    # cache key being rendered -> creatives of other jobs waiting on it
+    self._followers: Dict[str, List[_Creative]] = {}
+    self._followers_lock = threading.Lock()
+
+    capacity = settings.PIPELINE_QUEUE_SIZE
+    self.localize = Stage(
+      "localize", min(len(runs), settings.PIPELINE_PROMPT_WORKERS), self._localize, self._localize_failed, len(runs)
+    )
+    self.prompt = Stage("prompt", settings.PIPELINE_PROMPT_WORKERS, self._prompt, self._job_failed, capacity)
+    self.render = Stage("render", settings.GENERATION_MAX_WORKERS, self._render, self._render_failed, capacity)
+    # waits on the encoding processes, more threads would only queue there
+    self.encode = Stage(
+      "encode", max(1, settings.ENCODING_PROCESSES), self._encode, self._creative_failed, capacity
+    )
+    self.upload = Stage("upload", settings.PIPELINE_UPLOAD_WORKERS, self._upload, self._creative_failed, capacity)
+    self.renditions = Stage(
+      "renditions", max(1, settings.ENCODING_PROCESSES), self._renditions, self._creative_failed, capacity
+    )
+    self.persist = BatchStage(
+      "persist", 1, self._persist, self._creative_failed, capacity, settings.PIPELINE_PERSIST_BATCH_SIZE
+    )
+    # upstream to downstream; each is closed only after the ones feeding it
+    self.stages: List[Stage] = [
+      self.prompt, self.render, self.encode, self.upload, self.renditions, self.persist, self.localize
+    ]
+
+  def run(self) -> None:
+    for stage in self.stages:
+      stage.start()
+    for run in self.runs:
+      self.localize.put(run)
+    for run in self.runs:
+      for job in run.jobs:
+        self._send(self.prompt, job)
+    for stage in self.stages:
+      stage.close()
+    logger.info(
+      "Pipeline of workflow_ids=%s done: %s",
+      [run.workflow_run_id for run in self.runs],
+      ", ".join(
+        f"{stage.name} {stage.processed} items {stage.utilization():.0%} busy"
+        for stage in self.stages
+      ),
+    )
+
+  def _send(self, stage: Stage, item: _ProductJob | _Render | _Creative) -> None:
+    item.timer.queued()
+    stage.put(item)
+
+  def _follow(self, job: _ProductJob, ratios: List[str]) -> List[str]:
+    '''
+    Registers the job as the renderer of the given ratios' creatives, or as
+    a follower of the job already rendering one. Returns the ratios the job
+    has to render itself.
+    '''
+    render: List[str] = []
+    with self._followers_lock:
+      for ratio in ratios:
+        key = job.cache_keys[ratio]
+        if key not in self._followers:
+          self._followers[key] = []
+          job.leads.add(key)
+          render.append(ratio)
+        elif job.run.use_cache:
+          creative = _Creative(job, ratio, job.timer.copy())
+          creative.timer.queued()
+          self._followers[key].append(creative)
+        else:
+          # bypassing the cache, so not taking another job's image either
+          render.append(ratio)
+    return render
+
+  def _release(self, job: _ProductJob, ratio: str) -> List[_Creative]:
+    key = job.cache_keys.get(ratio)
+    if key is None or key not in job.leads:
+      return []
+    with self._followers_lock:
+      job.leads.discard(key)
+      return self._followers.pop(key, [])
+
+  # --- stages ---------------------------------------------------------------
+
+  def _localize(self, run: _WorkflowRun) -> None:
+    with SessionLocal() as db:
+      campaign = db.get(Campaign, run.campaign.id)
+      if campaign is None:
+        raise ValueError(f"Campaign {run.campaign.id} not found")
+      brand = db.get(Brand, campaign.brand_id)
+      localize_campaign(db, run.text_generator, brand, campaign)
+
+  def _prompt(self, job: _ProductJob) -> None:
+    run, product = job.run, job.product
+    hits: Dict[str, CachedGeneration] = {}
+    job.timer.dequeued()
+    with job.timer.time("db_commit"), SessionLocal() as db:
+      for task_id in job.task_ids.values():
+        start_task(db, task_id)
+      db.commit()
+      for ratio in job.task_ids:
+        job.cache_keys[ratio] = _creative_cache_key(
+          run.brand,
+          run.campaign,
+          product,
+          run.image_generator.model,
+          ratio,
+          run.profile,
+          run.render_mode,
+          job.references,
+        )
+        cached = self.cache.lookup(db, job.cache_keys[ratio]) if run.use_cache else None
+        if cached is not None:
+          hits[ratio] = cached
+    job.pending = self._follow(job, [ratio for ratio in job.task_ids if ratio not in hits])
+
+    for ratio, cached in hits.items():
       logger.info(
-        "Generating text prompt: workflow_id=%s campaign_id=%s product_id=%s ratio=%s prompt=%s",
-        workflow_run_id,
-        campaign.id,
+        "Generation cache hit: workflow_id=%s campaign_id=%s product_id=%s ratio=%s source_asset_id=%s",
+        run.workflow_run_id,
+        run.campaign.id,
         product.id,
-        aspect_ratio,
-        text_prompt,
+        ratio,
+        cached.asset_id,
       )
+      self._send(self.persist, _Creative(job, ratio, job.timer.copy(), cached=cached))
+    if not job.pending:
+      return
 
-      text_result = text_generator.generate(prompt=text_prompt)
-      if not text_result or not getattr(text_result, "content", None):
-        raise RuntimeError("Text generator failed to return content.")
-
-      # generate image
-      final_image_result = image_generator.generate(
-        prompt=text_result.content,
-        aspect_ratio=aspect_ratio,
+    for ratio in job.pending:
+      run.progress.stage(TaskStage.PROMPTING, product.id, ratio)
+    with job.timer.time("prompt"):
+      job.creative_prompt = _generate_creative_prompt(
+        run.workflow_run_id, run.text_generator, run.brand, run.campaign, product
       )
-      if not final_image_result or final_image_result.content is None:
+    if job.references:
+      with job.timer.time("references"):
+        job.reference_images = reference_images(job.references)
+
+    if run.render_mode == RenderMode.MASTER_DERIVE:
+      # one model call per product, every other ratio derived from it
+      self._send(self.render, _Render(job, MASTER_ASPECT_RATIO, list(job.pending), job.timer.copy()))
+    else:
+      for ratio in job.pending:
+        self._send(self.render, _Render(job, ratio, [ratio], job.timer.copy()))
+
+  def _render(self, render: _Render) -> None:
+    job = render.job
+    run = job.run
+    render.timer.dequeued()
+    for ratio in render.aspect_ratios:
+      run.progress.stage(TaskStage.RENDERING, job.product.id, ratio)
+    derive = run.render_mode == RenderMode.MASTER_DERIVE
+    try:
+      with render.timer.time("render"):
+        image = run.image_generator.generate(
+          prompt=job.creative_prompt,
+          aspect_ratio=render.aspect_ratio,
+          images=job.reference_images or None,
+          size=run.profile.master_size() if derive else run.profile.output(render.aspect_ratio).size,
+        )
+    except CircuitOpenError as e:
+      self._serve_variants(render, e)
+      return
+    with render.timer.time("render"):
+      if not image or image.content is None:
         raise RuntimeError("Image generator returned no content.")
+      if derive:
+        images = {ratio: _derived_image(image, ratio, run.brand) for ratio in render.aspect_ratios}
+      else:
+        images = {render.aspect_ratio: image}
+    for ratio, ratio_image in images.items():
+      self._send(self.encode, _Creative(job, ratio, render.timer.copy(), image=ratio_image))
 
-      key = get_object_key(campaign.id, product.id, aspect_ratio)
+  def _serve_variants(self, render: _Render, error: CircuitOpenError) -> None:
+    '''
+    Every image model tier is unavailable: creatives of the same brief
+    another model rendered are written as cache hits, the rest deferred.
+    '''
+    job = render.job
+    run = job.run
+    variants: Dict[str, CachedGeneration] = {}
+    if run.use_cache and settings.FALLBACK_CACHED_VARIANTS:
+      with SessionLocal() as db:
+        for ratio in render.aspect_ratios:
+          cached = _cached_variant(
+            db,
+            self.cache,
+            run.brand,
+            run.campaign,
+            job.product,
+            ratio,
+            run.profile,
+            job.cache_keys[ratio],
+            job.references,
+          )
+          if cached is not None:
+            variants[ratio] = cached
+    for ratio, cached in variants.items():
+      self._send(
+        self.persist,
+        _Creative(job, ratio, render.timer.copy(), cached=cached, fallback="cached_variant"),
+      )
+    deferred = [ratio for ratio in render.aspect_ratios if ratio not in variants]
+    if deferred:
+      self._fail(job, deferred, error)
+
+  def _encode(self, creative: _Creative) -> None:
+    run = creative.job.run
+    creative.timer.dequeued()
+    with creative.timer.time("encode"):
+      creative.image = fit_to_output(creative.image, run.profile.output(creative.aspect_ratio), run.profile)
+    self._send(self.upload, creative)
 
-      # upload to s3
+  def _upload(self, creative: _Creative) -> None:
+    job = creative.job
+    creative.timer.dequeued()
+    job.run.progress.stage(TaskStage.UPLOADING, job.product.id, creative.aspect_ratio)
+    creative.key = get_object_key(
+      job.run.campaign.id, job.product.id, creative.aspect_ratio, job.run.profile.extension
+    )
+    with creative.timer.time("upload"):
       upload_bytes(
-        data=final_image_result.content,
-        key=key,
-        content_type="image/png",
+        data=creative.image.content,
+        key=creative.key,
+        content_type=creative.image.content_type,
       )
+    self._send(self.renditions, creative)
 
-      # write to db
-      asset = Asset(
-        campaign_id=campaign.id,
-        product_id=product.id,
-        type=AssetType.CREATIVE,
-        aspect_ratio=aspect_ratio,
-        width=final_image_result.width,
-        height=final_image_result.height,
-        s3_key=key,
-        source=AssetSource.GENERATED,
-        gen_metadata_json={
-          "prompt": text_result.content,
-          "model_name": final_image_result.model_name,
-          "generated_at": datetime.utcnow().isoformat(),
-        },
+  def _renditions(self, creative: _Creative) -> None:
+    creative.timer.dequeued()
+    with creative.timer.time("renditions"):
+      creative.renditions = make_renditions(creative.image.content, creative.key, creative.image.content_type)
+    self._send(self.persist, creative)
+
+  def _asset(self, creative: _Creative) -> Asset:
+    job = creative.job
+    run = job.run
+    cache_key = job.cache_keys[creative.aspect_ratio]
+    if creative.cached is not None:
+      return _cached_asset(
+        run.campaign,
+        job.product,
+        creative.aspect_ratio,
+        creative.cached,
+        cache_key,
+        run.render_mode,
+        creative.timer,
+        creative.fallback,
+      )
+    if creative.image.fallback_model:
+      # cached as the fallback model's creative, not the primary's
+      cache_key = _creative_cache_key(
+        run.brand,
+        run.campaign,
+        job.product,
+        creative.image.fallback_model,
+        creative.aspect_ratio,
+        run.profile,
+        run.render_mode,
+        job.references,
       )
-      db.add(asset)
+    return _generated_asset(
+      run.campaign,
+      job.product,
+      creative.aspect_ratio,
+      creative.key,
+      job.creative_prompt,
+      creative.image,
+      cache_key,
+      run.render_mode,
+      creative.timer,
+    )
+
+  def _write(self, creatives: List[_Creative]) -> Dict[str, CachedGeneration]:
+    # returns the cache entries of the creatives rendered here
+    for creative in creatives:
+      creative.timer.dequeued()
+    started = time.monotonic()
+    with SessionLocal() as db:
+      assets = [self._asset(creative) for creative in creatives]
+      db.add_all(assets)
+      db.flush()
+      served_from: Dict[int, List[int]] = {}
+      for creative, asset in zip(creatives, assets):
+        if creative.cached is not None:
+          served_from.setdefault(creative.cached.asset_id, []).append(asset.id)
+        else:
+          db.add_all(rendition_rows(asset.id, creative.renditions))
+        complete_task(db, creative.job.task_ids[creative.aspect_ratio], asset.id)
+      copy_renditions(db, served_from)
       db.commit()
+      entries = {
+        creative.job.cache_keys[creative.aspect_ratio]: _cache_entry(
+          asset, creative.job.creative_prompt, creative.image
+        )
+        for creative, asset in zip(creatives, assets)
+        if creative.cached is None
+      }
+      # under the key of the model that rendered it
+      stored = {
+        asset.cache_key: entries[creative.job.cache_keys[creative.aspect_ratio]]
+        for creative, asset in zip(creatives, assets)
+        if creative.cached is None and asset.cache_key
+      }
+    elapsed = time.monotonic() - started
+    for creative in creatives:
+      creative.timer.add("db_commit", elapsed)
+      creative.job.run.timers.append(creative.timer)
+      creative.job.run.progress.stage(
+        TaskStage.DONE,
+        creative.job.product.id,
+        creative.aspect_ratio,
+        cache_hit=creative.cached is not None,
+      )
+    for key, entry in stored.items():
+      self.cache.store(key, entry)
+    return entries
 
-    except Exception:
-      logger.exception(
-        "Error generating asset for workflow_id=%s campaign_id=%s product_id=%s ratio=%s",
-        workflow_run_id,
-        campaign_id,
-        product_id,
-        aspect_ratio,
+  def _persist(self, creatives: List[_Creative]) -> None:
+    entries = self._write(creatives)
+
+    # written, so a failure past here must not fail (or retry) them
+    followers: List[_Creative] = []
+    for creative in creatives:
+      for follower in self._release(creative.job, creative.aspect_ratio):
+        # a leader served from a cached variant hands on that variant
+        follower.cached = entries.get(creative.job.cache_keys[creative.aspect_ratio], creative.cached)
+        follower.fallback = creative.fallback
+        followers.append(follower)
+    for follower in followers:
+      try:
+        self._write([follower])
+      except Exception as e:
+        self._creative_failed(follower, e)
+
+  # --- failures -------------------------------------------------------------
+
+  def _fail(self, job: _ProductJob, aspect_ratios: List[str], error: Exception) -> None:
+    run = job.run
+    if isinstance(error, CircuitOpenError):
+      logger.warning(
+        "Deferring assets of workflow_id=%s campaign_id=%s product_id=%s ratios=%s: %s",
+        run.workflow_run_id,
+        run.campaign.id,
+        job.product.id,
+        aspect_ratios,
+        error,
       )
-      db.rollback()
-      # let the exception bubble up
-      raise
+      run.deferred.append(error)
+      stage = TaskStage.DEFERRED
+    else:
+      logger.error(
+        "Error generating assets for workflow_id=%s campaign_id=%s product_id=%s ratios=%s",
+        run.workflow_run_id,
+        run.campaign.id,
+        job.product.id,
+        aspect_ratios,
+        exc_info=error,
+      )
+      run.errors.append(error)
+      stage = TaskStage.FAILED
+    with SessionLocal() as db:
+      _record_task_failures(db, [job.task_ids[ratio] for ratio in aspect_ratios], error)
+    for ratio in aspect_ratios:
+      run.progress.stage(stage, job.product.id, ratio, error=error)
+      # jobs waiting on this creative fail with it
+      for follower in self._release(job, ratio):
+        self._fail(follower.job, [follower.aspect_ratio], error)
 
+  def _job_failed(self, job: _ProductJob, error: Exception) -> None:
+    # cache hits were already handed to the persist stage; creatives
+    # followed from other jobs fail when those do
+    self._fail(job, job.pending if job.pending is not None else list(job.task_ids), error)
 
-def run_campaign_generation(
-    workflow_run_id: int,
-    campaign_id: int,
-) -> None:
+  def _render_failed(self, render: _Render, error: Exception) -> None:
+    self._fail(render.job, render.aspect_ratios, error)
+
+  def _creative_failed(self, creative: _Creative, error: Exception) -> None:
+    self._fail(creative.job, [creative.aspect_ratio], error)
+
+  def _localize_failed(self, run: _WorkflowRun, error: Exception) -> None:
+    if isinstance(error, CircuitOpenError):
+      logger.warning("Deferring localization of workflow_id=%s: %s", run.workflow_run_id, error)
+      run.deferred.append(error)
+      return
+    logger.error(
+      "Error localizing campaign message for workflow_id=%s campaign_id=%s",
+      run.workflow_run_id,
+      run.campaign.id,
+      exc_info=error,
+    )
+    run.errors.append(error)
+
+
+def _prepare_run(workflow_run_id: int, campaign_id: int) -> Optional[_WorkflowRun]:
   '''
-    Orchestration of a creative generation workflow for a campaign.
-    Asset generation is spawned out to threads.
+  Mark the workflow RUNNING and plan it. On error the workflow is marked
+  FAILED and the error re-raised.
   '''
   with SessionLocal() as db:
     try:
@@ -319,39 +902,51 @@ def run_campaign_generation(
       workflow = db.get(Workflow, workflow_run_id)
       if not workflow:
         logger.error("Workflow %s not found; aborting generation.", workflow_run_id)
-        return
+        return None
       workflow.status = WorkflowStatus.RUNNING
       workflow.started_at = datetime.utcnow()
+      use_cache = settings.GENERATION_CACHE_ENABLED and not workflow.bypass_cache
       db.commit()
 
       campaign = db.get(Campaign, campaign_id)
       if not campaign:
         raise ValueError(f"Campaign {campaign_id} not found")
+      render_mode = RenderMode(campaign.render_mode)
+      profile = resolve_render_profile(campaign)
+      # model call slots are shared fairly between brands and priority classes
+      flow = Flow(campaign.brand_id, WorkflowPriority(workflow.priority))
 
       brand = db.get(Brand, campaign.brand_id)
       if not brand:
         raise ValueError(
             f"Brand {campaign.brand_id} not found for campaign {campaign_id}")
 
-      # localize campaign message
-      # TODO: add this as a spawned thread task
-      text_generator = get_text_generator()
-      _localize_campaign_message(db, text_generator, brand, campaign)
-
       # 4. Determine image generation tasks
-      image_tasks = _determine_image_generation_tasks(db=db, campaign=campaign)
+      image_tasks = _prepare_workflow_tasks(db, workflow_run_id, campaign, workflow.force, profile)
+      progress = WorkflowProgress(workflow_run_id, total=len(image_tasks))
+      progress.planned()
 
       if not image_tasks:
         logger.info(
             "No new assets to generate for campaign_id=%s (all variants exist).",
             campaign_id,
         )
-        workflow.status = WorkflowStatus.COMPLETE
-        workflow.finished_at = datetime.utcnow()
-        db.commit()
-        return
+
+      # the stages only read these, after this session is closed
+      db.refresh(campaign)
+      db.refresh(brand)
+      product_groups = group_by_product(image_tasks)
+      products = {
+        product.id: product
+        for product in db.query(Product).filter(Product.id.in_([pid for pid, _ in product_groups]))
+      }
+      missing = [pid for pid, _ in product_groups if pid not in products]
+      if missing:
+        raise ValueError(f"Products {missing} not found")
+      references = reference_keys(db, products)
     except Exception as e:
-      # error before threads are spawned
+      # error before the pipeline is started
+      WorkflowProgress(workflow_run_id, total=0).finished(WorkflowStatus.FAILED.name, str(e))
       logger.exception("Error preparing workflow %s", workflow_run_id)
       try:
         db.rollback()
@@ -365,50 +960,118 @@ def run_campaign_generation(
         db.rollback()
       raise
 
-  # spawn threads for each asset
-  errors: list[Exception] = []
-
-  max_workers = min(len(image_tasks), 6)
-
-  with ThreadPoolExecutor(max_workers=max_workers) as executor:
-    futures = []
-    for product, ratio in image_tasks:
-      futures.append(
-        executor.submit(
-          _generate_single_asset,
-          workflow_run_id=workflow_run_id,
-          campaign_id=campaign_id,
-          product_id=product.id,
-          aspect_ratio=ratio,
-        )
-      )
+  # bounds the duplicate image calls of this run
+  hedge_budget = HedgeBudget.for_tasks(
+    len(product_groups) if render_mode == RenderMode.MASTER_DERIVE else len(image_tasks)
+  )
+  run = _WorkflowRun(
+    workflow_run_id=workflow_run_id,
+    campaign=campaign,
+    brand=brand,
+    render_mode=render_mode,
+    profile=profile,
+    progress=progress,
+    use_cache=use_cache,
+    # thread safe generators, shared by the stage workers
+    text_generator=get_text_generator(flow),
+    image_generator=get_image_generator(hedge_budget=hedge_budget, flow=flow),
+    references=references,
+  )
+  run.jobs = [
+    _ProductJob(run, products[product_id], {task.aspect_ratio: task.id for task in product_tasks})
+    for product_id, product_tasks in product_groups
+  ]
+  return run
 
-    for future in as_completed(futures):
-      try:
-        future.result()
-      except Exception as e:
-        errors.append(e)
 
+def _deferral(workflow_run_id: int, deferred: Sequence[CircuitOpenError]) -> float:
+  # retried once the first of the open circuits is due to be probed
+  retry_after = min(error.retry_after for error in deferred)
+  logger.warning(
+    "Workflow %s has %d deferred items (model circuit open); retrying in %.0fs.",
+    workflow_run_id,
+    len(deferred),
+    retry_after,
+  )
+  return retry_after
+
+def _finish_run(run: _WorkflowRun) -> None:
   with SessionLocal() as db:
-    workflow = db.get(Workflow, workflow_run_id)
+    workflow = db.get(Workflow, run.workflow_run_id)
     if not workflow:
-      logger.error("Workflow %s not found when finalizing.", workflow_run_id)
+      logger.error("Workflow %s not found when finalizing.", run.workflow_run_id)
       return
 
-    if errors:
+    if run.errors:
       logger.error(
         "Workflow %s completed with %d asset errors; marking FAILED.",
-        workflow_run_id,
-        len(errors),
+        run.workflow_run_id,
+        len(run.errors),
       )
       workflow.status = WorkflowStatus.FAILED
-      workflow.error_message = str(errors[0])  # or aggregate
+      workflow.error_message = failure_summary(db, run.workflow_run_id) or str(run.errors[0])
+    elif run.deferred:
+      retry_after = _deferral(run.workflow_run_id, run.deferred)
+      defer_workflow(db, workflow, retry_after, str(run.deferred[0]))
+      workflow.stage_timings_json = summarize(run.timers)
+      db.commit()
+      run.progress.retry_scheduled(retry_after, workflow.error_message)
+      return
     else:
       workflow.status = WorkflowStatus.COMPLETE
+      # left by a deferred run
+      workflow.error_message = None
 
+    workflow.stage_timings_json = summarize(run.timers)
     workflow.finished_at = datetime.utcnow()
     db.commit()
-    
+    run.progress.finished(WorkflowStatus(workflow.status).name, workflow.error_message)
+
+
+def run_campaign_generation(
+    workflow_run_id: int,
+    campaign_id: int,
+) -> None:
+  '''
+    Orchestration of a creative generation workflow for a campaign.
+    Asset tasks run through the staged pipeline of _AssetPipeline.
+  '''
+  run = _prepare_run(workflow_run_id, campaign_id)
+  if run is None:
+    return
+  _AssetPipeline([run]).run()
+  _finish_run(run)
+
   # should we raise an error here if there are errors?
-  if errors:
-    raise RuntimeError(f"Workflow {workflow_run_id} failed; {len(errors)} asset errors")
\ No newline at end of file
+  if run.errors:
+    raise RuntimeError(f"Workflow {workflow_run_id} failed; {len(run.errors)} asset errors")
+
+
+def run_batch_generation(workflows: Sequence[Tuple[int, int]]) -> None:
+  '''
+  Several (workflow_id, campaign_id) runs, e.g. the workflows of one batch
+  claimed together by a worker: planned one after the other, then run
+  through one shared pipeline, so their model calls are packed onto the
+  same stages and a creative several campaigns need is rendered once.
+  '''
+  runs: List[_WorkflowRun] = []
+  failed: List[int] = []
+  for workflow_run_id, campaign_id in workflows:
+    try:
+      run = _prepare_run(workflow_run_id, campaign_id)
+    except Exception:
+      # already marked FAILED; the rest of the batch goes on
+      failed.append(workflow_run_id)
+      continue
+    if run is not None:
+      runs.append(run)
+
+  if runs:
+    _AssetPipeline(runs).run()
+  for run in runs:
+    _finish_run(run)
+    if run.errors:
+      failed.append(run.workflow_run_id)
+
+  if failed:
+    raise RuntimeError(f"Workflows {sorted(failed)} of the batch failed")
@@ -0,0 +1,248 @@
+'''
+Standalone generation worker.
+
+  python -m app.worker
+
+Polls the workflows table for queued generation work, claims it with
+SELECT ... FOR UPDATE SKIP LOCKED and runs it. Any number of worker
+processes can run against the same database; a workflow whose worker dies
+is re-claimed once its lease expires.
+'''
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Sequence, Set
+from app.core import logging as core_logging
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.models.workflow import WorkflowPriority
+from app.services.job_queue import (
+    ClaimedWorkflow,
+    claim_batch_workflows,
+    claim_next_workflow,
+    release_leases,
+    renew_leases,
+)
+from app.services.generator_profiles import save_recorded_profile
+from app.services.metrics import publish_worker_metrics
+from app.services.workflows import run_batch_generation, run_campaign_generation
+
+logger = logging.getLogger(__name__)
+
+
+class _Heartbeat(threading.Thread):
+  '''
+  Keeps the leases on claimed workflows alive while they are being processed.
+  '''
+
+  def __init__(self, workflow_ids: List[int], worker_id: str):
+    super().__init__(name=f"heartbeat-{workflow_ids[0]}", daemon=True)
+    self.workflow_ids = list(workflow_ids)
+    self.worker_id = worker_id
+    self._stopped = threading.Event()
+
+  def run(self) -> None:
+    while self.workflow_ids and not self._stopped.wait(settings.WORKFLOW_HEARTBEAT_SECONDS):
+      try:
+        with SessionLocal() as db:
+          owned = renew_leases(
+              db,
+              workflow_ids=self.workflow_ids,
+              worker_id=self.worker_id,
+              lease_seconds=settings.WORKFLOW_LEASE_SECONDS,
+          )
+        lost = [workflow_id for workflow_id in self.workflow_ids if workflow_id not in owned]
+        if lost:
+          logger.warning(
+              "Lost lease on workflows %s; another worker may re-run them.",
+              lost,
+          )
+          self.workflow_ids = owned
+      except Exception:
+        # a missed heartbeat is not fatal as long as the next one lands
+        # before the lease expires
+        logger.exception("Heartbeat failed for workflows %s", self.workflow_ids)
+
+  def stop(self) -> None:
+    self._stopped.set()
+
+
+class _MetricsReporter(threading.Thread):
+  '''
+  Periodically publishes this process' metrics (limiters etc.) so that
+  GET /metrics/generation on the API can aggregate them, and writes the
+  profile of its model calls to GENERATOR_RECORD_PATH.
+  '''
+
+  def __init__(self, worker_id: str):
+    super().__init__(name="metrics-reporter", daemon=True)
+    self.worker_id = worker_id
+    self._stopped = threading.Event()
+
+  def run(self) -> None:
+    while not self._stopped.wait(settings.WORKER_METRICS_INTERVAL_SECONDS):
+      try:
+        with SessionLocal() as db:
+          publish_worker_metrics(db, self.worker_id)
+      except Exception:
+        logger.exception("Failed to publish worker metrics")
+      self.save_profile()
+
+  def save_profile(self) -> None:
+    if not settings.GENERATOR_RECORD_PATH:
+      return
+    try:
+      save_recorded_profile(settings.GENERATOR_RECORD_PATH)
+    except Exception:
+      logger.exception("Failed to write generator profile to %s", settings.GENERATOR_RECORD_PATH)
+
+  def stop(self) -> None:
+    self._stopped.set()
+
+
+class Worker:
+  '''
+  Runs up to `concurrency` workflows of any priority, plus up to
+  `interactive_slots` more that only INTERACTIVE workflows may use, so
+  bulk work occupying every slot never holds up a small urgent run.
+  '''
+
+  def __init__(self, worker_id: str, concurrency: int, interactive_slots: int = 0):
+    self.worker_id = worker_id
+    self.concurrency = max(1, concurrency)
+    self.interactive_slots = max(0, interactive_slots)
+    self._stop = threading.Event()
+
+  def stop(self, *_args) -> None:
+    logger.info("Worker %s stopping after in-flight workflows finish", self.worker_id)
+    self._stop.set()
+
+  def _claim(
+      self,
+      priorities: Optional[Sequence[WorkflowPriority]] = None,
+  ) -> List[ClaimedWorkflow]:
+    '''
+    The next workflow, plus more queued workflows of its batch if it has one.
+    '''
+    with SessionLocal() as db:
+      claimed = claim_next_workflow(
+          db,
+          worker_id=self.worker_id,
+          lease_seconds=settings.WORKFLOW_LEASE_SECONDS,
+          max_attempts=settings.WORKFLOW_MAX_ATTEMPTS,
+          priorities=priorities,
+      )
+      if claimed is None:
+        return []
+      if claimed.batch_id is None:
+        return [claimed]
+      return [claimed] + claim_batch_workflows(
+          db,
+          batch_id=claimed.batch_id,
+          worker_id=self.worker_id,
+          lease_seconds=settings.WORKFLOW_LEASE_SECONDS,
+          limit=settings.WORKFLOW_BATCH_CLAIM_SIZE - 1,
+      )
+
+  def _process(self, claimed: List[ClaimedWorkflow]) -> None:
+    for workflow in claimed:
+      logger.info(
+          "Worker %s running workflow_id=%s campaign_id=%s attempt=%s priority=%s batch_id=%s",
+          self.worker_id,
+          workflow.workflow_id,
+          workflow.campaign_id,
+          workflow.attempt,
+          workflow.priority.name,
+          workflow.batch_id,
+      )
+    workflow_ids = [workflow.workflow_id for workflow in claimed]
+    heartbeat = _Heartbeat(workflow_ids, self.worker_id)
+    heartbeat.start()
+    try:
+      if settings.WORKFLOW_ENGINE == "asyncio":
+        from app.services.async_workflows import (
+            run_batch_generation_async,
+            run_campaign_generation_async,
+        )
+
+        # one event loop per claim, on this worker thread
+        if len(claimed) == 1:
+          asyncio.run(run_campaign_generation_async(
+              claimed[0].workflow_id, claimed[0].campaign_id))
+        else:
+          asyncio.run(run_batch_generation_async(
+              [(workflow.workflow_id, workflow.campaign_id) for workflow in claimed]))
+      elif len(claimed) == 1:
+        run_campaign_generation(claimed[0].workflow_id, claimed[0].campaign_id)
+      else:
+        run_batch_generation(
+            [(workflow.workflow_id, workflow.campaign_id) for workflow in claimed])
+    except Exception:
+      # the workflow rows already carry the failure
+      logger.exception("Workflows %s failed", workflow_ids)
+    finally:
+      heartbeat.stop()
+      try:
+        with SessionLocal() as db:
+          release_leases(db, workflow_ids, self.worker_id)
+      except Exception:
+        logger.exception("Failed to release leases on workflows %s", workflow_ids)
+
+  def run(self) -> None:
+    logger.info(
+        "Worker %s started (concurrency=%d, interactive slots=%d)",
+        self.worker_id,
+        self.concurrency,
+        self.interactive_slots,
+    )
+    running: Set[Future] = set()
+    reporter = _MetricsReporter(self.worker_id)
+    reporter.start()
+
+    with ThreadPoolExecutor(
+        max_workers=self.concurrency + self.interactive_slots,
+        thread_name_prefix="workflow",
+    ) as executor:
+      while not self._stop.is_set():
+        running = {f for f in running if not f.done()}
+
+        if len(running) < self.concurrency + self.interactive_slots:
+          # the slots past `concurrency` are reserved for interactive work
+          priorities = None if len(running) < self.concurrency else [WorkflowPriority.INTERACTIVE]
+          try:
+            claimed = self._claim(priorities)
+          except Exception:
+            logger.exception("Failed to claim work")
+            claimed = []
+
+          if claimed:
+            running.add(executor.submit(self._process, claimed))
+            # there may be more queued work, poll again right away
+            continue
+
+        self._stop.wait(settings.WORKER_POLL_INTERVAL_SECONDS)
+
+    reporter.stop()
+    reporter.save_profile()
+
+
+def main() -> None:
+  core_logging.configure_logging()
+
+  worker = Worker(
+      worker_id=f"{socket.gethostname()}:{os.getpid()}",
+      concurrency=settings.WORKER_CONCURRENCY,
+      interactive_slots=settings.WORKER_INTERACTIVE_SLOTS,
+  )
+  signal.signal(signal.SIGTERM, worker.stop)
+  signal.signal(signal.SIGINT, worker.stop)
+  worker.run()
+
+
+if __name__ == "__main__":
+  main()